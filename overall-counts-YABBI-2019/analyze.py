@@ -18,9 +18,12 @@ And generate:
 """
 
 # -------------------------------------------------------------------------------------------
+from sys import path; path.append("utils")
 from pymongo import MongoClient, errors
-from networkx import Graph, connected_components
-from itertools import groupby
+from itertools import islice
+from indexes import ensure_indexes, explain, uses_index, CODE_INDEXES
+from columnar import ParquetClient, count_orders, group_pairs
+from bridges import iter_bridges, classify_bridge, AROMATICS, BRIDGE_TYPES, ORDERED_TYPES
 
 # -------------------------------------------------------------------------------------------
 # manually input database and collection names
@@ -29,17 +32,67 @@ database = "ma"
 collection = "non_redundant_1095_ang_limit"  # "non_redundant_no_ang_limit"
 collection_pairs = "pairs_1095_ang_limit"  # "pairs_no_ang_limit"
 collection_bridges = "bridges_1095_ang_limit"  # "bridges_no_ang_limit"
+collection_state = "analysis_state"
+incremental = False  # only reprocess entries inserted since the last incremental run
+report_indexes = True  # print which index each analysis query uses
+server_side = True  # count bridges by EC in a MongoDB aggregation pipeline (requires MongoDB >= 4.2)
 
 
 # -------------------------------------------------------------------------------------------
+backend = "mongo"  # "parquet" reads the columnar store written by runner.py --export-parquet
+parquet_root = "parquet"
 mongoport = 27017
 mongohost = "localhost"
-client = MongoClient(mongohost, mongoport)
+if backend == "parquet":
+    client = ParquetClient(parquet_root)
+else:
+    client = MongoClient(mongohost, mongoport)
 
 
 # -------------------------------------------------------------------------------------------
 
 
+def report_index_usage(query_database, query_collection):
+    """
+    Function explains the queries run against the base collection and reports
+    whether each query reads from an index or scans the whole collection.
+
+    :param query_database: Database in which Met-aromatic pairs are located.
+    :param query_collection: Collection in which Met-aromatic pairs are located.
+    :return: Nothing. Function performs operation pass-by style.
+    """
+    commands = {
+        'distinct code': {'distinct': query_collection, 'key': 'code'},
+        'breakdowns by order': {
+            'aggregate': query_collection,
+            'pipeline': [
+                {'$sort': {'code': 1, 'arores': 1, 'met': 1}},
+                {'$group': {'_id': {'code': "$code", 'arores': "$arores", 'met': "$met"}, 'order': {'$sum': 1}}}
+            ],
+            'cursor': {}
+        },
+        'angular limit': {
+            'find': query_collection,
+            'filter': {'$or': [{'met-theta': {'$lte': 109.5}}, {'met-phi': {'$lte': 109.5}}]}
+        }
+    }
+
+    print(' -- Index usage: ')
+    for name, command in commands.items():
+        try:
+            stages = explain(client[query_database], command)
+        except errors.OperationFailure as pymongo_exception:
+            print(' -- {} | Could not explain query: {}'.format(name, pymongo_exception))
+            continue
+
+        if uses_index(stages):
+            names = sorted({index for _, index in stages if index is not None})
+            print(' -- {} | Index: {}'.format(name, ', '.join(names)))
+        else:
+            print(' -- {} | Collection scan'.format(name))
+    print()
+
+
 def count_entries(query_database, query_collection):
     """
     :param query_database: Database in which Met-aromatic pairs are located.
@@ -61,6 +114,13 @@ def breakdowns_by_order(query_database, query_collection):
     :return: Nothing. Function performs operation pass-by style.
     """
     query = [
+        {
+            '$sort': {  # walk the (code, arores, met) index instead of scanning the collection
+                'code': 1,
+                'arores': 1,
+                'met': 1
+            }
+        },
         {
             '$group': {
                 '_id': {
@@ -94,12 +154,15 @@ def breakdowns_by_order(query_database, query_collection):
     ]
 
     print(' -- Breakdowns by order: ')
-    cursor = client[query_database][query_collection].aggregate(query)
+    if backend == "parquet":
+        cursor = count_orders(client[query_database][query_collection])
+    else:
+        cursor = client[query_database][query_collection].aggregate(query)
     for entry in cursor:
         print(' -- Order: {} | Count: {}'.format(entry.get('_id'), entry.get('count')))
 
 
-def get_pairs(query_database, query_collection, name_collection_outgoing):
+def get_pairs(query_database, query_collection, name_collection_outgoing, codes=None):
     """
     Function gets methionine-aromatic pairs from base collection obtained from
     runner.py. Function then exports the pairs to a new collection.
@@ -107,11 +170,9 @@ def get_pairs(query_database, query_collection, name_collection_outgoing):
     :param query_database: Database in which Met-aromatic pairs are located.
     :param query_collection: Collection in which Met-aromatic pairs are located.
     :param name_collection_outgoing: The name of the MongoDB collection to export to.
+    :param codes: Only replace the pairs of these codes. All pairs are rebuilt if None.
     :return: Nothing. Function performs operation pass-by style.
     """
-    # ensure duplicates are not being loaded
-    client[query_database][name_collection_outgoing].drop()
-
     query = [
         {
             '$group': {
@@ -126,58 +187,67 @@ def get_pairs(query_database, query_collection, name_collection_outgoing):
                 }
             }
         },
-        {'$project': {'pairs': 1, 'EC': '$_id.EC', 'code': '$_id.code', '_id': 0}},
-        {'$out': name_collection_outgoing}
+        {'$project': {'pairs': 1, 'EC': '$_id.EC', 'code': '$_id.code', '_id': 0}}
     ]
 
-    client[query_database][query_collection].aggregate(query)
+    if backend == "parquet":
+        pairs = group_pairs(client[query_database][query_collection], codes)
+        if codes is None:
+            client[query_database][name_collection_outgoing].drop()
+        else:
+            client[query_database][name_collection_outgoing].delete_many({'code': {'$in': codes}})
+        if pairs:
+            client[query_database][name_collection_outgoing].insert_many(pairs)
+    elif codes is None:
+        # ensure duplicates are not being loaded
+        client[query_database][name_collection_outgoing].drop()
+        client[query_database][query_collection].aggregate(query + [{'$out': name_collection_outgoing}])
+        ensure_indexes(client[query_database][name_collection_outgoing], CODE_INDEXES)
+    else:
+        client[query_database][name_collection_outgoing].delete_many({'code': {'$in': codes}})
+        pairs = list(client[query_database][query_collection].aggregate([{'$match': {'code': {'$in': codes}}}] + query))
+        if pairs:
+            client[query_database][name_collection_outgoing].insert_many(pairs)
     print("\n -- Wrote Met-aromatic pair data to collection: {}".format(name_collection_outgoing))
 
 
-def get_bridges_from_pairs(query_database, query_collection, name_collection_outgoing, n=2):
+def get_bridges_from_pairs(query_database, query_collection, name_collection_outgoing, n=2, batch_size=1000, codes=None):
     """
     Function gets pairs from collection generated in get_pairs function. Function
-    then takes advantage of NetworkX to find n-bridges using network theory approaches.
-    Function then exports to another collection in MongoDB: a bridges collection.
+    then finds n-bridges as connected components using a union-find engine in a single
+    streaming pass over the pairs collection. Function then exports to another collection
+    in MongoDB: a bridges collection.
 
     :param query_database: Database in which Met-aromatic pairs are located.
     :param query_collection: Collection in which Met-aromatic pairs are located.
     :param name_collection_outgoing: The MongoDB collection to export data to.
     :param n: 2-bridge, 3-bridge, 4-bridge, ..., n-bridge
+    :param batch_size: Number of bridges to buffer per insert.
+    :param codes: Only replace the bridges of these codes. All bridges are rebuilt if None.
     :return: Nothing. Function performs operation pass-by style.
     """
     if n < 2:
         exit("Incorrect bridge order. A bridge must be of n >= 2!")
     else:
-        # ensure duplicates are not being loaded
-        client[query_database][name_collection_outgoing].drop()
+        if codes is None:
+            # ensure duplicates are not being loaded
+            client[query_database][name_collection_outgoing].drop()
+            if backend == "mongo":
+                ensure_indexes(client[query_database][name_collection_outgoing], CODE_INDEXES)
+            entries = client[query_database][query_collection].find()
+        else:
+            client[query_database][name_collection_outgoing].delete_many({'code': {'$in': codes}})
+            entries = client[query_database][query_collection].find({'code': {'$in': codes}})
 
-        bridges = []
-        for entry in client[query_database][query_collection].find():
-            pairs = []
-            for pair in entry.get('pairs'):
-                pairs.append(tuple(pair.split('|')))  # 'TYR123|MET123' -> ('TYR123', 'MET123')
-
-            G = Graph()
-            G.add_edges_from(pairs)
-
-            for disconnects in list(connected_components(G)):
-                if len(disconnects) == n + 1:
-                    if ''.join(disconnects).count('MET') == 1:  # remove inverse bridges -> MET-ARO-MET
-                        bridges.append(
-                            {
-                                'code': entry.get('code'),
-                                'EC': entry.get('EC'),
-                                'bridge': list(disconnects)
-                            }
-                        )
-                    else:
-                        pass
-                else:
-                    pass
+        # remove inverse bridges -> MET-ARO-MET
+        bridges = iter_bridges(entries, n=n, remove_inverse=True)
 
         try:
-            client[query_database][name_collection_outgoing].insert_many(bridges)
+            while True:
+                batch = list(islice(bridges, batch_size))
+                if not batch:
+                    break
+                client[query_database][name_collection_outgoing].insert_many(batch)
         except errors.BulkWriteError as pymongo_exception:
             print(pymongo_exception.details['writeErrors'])
         else:
@@ -187,7 +257,8 @@ def get_bridges_from_pairs(query_database, query_collection, name_collection_out
 def count_bridges(query_database, query_collection):
     """
     Function gets bridges from MongoDB bridges collection generated by
-    get_bridges_from_pairs function and performs a count.
+    get_bridges_from_pairs function and performs a count in a single pass
+    over the cursor.
 
     :param query_database: Database in which bridges are located.
     :param query_collection: Collection in which bridges are located.
@@ -201,73 +272,203 @@ def count_bridges(query_database, query_collection):
         PHE-TRP: 1
     }
     """
-    bridges = [i.get('bridge') for i in client[query_database][query_collection].find()]
-
-    # clean up data prior to count
-    refined = []
-    for bridge in bridges:
-        bridge.remove(*(amino_acid for amino_acid in bridge if "MET" in amino_acid))
-        refined.append(''.join([s for s in '-'.join(bridge) if not s.isdigit()]))
-
-    # actual counts
-    FF = refined.count('PHE-PHE')
-    YY = refined.count('TYR-TYR')
-    WW = refined.count('TRP-TRP')
-    YW = refined.count('TYR-TRP') + refined.count('TRP-TYR')
-    FY = refined.count('TYR-PHE') + refined.count('PHE-TYR')
-    FW = refined.count('PHE-TRP') + refined.count('TRP-PHE')
-
-    return {
-        'PHE-PHE': FF,
-        'TYR-TYR': YY,
-        'TRP-TRP': WW,
-        'TYR-TRP': YW,
-        'PHE-TYR': FY,
-        'PHE-TRP': FW
-    }
+    counts = dict.fromkeys(BRIDGE_TYPES, 0)
+    for entry in client[query_database][query_collection].find({}, {'bridge': 1, '_id': 0}):
+        bridge_type = classify_bridge(entry.get('bridge'))
+        if bridge_type is not None:
+            counts[bridge_type] += 1
+
+    return counts
+
+
+def tally_bridges_by_ec(entries, results=None, totals=None, sign=1):
+    """
+    Function accumulates bridge counts by EC classifier in a single pass over
+    documents from a bridges collection.
+
+    :param entries: An iterable of documents from a bridges collection.
+    :param results: A dict of dicts of counts by EC to add to. A new dict is started if None.
+    :param totals: A dict of the number of bridges of any type by EC to add to.
+    :param sign: 1 to add the bridges to the counts or -1 to remove them.
+    :return: The results and totals dicts.
+    """
+    results = {} if results is None else results
+    totals = {} if totals is None else totals
+
+    for entry in entries:
+        ec = entry['EC']
+        ec = '0' if ec == '' else ec  # replace '' with '0'
+        counts = results.setdefault(ec, dict.fromkeys(BRIDGE_TYPES, 0))
+        totals[ec] = totals.get(ec, 0) + sign
+
+        bridge_type = classify_bridge(entry.get('bridge'))
+        if bridge_type is not None:
+            counts[bridge_type] += sign
+
+    return results, totals
 
 
 def count_bridges_by_ec(query_database, query_collection):
     """
     Group by EC classifier and then count bridges. Custom Jeff Warren request.
+    Counts are accumulated per EC in a single pass over the cursor.
 
     :param query_database: Database in which bridges are located.
     :param query_collection: Collection in which bridges are located.
     :return: A dict of dicts for containing bridge counts grouped by EC codes.
     """
-    bridges = [row for row in client[query_database][query_collection].find()]
+    results, _ = tally_bridges_by_ec(client[query_database][query_collection].find({}, {'bridge': 1, 'EC': 1, '_id': 0}))
+    return {ec: results[ec] for ec in sorted(results)}
 
-    # need to sort prior to grouping with itertools.groupby
-    key = lambda column: column['EC']
-    bridges.sort(key=key)
 
-    results = {}
+def count_bridges_by_ec_server_side(query_database, query_collection):
+    """
+    Server-side equivalent of count_bridges_by_ec. Function finds 2-bridges in the
+    pairs collection generated in get_pairs function and counts them by EC classifier
+    in a MongoDB aggregation pipeline such that only the counts are sent to the client.
+    A 2-bridge is a methionine paired with exactly two aromatics that are paired with
+    no other methionine.
 
-    for ec, bridge in groupby(bridges, key=key):
+    :param query_database: Database in which Met-aromatic pairs are located.
+    :param query_collection: Collection in which Met-aromatic pairs are located.
+    :return: A dict of dicts for containing bridge counts grouped by EC codes.
+    """
+    # residue name of an aromatic or None if the residue would not be counted, i.e. PHE123A
+    name = {
+        '$cond': [
+            {'$regexMatch': {'input': '$$aro', 'regex': '^({})[0-9]*$'.format('|'.join(AROMATICS))}},
+            {'$substr': ['$$aro', 0, 3]},
+            None
+        ]
+    }
+
+    # both orderings of a pair of aromatics map onto one unordered bridge type
+    branches = [{'case': {'$eq': ['$key', key]}, 'then': value} for key, value in ORDERED_TYPES.items()]
+
+    query = [
+        {'$unwind': '$pairs'},
+        {'$project': {'EC': 1, 'pair': {'$split': ['$pairs', '|']}}},  # 'TYR123|MET123' -> ['TYR123', 'MET123']
+        {'$project': {'EC': 1, 'aro': {'$arrayElemAt': ['$pair', 0]}, 'met': {'$arrayElemAt': ['$pair', 1]}}},
+        {
+            '$group': {
+                '_id': {'entry': '$_id', 'aro': '$aro'},
+                'EC': {'$first': '$EC'},
+                'mets': {'$push': '$met'}
+            }
+        },
+        {'$project': {'EC': 1, 'mets': 1, 'degree': {'$size': '$mets'}}},
+        {'$unwind': '$mets'},
+        {
+            '$group': {
+                '_id': {'entry': '$_id.entry', 'met': '$mets'},
+                'EC': {'$first': '$EC'},
+                'aros': {'$push': '$_id.aro'},
+                'degree': {'$max': '$degree'}
+            }
+        },
+        {'$match': {'aros': {'$size': 2}, 'degree': 1}},
+        {'$project': {'EC': 1, 'names': {'$map': {'input': '$aros', 'as': 'aro', 'in': name}}}},
+        {
+            '$project': {
+                'EC': 1,
+                'key': {
+                    '$cond': [
+                        {'$in': [None, '$names']},
+                        None,
+                        {'$concat': [{'$arrayElemAt': ['$names', 0]}, '-', {'$arrayElemAt': ['$names', 1]}]}
+                    ]
+                }
+            }
+        },
+        {'$project': {'EC': 1, 'type': {'$switch': {'branches': branches, 'default': None}}}},
+        {'$group': {'_id': {'EC': '$EC', 'type': '$type'}, 'count': {'$sum': 1}}}
+    ]
+
+    results = {}
+    for entry in client[query_database][query_collection].aggregate(query):
+        ec = entry['_id']['EC']
         ec = '0' if ec == '' else ec  # replace '' with '0'
-        row, refined = [i.get('bridge') for i in list(bridge)], []
-        for r in row:
-            r.remove(*(amino_acid for amino_acid in r if "MET" in amino_acid))
-            refined.append(''.join([s for s in '-'.join(r) if not s.isdigit()]))
-
-        # actual counts
-        FF = refined.count('PHE-PHE')
-        YY = refined.count('TYR-TYR')
-        WW = refined.count('TRP-TRP')
-        YW = refined.count('TYR-TRP') + refined.count('TRP-TYR')
-        FY = refined.count('TYR-PHE') + refined.count('PHE-TYR')
-        FW = refined.count('PHE-TRP') + refined.count('TRP-PHE')
-
-        results[ec] = {
-            'PHE-PHE': FF,
-            'TYR-TYR': YY,
-            'TRP-TRP': WW,
-            'TYR-TRP': YW,
-            'PHE-TYR': FY,
-            'PHE-TRP': FW
-        }
+        counts = results.setdefault(ec, dict.fromkeys(BRIDGE_TYPES, 0))
+
+        bridge_type = entry['_id'].get('type')
+        if bridge_type is not None:
+            counts[bridge_type] += entry['count']
 
-    return results
+    return {ec: results[ec] for ec in sorted(results)}
+
+
+def analyze_incrementally(query_database, query_collection, collection_pairs, collection_bridges, name_collection_state):
+    """
+    Function updates the pairs and bridges collections and the bridge counts for
+    only the codes written to or deleted from the base collection since the last
+    incremental run.
+    Documents are stamped with an "inserted" time by runner.py and the latest time
+    seen is kept as a watermark in a state collection along with the bridge counts.
+    All pairs and bridges are rebuilt if there is no state for the base collection.
+
+    :param query_database: Database in which Met-aromatic pairs are located.
+    :param query_collection: Collection in which Met-aromatic pairs are located.
+    :param collection_pairs: The MongoDB collection holding Met-aromatic pairs.
+    :param collection_bridges: The MongoDB collection holding bridges.
+    :param name_collection_state: The MongoDB collection holding the watermark and counts.
+    :return: Count of bridges by type and a dict of dicts of bridge counts grouped by EC codes.
+    """
+    state = client[query_database][name_collection_state].find_one({'_id': query_collection})
+
+    # take the watermark before reading such that entries written during this run are picked up by the next run
+    latest = client[query_database][query_collection].find_one(
+        {'inserted': {'$exists': True}}, {'inserted': 1}, sort=[('inserted', -1)]
+    )
+    watermark = None if latest is None else latest['inserted']
+
+    if state is None:
+        print(' -- No previous incremental run found. Analyzing all entries.')
+        get_pairs(query_database, query_collection, collection_pairs)
+        get_bridges_from_pairs(query_database, collection_pairs, collection_bridges)
+        results, totals = tally_bridges_by_ec(client[query_database][collection_bridges].find({}, {'bridge': 1, 'EC': 1}))
+    else:
+        results, totals = state['bridges_by_ec'], state['totals']
+
+        if watermark is None:
+            codes = []
+        elif state['watermark'] is None:
+            codes = client[query_database][query_collection].distinct('code', {'inserted': {'$lte': watermark}})
+        else:
+            query = {'inserted': {'$gt': state['watermark'], '$lte': watermark}}
+            codes = client[query_database][query_collection].distinct('code', query)
+
+        # entries deleted from the base collection since the last run
+        current = set(client[query_database][query_collection].distinct('code'))
+        codes += [code for code in client[query_database][collection_pairs].distinct('code') if code not in current]
+        print(' -- Number of entries changed since last run: {}'.format(len(codes)))
+
+        if codes:
+            query = {'code': {'$in': codes}}
+            old = client[query_database][collection_bridges].find(query, {'bridge': 1, 'EC': 1})
+            tally_bridges_by_ec(old, results, totals, sign=-1)
+
+            get_pairs(query_database, query_collection, collection_pairs, codes=codes)
+            get_bridges_from_pairs(query_database, collection_pairs, collection_bridges, codes=codes)
+
+            new = client[query_database][collection_bridges].find(query, {'bridge': 1, 'EC': 1})
+            tally_bridges_by_ec(new, results, totals)
+
+    # drop EC classifiers that no longer have any bridges
+    for ec in [ec for ec, total in totals.items() if total == 0]:
+        del results[ec], totals[ec]
+
+    client[query_database][name_collection_state].replace_one(
+        {'_id': query_collection},
+        {'watermark': watermark, 'bridges_by_ec': results, 'totals': totals},
+        upsert=True
+    )
+
+    bridges_by_ec = {ec: results[ec] for ec in sorted(results)}
+    bridges_overall = dict.fromkeys(BRIDGE_TYPES, 0)
+    for counts in bridges_by_ec.values():
+        for bridge_type in BRIDGE_TYPES:
+            bridges_overall[bridge_type] += counts[bridge_type]
+    return bridges_overall, bridges_by_ec
 
 
 # -------------------------------------------------------------------------------------------
@@ -279,28 +480,49 @@ if __name__ == '__main__':
     print(' =============')
     print('\n')
 
-    print(' -- Connected to MongoDB on:')
-    print(' -- Port: {}'.format(mongoport))
-    print(' -- Host: {}'.format(mongohost))
+    if backend == "parquet":
+        print(' -- Reading Parquet store: {}'.format(parquet_root))
+    else:
+        print(' -- Connected to MongoDB on:')
+        print(' -- Port: {}'.format(mongoport))
+        print(' -- Host: {}'.format(mongohost))
     print(' -- Database: {}'.format(database))
     print(' -- Base collection: {}'.format(collection))
     print(' -- Met-aromatic pairs collection: {}'.format(collection_pairs))
     print(' -- Bridges collection: {}\n'.format(collection_bridges))
     print(' -- Analyzing...\n')
 
+    if backend == "mongo":
+        ensure_indexes(client[database][collection])
+        if report_indexes:
+            report_index_usage(database, collection)
+
     count_entries(database, collection)
     breakdowns_by_order(database, collection)
-    get_pairs(database, collection, collection_pairs)
-    get_bridges_from_pairs(database, collection_pairs, collection_bridges)
+    if incremental:
+        bridges_overall, bridges_by_EC = analyze_incrementally(
+            database, collection, collection_pairs, collection_bridges, collection_state
+        )
+    else:
+        get_pairs(database, collection, collection_pairs)
+        get_bridges_from_pairs(database, collection_pairs, collection_bridges)
+        bridges_overall = count_bridges(database, collection_bridges)
+
+        if server_side and (backend == "mongo"):
+            try:
+                bridges_by_EC = count_bridges_by_ec_server_side(database, collection_pairs)
+            except errors.OperationFailure:
+                print(' -- Server-side count failed. Falling back to client-side count.')
+                bridges_by_EC = count_bridges_by_ec(database, collection_bridges)
+        else:
+            bridges_by_EC = count_bridges_by_ec(database, collection_bridges)
 
     print(" -- Bridges: ")
-    bridges_overall = count_bridges(database, collection_bridges)
     for k in bridges_overall:
         print(' -- {} | {}'.format(k, bridges_overall.get(k)))
 
     print("\n -- Bridge counts by EC: ")
     print(" -- EC | { counts }")
-    bridges_by_EC = count_bridges_by_ec(database, collection_bridges)
     for k in bridges_by_EC:
         print(' --  {} | {}'.format(k, bridges_by_EC.get(k)))
 
@@ -0,0 +1,143 @@
+"""
+dsw7@sfu.ca
+A one time conversion of a batch of PDB entries into a binary atom store and/or
+a summary index. Later runs of runner.py --store read the atom tables from the
+store instead of decompressing and parsing every entry again, and runs with
+--summary skip entries that cannot produce a result.
+"""
+
+import os
+from sys import path; path.append("utils")
+from filegetter import PDBCache, PDBFile, FORMATS
+from atomstore import AtomStoreWriter
+from summary import Summary, summarize, write_codes
+from argparse import ArgumentParser, RawTextHelpFormatter
+from multiprocessing import Pool
+from time import time
+
+msg_batch = 'Convert a batch of pdb codes. \nUsage: $ python convert.py --batch /path/to/foo.txt --store /path/to/store'
+msg_store = 'Set the path to the store. Codes already in the store are skipped. \nUsage: $ python convert.py --batch /path/to/foo.txt --store /path/to/store'
+msg_summary = 'Set the path to the summary index (.npy). Codes already in the index are skipped. \nUsage: $ python convert.py --batch /path/to/foo.txt --summary /path/to/summary.npy'
+msg_select = 'Write the codes of the batch that can produce a result according to the summary to a .txt file. \nUsage: $ python convert.py --batch /path/to/foo.txt --summary /path/to/summary.npy --select /path/to/delim.txt'
+msg_chain = 'Set the chain used by --select. \nDefault = A. \nUsage: $ python convert.py --select /path/to/delim.txt --chain <A|B|...|all>'
+msg_cutoff = 'Set the Euclidean cutoff used by --select. \nDefault = 6.0 Angstroms. \nUsage: $ python convert.py --select /path/to/delim.txt --cutoff <float>'
+msg_min_aromatics = 'Set the number of aromatic residues required by --select, i.e. 2 for bridges. \nDefault = 1. \nUsage: $ python convert.py --select /path/to/delim.txt --min-aromatics <int>'
+msg_metals = 'Also require a metal with --select. \nUsage: $ python convert.py --select /path/to/delim.txt --metals'
+msg_cache_dir = 'Read entries from (and keep downloaded entries in) a local mirror. \nUsage: $ python convert.py --cache-dir /path/to/mirror'
+msg_offline = 'Only use entries already in the local mirror. \nUsage: $ python convert.py --cache-dir /path/to/mirror --offline'
+msg_format = 'Set the format of the entries to read. With auto, entries without a PDB format file are read from mmCIF. \nDefault = auto. \nUsage: $ python convert.py --format <auto|pdb|mmcif|bcif>'
+msg_workers = 'Parse entries over a pool of worker processes. \nDefault = 1. \nUsage: $ python convert.py --workers <int>'
+
+parser = ArgumentParser(formatter_class=RawTextHelpFormatter)
+parser.add_argument('--batch', help=msg_batch, default='0', type=str)
+parser.add_argument('--store', help=msg_store, default='0', type=str)
+parser.add_argument('--summary', help=msg_summary, default='0', type=str)
+parser.add_argument('--select', help=msg_select, default='0', type=str)
+parser.add_argument('--chain', help=msg_chain, default='A', type=str)
+parser.add_argument('--cutoff', help=msg_cutoff, default=6.0, type=float)
+parser.add_argument('--min-aromatics', help=msg_min_aromatics, default=1, type=int, dest='min_aromatics')
+parser.add_argument('--metals', help=msg_metals, action='store_true')
+parser.add_argument('--cache-dir', help=msg_cache_dir, default='0', type=str, dest='cache_dir')
+parser.add_argument('--offline', help=msg_offline, action='store_true')
+parser.add_argument('--format', help=msg_format, default='auto', type=str, dest='file_format')
+parser.add_argument('--workers', help=msg_workers, default=1, type=int)
+
+path = parser.parse_args().batch
+store = parser.parse_args().store
+summary_path = parser.parse_args().summary
+select = parser.parse_args().select
+chain = parser.parse_args().chain
+cutoff = parser.parse_args().cutoff
+min_aromatics = parser.parse_args().min_aromatics
+metals = parser.parse_args().metals
+cache_dir = parser.parse_args().cache_dir
+offline = parser.parse_args().offline
+workers = parser.parse_args().workers
+file_format = parser.parse_args().file_format
+
+if cache_dir == '0':
+    pdb_cache = None
+else:
+    pdb_cache = PDBCache(cache_dir, offline=offline)
+
+
+def verify_user_input():
+    if path == '0':
+        exit('No path to .txt given.')
+    elif (store == '0') and (summary_path == '0'):
+        exit('A path to a store and/or a summary index is required.')
+    elif not os.path.exists(path):
+        exit('Path to file does not exist.')
+    elif (select != '0') and (summary_path == '0'):
+        exit('Selecting codes requires a summary index. Pass --summary.')
+    elif offline and (cache_dir == '0'):
+        exit('Offline mode requires a local mirror. Pass --cache-dir.')
+    elif workers < 1:
+        exit('Number of workers must be greater than or equal to 1.')
+    elif file_format not in FORMATS:
+        exit('Invalid format. Valid formats are: {}'.format(', '.join(FORMATS)))
+    else:
+        pass
+
+
+def parse_entry(task):
+    # the summary runs the Met-aromatic algorithm over every chain so it is computed in the worker as well
+    pdbcode, summarize_entry = task
+    try:
+        atoms, ec = PDBFile(pdbcode, cache=pdb_cache).parse(file_format)
+        return (atoms, ec) if store != '0' else None, summarize(pdbcode, atoms, ec) if summarize_entry else None
+    except Exception as exception:
+        print('An exception has occurred:')
+        print(exception)
+
+
+if __name__ == '__main__':
+    verify_user_input()
+
+    with open(path, 'r') as f:
+        pdb_codes = f.read().splitlines()
+
+    writer = AtomStoreWriter(store) if store != '0' else None
+    summary = Summary(summary_path) if summary_path != '0' else None
+    pending = [
+        c for c in pdb_codes
+        if ((writer is not None) and (c not in writer)) or ((summary is not None) and (c not in summary))
+    ]
+    print('Skipping {} codes already converted.'.format(len(pdb_codes) - len(pending)))
+    start = time()
+
+    tasks = [(c, (summary is not None) and (c not in summary)) for c in pending]
+    if workers > 1:
+        pool = Pool(workers)
+        outcomes = pool.imap(parse_entry, tasks, chunksize=16)
+    else:
+        outcomes = map(parse_entry, tasks)
+
+    # the index is written even if the conversion is interrupted so a rerun picks up where it stopped
+    failed = 0
+    try:
+        for u, (code, result) in enumerate(zip(pending, outcomes), 1):
+            if result is None:
+                failed += 1
+                continue
+            parsed, rows = result
+            if writer is not None:
+                writer.add(code, *parsed)
+            if rows is not None:
+                summary.add_rows(code, rows)
+            if u % 1000 == 0:
+                print('Converted {} out of {} codes.'.format(u, len(pending)))
+    finally:
+        if writer is not None:
+            writer.close()
+        if summary is not None:
+            summary.save()
+        if workers > 1:
+            pool.terminate()
+
+    print('{} codes failed.'.format(failed))
+    if select != '0':
+        count = write_codes(summary, pdb_codes, select, chain=chain, cutoff=cutoff, min_aromatics=min_aromatics,
+                            metals=metals)
+        print('Wrote {} of {} codes to {}'.format(count, len(pdb_codes), select))
+    print('Total processing time: {} s'.format(time() - start))
@@ -6,11 +6,24 @@ The "main" script that accepts PDB code input from user.
 import os
 from sys import path; path.append("utils")
 from ma import MetAromatic
+from filegetter import PDBCache, FORMATS
+from downloader import Downloader, ROOT, MMCIF_ROOT
+from prefetch import Prefetcher
+from journal import Journal
+from atomstore import AtomStore
+from summary import Summary
+from metrics import Metrics, StageTimer, NullTimer
+from writer import BulkWriter
+from columnar import ParquetClient, ParquetWriter
+from indexes import ensure_indexes
 from pprint import pprint
 from argparse import ArgumentParser, RawTextHelpFormatter
 from pymongo import MongoClient
 from hashlib import md5
-from time import time
+from time import time, sleep
+from multiprocessing import Pool
+from collections import deque
+from cProfile import Profile
 
 COLUMNS = ["ARO", "ARO POS", "MET", "MET POS", "NORM", "MET-THETA", "MET-PHI"]
 DEFAULT_PORT = 27017
@@ -20,43 +33,146 @@ COL = "ma"
 
 msg_code = 'Process a pdb code. \nUsage: $ python runner.py --code <1abc>'
 msg_batch = 'Process a batch of pdb codes. \nUsage: $ python runner.py --batch /path/to/foo.txt'
-msg_cutoff = 'Set a Euclidean cutoff. \nDefault = 6.0 Angstroms. \nUsage: $ python runner.py --cutoff <float>'
-msg_angle = 'Set Met-theta/Met-phi angle. \nDefault = 109.5 degrees. \nUsage: $ python runner.py --angle <float>'
-msg_model = 'Set a lone pair interpolation model. \nDefault = cp. \nUsage: $ python runner.py --model <cp|rm>'
+msg_cutoff = 'Set a Euclidean cutoff. \nDefault = 6.0 Angstroms. \nUsage: $ python runner.py --cutoff <float> [<float> ...]'
+msg_angle = 'Set Met-theta/Met-phi angle. \nDefault = 109.5 degrees. \nUsage: $ python runner.py --angle <float> [<float> ...]'
+msg_model = 'Set a lone pair interpolation model. \nDefault = cp. \nUsage: $ python runner.py --model <cp|rm> [<cp|rm>]'
+msg_chain = 'Set a chain to analyze or analyze all chains in one pass. \nDefault = A. \nUsage: $ python runner.py --chain <A|B|...|all>'
+msg_inter_chain = 'Also pair Met / aromatic residues across chains. Requires --chain all. \nUsage: $ python runner.py --chain all --inter-chain'
 msg_verbosity = 'Set output verbosity. \nUsage: $ python runner.py --verbose'
 msg_export_csv = 'Export results to csv. \nUsage: $ python runner.py --export-csv /path/to/bar.txt'
 msg_export_mongo = 'Export results to MongoDB. \nUsage: $ python runner.py --export-mongo'
+msg_export_parquet = 'Export results to a local columnar store of Parquet files instead of MongoDB. \nUsage: $ python runner.py --export-parquet /path/to/store'
 msg_port = 'Set a MongoDB port. \nDefault = 27017. \nUsage: $ python runner.py --mongoport <port>'
 msg_host = 'Set a MongoDB host. \nDefault = localhost. \nUsage: $ python runner.py --mongohost <host>'
 msg_db = 'Choose a MongoDB export database name. \nDefault = ma. \nUsage: $ python runner.py --database <name>'
 msg_col = 'Choose a MongoDB export collection name. \nDefault = ma. \nUsage: $ python runner.py --collection <name>'
+msg_cache_dir = 'Keep downloaded PDB entries in a local mirror. \nUsage: $ python runner.py --cache-dir /path/to/mirror'
+msg_cache_size = 'Set a size cap on the local mirror in GB. \nDefault = 0 (no cap). \nUsage: $ python runner.py --cache-size <float>'
+msg_workers = 'Process a batch over a pool of worker processes. \nDefault = 1. \nUsage: $ python runner.py --batch /path/to/foo.txt --workers <int>'
+msg_journal = 'Set the path to the batch progress journal. \nDefault = /path/to/foo.txt.journal. \nUsage: $ python runner.py --batch /path/to/foo.txt --journal /path/to/foo.journal'
+msg_resume = 'Resume a batch job. Codes completed according to the journal are skipped. \nUsage: $ python runner.py --batch /path/to/foo.txt --resume'
+msg_retries = 'Set the number of passes over codes that failed. \nDefault = 0. \nUsage: $ python runner.py --batch /path/to/foo.txt --retries <int>'
+msg_backoff = 'Set the delay before the first retry pass. Doubles on each pass. \nDefault = 30.0 s. \nUsage: $ python runner.py --batch /path/to/foo.txt --backoff <float>'
+msg_bulk_size = 'Set the number of documents buffered per MongoDB bulk write. \nDefault = 1000. \nUsage: $ python runner.py --export-mongo --bulk-size <int>'
+msg_flush_interval = 'Set the maximum time between MongoDB bulk writes. \nDefault = 5.0 s. \nUsage: $ python runner.py --export-mongo --flush-interval <float>'
+msg_max_pending = 'Set how many codes workers may run ahead of the export. \nDefault = 4 x workers. \nUsage: $ python runner.py --workers <int> --max-pending <int>'
+msg_offline = 'Only use entries already in the local mirror. \nUsage: $ python runner.py --cache-dir /path/to/mirror --offline'
+msg_prefetch = 'Download this many entries into the local mirror ahead of the workers. \nDefault = 0 (no prefetch). \nUsage: $ python runner.py --batch /path/to/foo.txt --cache-dir /path/to/mirror --prefetch <int>'
+msg_host_connections = 'Set the maximum number of concurrent prefetch downloads per host. \nDefault = 4. \nUsage: $ python runner.py --prefetch <int> --host-connections <int>'
+msg_timeout = 'Set the timeout of a single download. \nDefault = 60.0 s. \nUsage: $ python runner.py --cache-dir /path/to/mirror --timeout <float>'
+msg_store = 'Read structures from a binary atom store built with convert.py. Codes missing from the store are downloaded. \nUsage: $ python runner.py --batch /path/to/foo.txt --store /path/to/store'
+msg_summary = 'Skip codes that cannot produce a result according to a summary index built with convert.py. \nUsage: $ python runner.py --batch /path/to/foo.txt --summary /path/to/summary.npy'
+msg_base_url = 'Download entries from a mirror of the wwPDB divided/pdb/ tree over ftp, http or https. \nDefault = the wwPDB FTP archive. \nUsage: $ python runner.py --base-url http://localhost:8000/divided/pdb'
+msg_mmcif_url = 'Download mmCIF entries from a mirror of the wwPDB divided/mmCIF/ tree over ftp, http or https. \nDefault = the wwPDB FTP archive. \nUsage: $ python runner.py --mmcif-url http://localhost:8000/divided/mmCIF'
+msg_timings = 'Append per code timings of each stage (download, decompress, parse, midpoints, geometry, mapping, write) and counts of atoms, midpoints and candidate pairs to a JSON lines file. \nUsage: $ python runner.py --batch /path/to/foo.txt --timings /path/to/timings.jsonl'
+msg_prometheus = 'Write stage timings and counts summed over the batch as Prometheus counters to a .prom file. \nUsage: $ python runner.py --batch /path/to/foo.txt --prometheus /path/to/metrics.prom'
+msg_profile = 'Profile every code with cProfile and keep the profiles of slow codes in a directory. \nUsage: $ python runner.py --batch /path/to/foo.txt --profile /path/to/profiles'
+msg_profile_threshold = 'Set the time above which a code is slow and its profile is kept. \nDefault = 10.0 s. \nUsage: $ python runner.py --profile /path/to/profiles --profile-threshold <float>'
+msg_format = 'Set the format of the entries to read. With auto, entries without a PDB format file (i.e. the largest assemblies) are read from mmCIF. bcif (BinaryCIF) requires msgpack. \nDefault = auto. \nUsage: $ python runner.py --format <auto|pdb|mmcif|bcif>'
 
 parser = ArgumentParser(formatter_class=RawTextHelpFormatter)
 parser.add_argument('--code', help=msg_code, default='0', type=str)
 parser.add_argument('--batch', help=msg_batch, default='0', type=str)
-parser.add_argument('--cutoff', help=msg_cutoff, default=6.0, type=float)
-parser.add_argument('--angle', help=msg_angle, default=109.5, type=float)
-parser.add_argument('--model', help=msg_model, default='cp')
+parser.add_argument('--cutoff', help=msg_cutoff, default=[6.0], type=float, nargs='+')
+parser.add_argument('--angle', help=msg_angle, default=[109.5], type=float, nargs='+')
+parser.add_argument('--model', help=msg_model, default=['cp'], nargs='+')
+parser.add_argument('--chain', help=msg_chain, default='A', type=str)
+parser.add_argument('--inter-chain', help=msg_inter_chain, action='store_true', dest='inter_chain')
 parser.add_argument('--verbose', help=msg_verbosity, action='store_true')
 parser.add_argument('--export-csv', help=msg_export_csv, default='False', dest='export_csv')
 parser.add_argument('--export-mongo', help=msg_export_mongo, action='store_true', dest='export_mongo')
+parser.add_argument('--export-parquet', help=msg_export_parquet, default='0', type=str, dest='export_parquet')
 parser.add_argument('--mongoport', help=msg_port, default=DEFAULT_PORT, type=int)
 parser.add_argument('--mongohost', help=msg_host, default=DEFAULT_HOST, type=str)
 parser.add_argument('--database', help=msg_db, default=DB, type=str)
 parser.add_argument('--collection', help=msg_col, default=COL, type=str)
+parser.add_argument('--cache-dir', help=msg_cache_dir, default='0', type=str, dest='cache_dir')
+parser.add_argument('--cache-size', help=msg_cache_size, default=0.0, type=float, dest='cache_size')
+parser.add_argument('--offline', help=msg_offline, action='store_true')
+parser.add_argument('--workers', help=msg_workers, default=1, type=int)
+parser.add_argument('--journal', help=msg_journal, default='0', type=str)
+parser.add_argument('--resume', help=msg_resume, action='store_true')
+parser.add_argument('--retries', help=msg_retries, default=0, type=int)
+parser.add_argument('--backoff', help=msg_backoff, default=30.0, type=float)
+parser.add_argument('--bulk-size', help=msg_bulk_size, default=1000, type=int, dest='bulk_size')
+parser.add_argument('--flush-interval', help=msg_flush_interval, default=5.0, type=float, dest='flush_interval')
+parser.add_argument('--max-pending', help=msg_max_pending, default=0, type=int, dest='max_pending')
+parser.add_argument('--prefetch', help=msg_prefetch, default=0, type=int)
+parser.add_argument('--host-connections', help=msg_host_connections, default=4, type=int, dest='host_connections')
+parser.add_argument('--timeout', help=msg_timeout, default=60.0, type=float)
+parser.add_argument('--store', help=msg_store, default='0', type=str)
+parser.add_argument('--summary', help=msg_summary, default='0', type=str)
+parser.add_argument('--base-url', help=msg_base_url, default='0', type=str, dest='base_url')
+parser.add_argument('--mmcif-url', help=msg_mmcif_url, default='0', type=str, dest='mmcif_url')
+parser.add_argument('--format', help=msg_format, default='auto', type=str, dest='file_format')
+parser.add_argument('--timings', help=msg_timings, default='0', type=str)
+parser.add_argument('--prometheus', help=msg_prometheus, default='0', type=str)
+parser.add_argument('--profile', help=msg_profile, default='0', type=str, dest='profile_dir')
+parser.add_argument('--profile-threshold', help=msg_profile_threshold, default=10.0, type=float,
+                    dest='profile_threshold')
 
 code = parser.parse_args().code
 path = parser.parse_args().batch
-cutoff = parser.parse_args().cutoff
-angle = parser.parse_args().angle
-model = parser.parse_args().model
+cutoffs = parser.parse_args().cutoff
+angles = parser.parse_args().angle
+models = parser.parse_args().model
+chain = parser.parse_args().chain
+inter_chain = parser.parse_args().inter_chain
 verbose = parser.parse_args().verbose
 export_csv = parser.parse_args().export_csv
 export_mongo = parser.parse_args().export_mongo
+export_parquet = parser.parse_args().export_parquet
 mongoport = parser.parse_args().mongoport
 mongohost = parser.parse_args().mongohost
 database = parser.parse_args().database
 collection = parser.parse_args().collection
+cache_dir = parser.parse_args().cache_dir
+cache_size = parser.parse_args().cache_size
+offline = parser.parse_args().offline
+workers = parser.parse_args().workers
+sweep = len(cutoffs) * len(angles) * len(models) > 1
+journal_path = parser.parse_args().journal
+resume = parser.parse_args().resume
+retries = parser.parse_args().retries
+backoff = parser.parse_args().backoff
+bulk_size = parser.parse_args().bulk_size
+flush_interval = parser.parse_args().flush_interval
+max_pending = parser.parse_args().max_pending or 4 * workers
+prefetch = parser.parse_args().prefetch
+host_connections = parser.parse_args().host_connections
+timeout = parser.parse_args().timeout
+base_url = parser.parse_args().base_url
+mmcif_url = parser.parse_args().mmcif_url
+file_format = parser.parse_args().file_format
+timings = parser.parse_args().timings
+prometheus = parser.parse_args().prometheus
+profile_dir = parser.parse_args().profile_dir
+profile_threshold = parser.parse_args().profile_threshold
+instrumented = (timings != '0') or (prometheus != '0') or (profile_dir != '0')
+store = parser.parse_args().store
+summary_path = parser.parse_args().summary
+export = export_mongo or (export_parquet != '0')
+
+if journal_path == '0':
+    journal_path = '{}.journal'.format(path)
+
+# one pool of persistent connections per process shared by every download
+downloader = Downloader(
+    ROOT if base_url == '0' else base_url.rstrip('/') + '/{}/{}',
+    timeout=timeout,
+    mmcif_url=MMCIF_ROOT if mmcif_url == '0' else mmcif_url.rstrip('/') + '/{}/{}'
+)
+
+if cache_dir == '0':
+    pdb_cache = None
+else:
+    pdb_cache = PDBCache(cache_dir, max_size=int(cache_size * 1024 ** 3) if cache_size else None, offline=offline,
+                         downloader=downloader)
+
+if (store == '0') or (not os.path.isdir(store)):
+    atom_store = None
+else:
+    atom_store = AtomStore(store)
 
 
 def verify_user_input():
@@ -66,29 +182,74 @@ def verify_user_input():
         exit('Invalid pdb code: {}'.format(code))
     elif (code != '0') and (path != '0'):
         exit('Cannot choose between .txt file and pdb code.')
-    elif model not in ('cp', 'rm'):
+    elif any(model not in ('cp', 'rm') for model in models):
         exit("Invalid model. Valid models are: cp (Cross Product) or rm (Rodrigues' method).")
-    elif (angle < 0.0) or (angle > 360.00):
+    elif any((angle < 0.0) or (angle > 360.00) for angle in angles):
         exit('Angle must be between 0 and 360 degrees.')
-    elif cutoff < 0:
+    elif (not 1 <= len(chain) <= 4) and (chain.lower() != 'all'):
+        exit('Invalid chain: {}'.format(chain))
+    elif inter_chain and (chain.lower() != 'all'):
+        exit('Inter-chain pairs require --chain all.')
+    elif any(cutoff < 0 for cutoff in cutoffs):
         exit('Cutoff must be greater than or equal to 0.0 Angstroms.')
     elif export_mongo and (export_csv != 'False'):
         exit('Cannot export to both MongoDB and a .csv document simultaneously.')
+    elif (export_parquet != '0') and (export_mongo or (export_csv != 'False')):
+        exit('Cannot export to a Parquet store and another backend simultaneously.')
+    elif offline and (cache_dir == '0'):
+        exit('Offline mode requires a local mirror. Pass --cache-dir.')
+    elif cache_size < 0:
+        exit('Cache size must be greater than or equal to 0.0 GB.')
+    elif workers < 1:
+        exit('Number of workers must be greater than or equal to 1.')
+    elif (retries < 0) or (backoff < 0):
+        exit('Retries and backoff must be greater than or equal to 0.')
+    elif (bulk_size < 1) or (max_pending < 1):
+        exit('Bulk size and max pending must be greater than or equal to 1.')
+    elif (store != '0') and (atom_store is None):
+        exit('Atom store does not exist: {}'.format(store))
+    elif (summary_path != '0') and (not os.path.exists(summary_path)):
+        exit('Summary index does not exist: {}'.format(summary_path))
+    elif prefetch and (cache_dir == '0'):
+        exit('Prefetching requires a local mirror. Pass --cache-dir.')
+    elif (prefetch < 0) or (host_connections < 1) or (timeout <= 0):
+        exit('Prefetch must be greater than or equal to 0, host connections at least 1 and timeout positive.')
+    elif file_format not in FORMATS:
+        exit('Invalid format. Valid formats are: {}'.format(', '.join(FORMATS)))
+    elif profile_threshold < 0:
+        exit('Profile threshold must be greater than or equal to 0.0 s.')
     else:
         pass
 
 
 def print_args():
     print("Analyzing: {}".format(code))
-    print("Cutoff: {}".format(cutoff))
-    print("Angle: {}".format(angle))
-    print("Model: {}".format(model))
+    print("Chain: {}".format(chain))
+    print("Inter-chain: {}".format(inter_chain))
+    print("Cutoff: {}".format(', '.join(str(cutoff) for cutoff in cutoffs)))
+    print("Angle: {}".format(', '.join(str(angle) for angle in angles)))
+    print("Model: {}".format(', '.join(models)))
+    print("Sweep: {}".format(sweep))
     print("Mongo Port: {}".format(mongoport))
     print("Mongo Host: {}".format(mongohost))
     print("Database Name: {}".format(database))
     print("Collection Name: {}".format(collection))
     print("Export to MongoDB: {}".format(export_mongo))
-    print("Export to csv: {}\n".format(export_csv))
+    print("Export to csv: {}".format(export_csv))
+    print("Export to Parquet: {}".format(export_parquet if export_parquet != '0' else None))
+    print("Local mirror: {}".format(cache_dir if cache_dir != '0' else None))
+    print("Offline: {}".format(offline))
+    print("Base URL: {}".format(downloader.url))
+    print("Format: {}".format(file_format))
+    print("Atom store: {}".format(store if store != '0' else None))
+    print("Summary index: {}".format(summary_path if summary_path != '0' else None))
+    print("Workers: {}".format(workers))
+    print("Prefetch: {}".format(prefetch))
+    print("Timings: {}".format(timings if timings != '0' else None))
+    print("Prometheus: {}".format(prometheus if prometheus != '0' else None))
+    print("Profile slow codes: {}".format(profile_dir if profile_dir != '0' else None))
+    print("Journal: {}".format(journal_path if path != '0' else None))
+    print("Resume: {}\n".format(resume))
 
 
 def read_pdb_code_txt_file(filepath):
@@ -102,15 +263,32 @@ def read_pdb_code_txt_file(filepath):
 
 
 def run_met_aromatic(pdbcode):
+    # geometry is computed once per structure for all combinations of parameters
+    # returns the results (None if an exception occurred) and the timer of the code
+    timer = StageTimer(pdbcode) if instrumented else NullTimer()
+    profile = Profile() if profile_dir != '0' else None
+    if profile is not None:
+        profile.enable()
+
+    results = None
     try:
-        ma = MetAromatic(pdbcode, cutoff=cutoff, angle=angle, model=model)
-        return ma.met_aromatic(), ma.get_ec_classifier()
+        with timer.stage('other'):
+            ma = MetAromatic(pdbcode, chain=chain, cutoff=max(cutoffs), angle=max(angles), model=models[0],
+                             cache=pdb_cache, inter_chain=inter_chain, downloader=downloader, store=atom_store,
+                             file_format=file_format, timer=timer)
+            results = ma.met_aromatic_sweep(cutoffs, angles, models), ma.get_ec_classifier()
     except Exception as exception:
         print('An exception has occurred:')
         print(exception)
+    finally:
+        if profile is not None:
+            profile.disable()
+            if timer.total() >= profile_threshold:
+                profile.dump_stats(os.path.join(profile_dir, '{}.prof'.format(pdbcode)))
+    return results, timer
 
 
-def mapper(result, pdbcode):
+def mapper(result, pdbcode, tags=None):
     # a function for adapting Met-aromatic results to MongoDB
     outgoing, ec = [], result[1]
     for item in result[0]:
@@ -125,6 +303,15 @@ def mapper(result, pdbcode):
             "ec": ec
         }
 
+        # chain IDs are only present when analyzing all chains
+        if len(item) > 7:
+            doc["aro-chain"] = item[7]
+            doc["met-chain"] = item[8]
+
+        # tag documents with the parameters that produced them if sweeping
+        if tags is not None:
+            doc.update(tags)
+
         # overwrite MongoDB _id with custom _id to prevent writing duplicate data into database
         _id = ''.join([str(i) for i in doc.values()])
         doc['_id'] = md5(_id.encode()).hexdigest()
@@ -132,6 +319,27 @@ def mapper(result, pdbcode):
     return outgoing
 
 
+def bounded_imap(pool, func, iterable, limit):
+    # like pool.imap but at most limit results may be waiting on the consumer
+    # such that workers cannot run ahead of a slow export
+    pending = deque()
+    for item in iterable:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= limit:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def get_documents(results, pdbcode):
+    # one result set per combination of parameters
+    outgoing, ec = [], results[1]
+    for (cutoff, angle, model), result in results[0].items():
+        tags = {"cutoff": cutoff, "angle": angle, "model": model} if sweep else None
+        outgoing.extend(mapper((result, ec), pdbcode, tags))
+    return outgoing
+
+
 def print_progress(pdbcode, current_count, overall_count):
     percent = round(current_count * 100 / overall_count, 2)
     msg = '{}. Iteration {} out of {}. {} % complete.'.format(pdbcode, current_count, overall_count, percent)
@@ -142,25 +350,53 @@ if __name__ == '__main__':
     verify_user_input()
     print_args()
 
+    if instrumented:
+        metrics = Metrics(jsonl=timings if timings != '0' else None,
+                          prometheus=prometheus if prometheus != '0' else None)
+    if profile_dir != '0':
+        os.makedirs(profile_dir, exist_ok=True)
+
+    if (path != '0') and (workers > 1):
+        pool = Pool(workers)  # fork workers before connecting to MongoDB
+
     if export_mongo:
         client = MongoClient(mongohost, mongoport)
         db = client[database]
         col = db[collection]
+        ensure_indexes(col)
+        writer = BulkWriter(col, batch_size=bulk_size, flush_interval=flush_interval)
+    elif export_parquet != '0':
+        col = ParquetClient(export_parquet)[database][collection]
+        partitions = {"cutoff": cutoffs[0], "angle": angles[0], "model": models[0]}
+        writer = ParquetWriter(col, batch_size=bulk_size, flush_interval=flush_interval, partitions=partitions)
 
     if (code != '0') and (path == '0'):  # user inputs a valid pdb code but no path to batch file
-        results = run_met_aromatic(code)
+        results, timer = run_met_aromatic(code)
 
         if results is None:
             print('NoneType object was returned from MetAromatic algorithm.')
-        elif not results[0]:
+            status = Journal.FAILED
+        elif not any(results[0].values()):
             print('No interactions.')
+            status = Journal.EMPTY
         else:
+            with timer.stage('mapping'):
+                documents = get_documents(results, code)
+
             if verbose:
-                pprint(mapper(results, code))
+                pprint(documents)
 
-            if export_mongo:
-                col.insert_many(mapper(results, code))
+            if export:
+                with timer.stage('write'):
+                    writer.add(documents)
+                    writer.flush()
             # TODO: else export to csv... might remove this -> .csvs are really not a good way to work with data
+            status = Journal.DONE
+
+        if instrumented:
+            metrics.add(timer, status)
+            metrics.close()
+            print('\n' + metrics.summary())
 
     elif (code == '0') and (path != '0'):  # user inputs no pdb code but valid path to batch file
         if not os.path.exists(path):
@@ -170,21 +406,97 @@ if __name__ == '__main__':
             overall = len(pdb_codes)
             start = time()
 
-        for u, code in enumerate(pdb_codes, 1):
-            print_progress(code, u, overall)
-            results = run_met_aromatic(code)
+        journal = Journal(journal_path, resume=resume)
+        finished = journal.finished()
+        pending = [c for c in pdb_codes if c not in finished]
+        if resume:
+            print('Resuming. Skipping {} completed codes.'.format(overall - len(pending)))
+
+        # codes that cannot produce a result according to the summary index are never downloaded
+        if summary_path != '0':
+            summary = Summary(summary_path)
+            kept = [summary.can_pair(c, chain, max(cutoffs), inter_chain) for c in pending]
+            for c in (c for c, keep in zip(pending, kept) if not keep):
+                journal.record(c, Journal.SKIPPED)
+            print('Skipping {} codes that cannot pair according to the summary index.'.format(kept.count(False)))
+            pending = [c for c, keep in zip(pending, kept) if keep]
 
-            if results is None:
-                print('NoneType object was returned from MetAromatic algorithm.')
-            elif not results[0]:
-                continue
+        for attempt in range(retries + 1):
+            if attempt:
+                if not pending:
+                    break
+                delay = backoff * 2 ** (attempt - 1)
+                print('Retrying {} failed codes in {} s.'.format(len(pending), delay))
+                sleep(delay)
+
+            # entries are downloaded into the mirror ahead of the workers, in the same order
+            if prefetch:
+                codes = Prefetcher(pdb_cache, pending, depth=prefetch, per_host=host_connections, timeout=timeout,
+                                   file_format='pdb' if file_format == 'auto' else file_format)
             else:
-                if verbose:
-                    pprint(mapper(results, code))
+                codes = pending
+
+            # each worker isolates its own errors so results arrive in the same order as a serial run
+            if workers > 1:
+                outcomes = bounded_imap(pool, run_met_aromatic, codes, max_pending)
+            else:
+                outcomes = map(run_met_aromatic, codes)
+
+            failed = []
+            for u, (code, (results, timer)) in enumerate(zip(pending, outcomes), 1):
+                print_progress(code, u, len(pending))
+
+                if results is None:
+                    print('NoneType object was returned from MetAromatic algorithm.')
+                    journal.record(code, Journal.FAILED)
+                    failed.append(code)
+                    status = Journal.FAILED
+                elif not any(results[0].values()):
+                    journal.record(code, Journal.EMPTY)
+                    status = Journal.EMPTY
+                else:
+                    if verbose or export:
+                        with timer.stage('mapping'):
+                            documents = get_documents(results, code)
+
+                    if verbose:
+                        pprint(documents)
+
+                    # codes are only marked done once their documents are in the database
+                    # a bulk write is timed against the code that triggered it
+                    if export:
+                        with timer.stage('write'):
+                            written = writer.add(documents, code)
+                    else:
+                        written = [code]
+                    # TODO: else export to csv...
+
+                    for c in written:
+                        journal.record(c, Journal.DONE)
+                    status = Journal.DONE
+
+                if instrumented:
+                    metrics.add(timer, status)
+
+            if export:
+                flush_start = time()
+                for c in writer.flush():
+                    journal.record(c, Journal.DONE)
+                if instrumented:
+                    metrics.add_seconds({'write': time() - flush_start})
+
+            pending = failed
+
+        journal.close()
+        if pending:
+            print('{} codes failed. Rerun with --resume to retry.'.format(len(pending)))
 
-                if export_mongo:
-                    col.insert_many(mapper(results, code))
-                # TODO: else export to csv...
+        if workers > 1:
+            pool.close()
+            pool.join()
 
         print('\n' + '-' * 50)
+        if instrumented:
+            metrics.close()
+            print(metrics.summary())
         print('Total processing time: {} s'.format(time() - start))
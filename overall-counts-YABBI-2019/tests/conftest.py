@@ -0,0 +1,66 @@
+"""
+dsw7@sfu.ca
+Fixtures shared by the download tests. A local HTTP server stands in for the
+wwPDB archive and serves a directory of .ent.gz files.
+"""
+
+import gzip
+import pytest
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from os import makedirs
+from threading import Thread, Lock
+from time import sleep
+
+CODES = ['1a{}{}'.format(i, j) for i in 'bcd' for j in range(10)]
+
+
+class ArchiveHandler(SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep connections alive
+    delay = 0.0
+    failures = 0  # number of requests answered with 503 before serving files
+    connections = 0
+    active, peak, requests = 0, 0, []  # requests in progress, most ever in progress and paths requested
+    lock = Lock()
+
+    def setup(self):
+        ArchiveHandler.connections += 1
+        SimpleHTTPRequestHandler.setup(self)
+
+    def do_GET(self):
+        with ArchiveHandler.lock:
+            ArchiveHandler.active += 1
+            ArchiveHandler.peak = max(ArchiveHandler.peak, ArchiveHandler.active)
+            ArchiveHandler.requests.append(self.path)
+        try:
+            sleep(self.delay)
+            if ArchiveHandler.failures > 0:
+                ArchiveHandler.failures -= 1
+                self.send_error(503)
+            else:
+                SimpleHTTPRequestHandler.do_GET(self)
+        finally:
+            with ArchiveHandler.lock:
+                ArchiveHandler.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def archive(tmp_path):
+    # an archive laid out like the wwPDB divided/pdb/xx/ tree
+    root = tmp_path / 'archive'
+    for code in CODES:
+        makedirs(root / 'divided' / 'pdb' / code[1:3], exist_ok=True)
+        with gzip.open(root / 'divided' / 'pdb' / code[1:3] / 'pdb{}.ent.gz'.format(code), 'wt') as f:
+            f.write('HEADER    {}\nEND\n'.format(code.upper()))
+
+    ArchiveHandler.delay, ArchiveHandler.failures, ArchiveHandler.connections = 0.0, 0, 0
+    ArchiveHandler.active, ArchiveHandler.peak, ArchiveHandler.requests = 0, 0, []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), partial(ArchiveHandler, directory=str(root)))
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield 'http://127.0.0.1:{}/divided/pdb/{{}}/{{}}'.format(server.server_address[1])
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,58 @@
+"""
+dsw7@sfu.ca
+Tests of the binary atom store. Atom tables read back from the store must be
+identical to the tables parse_pdb() produces.
+
+Run with command:
+    $ python -m pytest -v -s test_atomstore.py
+
+"""
+
+import pytest
+from sys import path; path.append(r"../utils")
+from pdbparser import parse_pdb
+from atomstore import AtomStore, AtomStoreWriter
+
+PDB = [
+    "COMPND   3 EC: 1.14.13.39;\n",
+    "ATOM      1  N   MET A   1      11.104   6.134  -6.504  1.00  0.00           N\n",
+    "ATOM      2  SD AMET A   1      12.560   5.921  -6.410  0.50  0.00           S\n",
+    "ATOM      3  CG  TYR B  52A    -27.595-106.521-108.313  1.00  0.00           C\n",
+    "HETATM    4 ZN    ZN A 900      16.792   9.275   1.151  1.00  0.00          ZN\n",
+    "ENDMDL\n",
+    "ATOM      5  N   MET A   1       0.000   0.000   0.000  1.00  0.00           N\n"
+]
+
+
+def test_round_trip(tmp_path):
+    atoms, ec = parse_pdb(PDB)
+    writer = AtomStoreWriter(str(tmp_path))
+    writer.add('1ABC', atoms, ec)
+    writer.add('2def', atoms[:2], None)
+    writer.close()
+
+    store = AtomStore(str(tmp_path))
+    assert len(store) == 2
+    read, read_ec = store.get('1abc')
+    assert read.dtype == atoms.dtype
+    assert (read == atoms).all() and read_ec == ec
+    assert store.get('2DEF')[1] is None
+    with pytest.raises(KeyError):
+        store.get('3ghi')
+
+
+def test_append_skips_existing(tmp_path):
+    atoms, ec = parse_pdb(PDB)
+    writer = AtomStoreWriter(str(tmp_path))
+    writer.add('1abc', atoms, ec)
+    writer.close()
+
+    writer = AtomStoreWriter(str(tmp_path))
+    assert '1abc' in writer
+    writer.add('1abc', atoms[:1], None)
+    writer.add('2def', atoms[1:], None)
+    writer.close()
+
+    store = AtomStore(str(tmp_path))
+    assert (store.get('1abc')[0] == atoms).all()
+    assert (store.get('2def')[0] == atoms[1:]).all()
@@ -0,0 +1,74 @@
+"""
+dsw7@sfu.ca
+Tests of the union-find bridge search on structures with several methionines.
+
+Run with command:
+    $ python -m pytest -v -s test_bridges.py
+
+"""
+
+from sys import path; path.append(r"../utils")
+from bridges import UnionFind, iter_bridges, classify_bridge
+
+
+def entry(code, *pairs):
+    # a document of a pairs collection, i.e. entry('1abc', 'TYR1|MET5')
+    return {'code': code, 'EC': '1', 'pairs': list(pairs)}
+
+
+def bridges(entries, n=2, remove_inverse=True):
+    return [(b['code'], sorted(b['bridge'])) for b in iter_bridges(entries, n=n, remove_inverse=remove_inverse)]
+
+
+def test_union_find():
+    forest = UnionFind()
+    a, b, c, d = (forest.node(label) for label in ('a', 'b', 'c', 'd'))
+    assert forest.node('b') == b
+    forest.union(a, b)
+    forest.union(c, d)
+    forest.union(b, a)
+    assert forest.find(a) == forest.find(b) != forest.find(c) == forest.find(d)
+    forest.union(d, b)
+    assert len({forest.find(i) for i in (a, b, c, d)}) == 1
+    assert sorted(forest.components()[0]) == ['a', 'b', 'c', 'd']
+
+    forest.clear()
+    assert forest.components() == []
+    assert forest.node('e') == 0
+
+
+def test_separate_methionines():
+    # two 2-bridges around different methionines of one structure
+    entries = [entry('1abc', 'TYR1|MET5', 'PHE2|MET5', 'TRP3|MET9', 'TYR4|MET9')]
+    assert bridges(entries) == [('1abc', ['MET5', 'PHE2', 'TYR1']), ('1abc', ['MET9', 'TRP3', 'TYR4'])]
+    assert bridges(entries, n=3) == []
+
+
+def test_inverse_bridges():
+    # MET-ARO-MET is only kept if inverse bridges are not removed
+    entries = [entry('1abc', 'TYR1|MET5', 'TYR1|MET6')]
+    assert bridges(entries) == []
+    assert bridges(entries, remove_inverse=False) == [('1abc', ['MET5', 'MET6', 'TYR1'])]
+
+
+def test_methionines_sharing_aromatics():
+    # aromatics bridged through two methionines form one component that is no bridge of any order
+    entries = [entry('1abc', 'TYR1|MET5', 'PHE2|MET5', 'PHE2|MET6', 'TRP3|MET6')]
+    for n in (2, 3, 4):
+        assert bridges(entries, n=n) == []
+    assert bridges(entries, n=4, remove_inverse=False) == [('1abc', ['MET5', 'MET6', 'PHE2', 'TRP3', 'TYR1'])]
+
+
+def test_entries_are_independent():
+    # labels are reused across structures without joining them
+    entries = [entry('1abc', 'TYR1|MET5'), entry('2abc', 'PHE2|MET5'), entry('3abc', 'TYR1|MET5', 'TYR2|MET5', 'TRP3|MET5')]
+    assert bridges(entries) == []
+    assert bridges(entries, n=3) == [('3abc', ['MET5', 'TRP3', 'TYR1', 'TYR2'])]
+
+
+def test_classify_bridge():
+    assert classify_bridge(['TYR1', 'MET5', 'PHE2']) == 'PHE-TYR'
+    assert classify_bridge(['PHE2', 'MET5', 'TYR1']) == 'PHE-TYR'
+    assert classify_bridge(['MET9', 'TRP3', 'TYR4']) == 'TYR-TRP'
+    assert classify_bridge(['TRP3', 'MET123', 'TRP40']) == 'TRP-TRP'
+    assert classify_bridge(['TYR1', 'MET5', 'PHE2', 'TRP3']) is None
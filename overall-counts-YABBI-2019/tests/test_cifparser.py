@@ -0,0 +1,211 @@
+"""
+dsw7@sfu.ca
+Tests of the mmCIF and BinaryCIF readers. Both must produce the same atom table
+as parse_pdb() for the same structure.
+
+Run with command:
+    $ python -m pytest -v -s test_cifparser.py
+
+"""
+
+import gzip
+import pytest
+from sys import path; path.append(r"../utils")
+from numpy import array, array_equal
+from pdbparser import parse_pdb
+from cifparser import parse_mmcif, parse_bcif, decode
+from filegetter import PDBCache, PDBFile
+from downloader import Downloader
+
+PDB = """\
+COMPND   2 MOLECULE: LYSOZYME;                                                  
+COMPND   3 EC: 3.2.1.17;                                                        
+MODEL        1                                                                  
+ATOM      1  N   MET A   1      27.340  24.430   2.614  1.00  9.67           N  
+ATOM      2  SD AMET A   1      26.266  25.413   2.842  0.50 10.38           S  
+ATOM      3  SD BMET A   1      26.913  26.639   3.531  0.50  9.62           S  
+ATOM      4  CG  PHE A  52A     -7.595-106.521-108.313  1.00 11.99           C  
+HETATM    5 ZN    ZN A 900      10.000  11.000  12.000  1.00 20.00          ZN  
+ENDMDL                                                                          
+MODEL        2                                                                  
+ATOM      1  N   MET A   1      27.000  24.000   2.000  1.00  9.67           N  
+ENDMDL                                                                          
+"""
+
+MMCIF = """\
+data_1ABC
+#
+loop_
+_entity.id
+_entity.type
+_entity.pdbx_description
+_entity.pdbx_ec
+1 polymer
+;LYSOZYME, a description
+over two lines
+;
+'3.2.1.17, 3.2.1.18'
+2 non-polymer "ZINC ION" ?
+#
+loop_
+_atom_site.group_PDB
+_atom_site.id
+_atom_site.label_atom_id
+_atom_site.label_alt_id
+_atom_site.label_comp_id
+_atom_site.label_asym_id
+_atom_site.label_seq_id
+_atom_site.pdbx_PDB_ins_code
+_atom_site.Cartn_x
+_atom_site.Cartn_y
+_atom_site.Cartn_z
+_atom_site.auth_seq_id
+_atom_site.auth_comp_id
+_atom_site.auth_asym_id
+_atom_site.auth_atom_id
+_atom_site.pdbx_PDB_model_num
+ATOM   1 N  . MET A 1 ? 27.340 24.430 2.614 1 MET A N  1
+ATOM   2 SD A MET A 1 ? 26.266 25.413 2.842 1 MET A SD 1
+ATOM   3 SD B MET A 1 ? 26.913 26.639 3.531 1 MET A SD 1
+ATOM   4 CG . PHE A 2 A -7.595 -106.521 -108.313 52 PHE A CG 1
+HETATM 5 ZN . ZN  B . ? 10.000 11.000 12.000 900 ZN A ZN 1
+ATOM   1 N  . MET A 1 ? 27.000 24.000 2.000 1 MET A N  2
+#
+"""
+
+
+def test_mmcif_matches_pdb():
+    atoms, ec = parse_mmcif(MMCIF.splitlines(True))
+    reference, _ = parse_pdb(PDB.splitlines(True))
+    assert ec == '3.2.1.17'
+    assert len(atoms) == len(reference) == 5
+    for field in reference.dtype.names:
+        assert array_equal(atoms[field], reference[field]), field
+
+
+def test_mmcif_long_chain_and_quoted_names():
+    lines = MMCIF.replace('MET A N  1', 'MET AA "N\'" 1').splitlines(True)
+    atoms, _ = parse_mmcif(lines)
+    assert atoms['chain'][0] == b'AA'  # multi-character chains are not truncated
+    assert atoms['name'][0] == b"N'"
+
+
+def test_decode():
+    # Delta and RunLength: 1 2 3 3 3 -> deltas 1 1 1 0 0 -> runs (1, 3), (0, 2)
+    runs = array([1, 3, 0, 2], dtype='<i4').tobytes()
+    encoded = {'data': runs, 'encoding': [
+        {'kind': 'Delta', 'origin': 0, 'srcType': 3},
+        {'kind': 'RunLength', 'srcType': 3, 'srcSize': 5},
+        {'kind': 'ByteArray', 'type': 3}
+    ]}
+    assert decode(encoded).tolist() == [1, 2, 3, 3, 3]
+
+    # IntegerPacking into int8: 300 -> 127 127 46, -200 -> -128 -72
+    packed = array([127, 127, 46, -128, -72, 5], dtype='<i1').tobytes()
+    encoded = {'data': packed, 'encoding': [
+        {'kind': 'IntegerPacking', 'byteCount': 1, 'isUnsigned': False, 'srcSize': 3},
+        {'kind': 'ByteArray', 'type': 1}
+    ]}
+    assert decode(encoded).tolist() == [300, -200, 5]
+
+    encoded = {'data': array([27340, -106521], dtype='<i4').tobytes(), 'encoding': [
+        {'kind': 'FixedPoint', 'factor': 1000, 'srcType': 33},
+        {'kind': 'ByteArray', 'type': 3}
+    ]}
+    assert decode(encoded).tolist() == [27.34, -106.521]
+
+    encoded = {'data': array([1, 0, -1], dtype='<i1').tobytes(), 'encoding': [{
+        'kind': 'StringArray',
+        'stringData': 'CASD',
+        'offsets': array([0, 2, 4], dtype='<u1').tobytes(),
+        'offsetEncoding': [{'kind': 'ByteArray', 'type': 4}],
+        'dataEncoding': [{'kind': 'ByteArray', 'type': 1}]
+    }]}
+    assert decode(encoded).tolist() == ['SD', 'CA', '']
+
+
+def test_bcif_matches_mmcif():
+    msgpack = pytest.importorskip('msgpack')
+    reference, _ = parse_mmcif(MMCIF.splitlines(True))
+
+    def column(name, values):
+        if values.dtype.kind == 'S':
+            values = values.astype(str)
+        if values.dtype.kind == 'U':
+            words = sorted(set(values.tolist()))
+            offsets = [0]
+            for word in words:
+                offsets.append(offsets[-1] + len(word))
+            return {'name': name, 'mask': None, 'data': {
+                'data': array([words.index(v) for v in values.tolist()], dtype='<i4').tobytes(),
+                'encoding': [{
+                    'kind': 'StringArray', 'stringData': ''.join(words),
+                    'offsets': array(offsets, dtype='<i4').tobytes(),
+                    'offsetEncoding': [{'kind': 'ByteArray', 'type': 3}],
+                    'dataEncoding': [{'kind': 'ByteArray', 'type': 3}]
+                }]
+            }}
+        return {'name': name, 'mask': None, 'data': {
+            'data': values.astype('<f8').tobytes(), 'encoding': [{'kind': 'ByteArray', 'type': 33}]
+        }}
+
+    columns = [
+        column('group_PDB', reference['record']),
+        column('id', reference['serial']),
+        column('auth_atom_id', reference['name']),
+        column('label_alt_id', reference['altloc']),
+        column('auth_comp_id', reference['resname']),
+        column('auth_asym_id', reference['chain']),
+        column('auth_seq_id', reference['resseq']),
+        column('pdbx_PDB_ins_code', reference['icode']),
+        column('Cartn_x', reference['xyz'][:, 0]),
+        column('Cartn_y', reference['xyz'][:, 1]),
+        column('Cartn_z', reference['xyz'][:, 2])
+    ]
+    # '.' (1) marks a missing EC classifier in the first row
+    ec = column('pdbx_ec', array(['', '3.2.1.17']))
+    ec['mask'] = {'data': array([1, 0], dtype='<u1').tobytes(), 'encoding': [{'kind': 'ByteArray', 'type': 4}]}
+
+    data = msgpack.packb({'dataBlocks': [{'header': '1ABC', 'categories': [
+        {'name': '_entity', 'rowCount': 2, 'columns': [ec]},
+        {'name': '_atom_site', 'rowCount': len(reference), 'columns': columns}
+    ]}]}, use_bin_type=True)
+
+    atoms, ec = parse_bcif(data)
+    assert ec == '3.2.1.17'
+    for field in reference.dtype.names:
+        assert array_equal(atoms[field], reference[field]), field
+
+
+def test_auto_falls_back_to_mmcif(tmp_path):
+    # an offline mirror holding only the mmCIF file of an entry
+    cache = PDBCache(str(tmp_path), offline=True)
+    filepath = tmp_path / 'divided' / 'mmCIF' / 'ab' / '1abc.cif.gz'
+    filepath.parent.mkdir(parents=True)
+    with gzip.open(str(filepath), 'wt') as f:
+        f.write(MMCIF)
+
+    atoms, ec = PDBFile('1abc', cache=cache).parse('auto')
+    assert (len(atoms) == 5) and (ec == '3.2.1.17')
+    with pytest.raises(FileNotFoundError):
+        PDBFile('1abc', cache=cache).parse('pdb')
+
+
+def test_auto_falls_back_over_file_url(tmp_path):
+    # a file:// mirror holding only the mmCIF file of an entry
+    root = tmp_path / 'archive'
+    filepath = root / 'divided' / 'mmCIF' / 'ab' / '1abc.cif.gz'
+    filepath.parent.mkdir(parents=True)
+    with gzip.open(str(filepath), 'wt') as f:
+        f.write(MMCIF)
+    downloader = Downloader(root.as_uri() + '/divided/pdb/{}/{}', mmcif_url=root.as_uri() + '/divided/mmCIF/{}/{}',
+                            retries=3, backoff=10.0)
+
+    atoms, ec = PDBFile('1abc', downloader=downloader).parse('auto')
+    assert (len(atoms) == 5) and (ec == '3.2.1.17')
+
+    cache = PDBCache(str(tmp_path / 'mirror'), downloader=downloader)
+    atoms, ec = PDBFile('1abc', cache=cache).parse('auto')
+    assert (len(atoms) == 5) and (ec == '3.2.1.17')
+    with pytest.raises(FileNotFoundError):  # not retried, or the backoff would take seconds
+        PDBFile('1abc', cache=cache).parse('pdb')
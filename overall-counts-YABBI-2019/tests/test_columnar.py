@@ -0,0 +1,79 @@
+"""
+dsw7@sfu.ca
+Tests of the columnar store. Writing the documents of a code twice must
+replace them, as the MongoDB upserts do, rather than store them twice.
+
+Run with command:
+    $ python -m pytest -v -s test_columnar.py
+
+"""
+
+from sys import path; path.append(r"../utils")
+from collections import Counter
+from hashlib import md5
+from bridges import iter_bridges, classify_bridge
+from columnar import ParquetClient, ParquetWriter, count_orders, group_pairs
+
+# (aromatic, aromatic residue, methionine, norm). The last document of 2abc repeats the one before it
+INTERACTIONS = {
+    '1abc': [('TYR', '10', '5', 4.1), ('TYR', '10', '5', 4.3), ('PHE', '20', '5', 5.2)],
+    '2abc': [('TYR', '11', '8', 4.8), ('TYR', '12', '8', 3.9), ('TYR', '12', '8', 3.9)]
+}
+EC = {'1abc': '1.1.1.1', '2abc': '3.2.1.17'}
+
+
+def documents(code):
+    # one document per Met-aromatic interaction, keyed on an md5 _id as in runner.py
+    docs = []
+    for aro, arores, met, norm in INTERACTIONS[code]:
+        doc = {'code': code, 'aro': aro, 'arores': arores, 'met': met, 'norm': norm, 'ec': EC[code]}
+        doc['_id'] = md5(''.join(str(i) for i in doc.values()).encode()).hexdigest()
+        docs.append(doc)
+    return docs
+
+
+def bridges(col):
+    return Counter(classify_bridge(bridge['bridge']) for bridge in iter_bridges(group_pairs(col)))
+
+
+def write(col, codes, cutoff=6.0):
+    writer = ParquetWriter(col, partitions={'cutoff': cutoff, 'angle': 109.5, 'model': 'cp'})
+    for code in codes:
+        writer.add(documents(code), code)
+    writer.flush()
+
+
+def test_rewrite_is_idempotent(tmp_path):
+    client = ParquetClient(str(tmp_path))
+    col = client['ma']['ma']
+    write(col, ['1abc', '2abc'])
+    orders, counts = count_orders(col), bridges(col)
+    ids, files = col.distinct('_id'), col._files()
+    assert orders == [{'_id': 1, 'count': 3}, {'_id': 2, 'count': 1}]
+    assert counts == Counter({'PHE-TYR': 1, 'TYR-TYR': 1})
+
+    write(col, ['1abc', '2abc'])
+    write(client['ma']['ma'], ['2abc'])  # a later run reads the stored _ids from the files
+    assert count_orders(col) == orders
+    assert bridges(col) == counts
+    assert col.count_documents({}) == len(ids) == 5
+    assert sorted(col.distinct('_id')) == sorted(ids)
+    assert col._files() == files  # unchanged documents are not written again
+
+
+def test_rewrite_moves_documents(tmp_path):
+    col = ParquetClient(str(tmp_path))['ma']['ma']
+    write(col, ['1abc', '2abc'])
+    write(col, ['1abc'], cutoff=4.9)
+    assert col.count_documents({}) == 5
+    assert col.distinct('code', {'cutoff': 4.9}) == ['1abc']
+    assert col.distinct('code', {'cutoff': 6.0}) == ['2abc']
+
+
+def test_delete_then_rewrite(tmp_path):
+    col = ParquetClient(str(tmp_path))['ma']['ma']
+    write(col, ['1abc', '2abc'])
+    col.delete_many({'code': '1abc'})
+    assert col.count_documents({}) == 2
+    write(col, ['1abc'])
+    assert col.count_documents({}) == 5
@@ -0,0 +1,48 @@
+"""
+dsw7@sfu.ca
+Tests of the pooled download client against a local HTTP server. See conftest.py.
+
+Run with command:
+    $ python -m pytest -v -s test_downloader.py
+
+"""
+
+import gzip
+import pytest
+from sys import path; path.append(r"../utils")
+from downloader import Downloader
+from conftest import ArchiveHandler, CODES
+from io import BytesIO
+
+
+def read_header(raw):
+    raw.seek(0)
+    with gzip.GzipFile(fileobj=raw) as gz:
+        return gz.readline().decode().split()[1]
+
+
+def test_connections_reused(archive):
+    downloader = Downloader(archive, timeout=5.0)
+    for code in CODES:
+        raw = BytesIO()
+        downloader.fetch(code, raw)
+        assert read_header(raw) == code.upper()
+    assert ArchiveHandler.connections == 1
+
+
+def test_retry_with_backoff(archive):
+    ArchiveHandler.failures = 2
+    raw = BytesIO()
+    Downloader(archive, timeout=5.0, retries=2, backoff=0.01).fetch(CODES[0], raw)
+    assert read_header(raw) == CODES[0].upper()
+
+    ArchiveHandler.failures = 3
+    with pytest.raises(Exception):
+        Downloader(archive, timeout=5.0, retries=2, backoff=0.01).fetch(CODES[0], BytesIO())
+
+
+def test_missing_entry_not_retried(archive):
+    downloader = Downloader(archive, timeout=5.0, retries=5, backoff=10.0)
+    with pytest.raises(FileNotFoundError):
+        downloader.fetch('9zzz', BytesIO())
+    assert ArchiveHandler.connections == 1
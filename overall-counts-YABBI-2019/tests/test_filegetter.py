@@ -0,0 +1,66 @@
+"""
+dsw7@sfu.ca
+Tests of the persistent PDB cache. Downloads go to a local HTTP server. See conftest.py.
+
+Run with command:
+    $ python -m pytest -v -s test_filegetter.py
+
+"""
+
+import pytest
+from sys import path; path.append(r"../utils")
+from os import makedirs, utime, path as ospath
+from filegetter import PDBCache, LOW_WATER
+from conftest import CODES
+
+
+def populate(cache, codes, size=100):
+    # cached entries of size bytes, used in the order of codes
+    for i, code in enumerate(codes):
+        filepath = cache.path_to(code)
+        makedirs(ospath.dirname(filepath), exist_ok=True)
+        with open(filepath, 'wb') as f:
+            f.write(b'\0' * size)
+        utime(filepath, (1000 + i, 1000 + i))
+
+
+def cached(cache, codes):
+    return [code for code in codes if ospath.exists(cache.path_to(code))]
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = PDBCache(str(tmp_path), max_size=1000, offline=True)
+    populate(cache, CODES[:12])
+    cache.get(CODES[0])  # a hit marks the oldest entry as recently used
+    cache.evict()
+    assert cache.size <= LOW_WATER * cache.max_size
+    assert cached(cache, CODES[:12]) == [CODES[0]] + CODES[4:12]
+
+
+def test_evict_keeps_entry(tmp_path):
+    cache = PDBCache(str(tmp_path), max_size=250, offline=True)
+    populate(cache, CODES[:5])
+    cache.evict(keep=cache.path_to(CODES[0]))
+    assert cached(cache, CODES[:5]) == [CODES[0], CODES[4]]
+
+
+def test_download_evicts_to_low_water(tmp_path, archive):
+    cache = PDBCache(str(tmp_path), url=archive, timeout=5.0)
+    size = ospath.getsize(cache.get(CODES[0]))
+    cache.max_size = 10 * size
+
+    for code in CODES[1:11]:
+        cache.get(code)
+    assert cached(cache, CODES[:11])[-1] == CODES[10]  # the newest download is never evicted
+    assert cache.size <= LOW_WATER * cache.max_size
+    assert cache.size == sum(ospath.getsize(cache.path_to(code)) for code in cached(cache, CODES[:11]))
+
+
+def test_offline_miss(tmp_path):
+    cache = PDBCache(str(tmp_path), offline=True)
+    populate(cache, CODES[:1])
+    assert cache.get(CODES[0]) == cache.path_to(CODES[0])
+    with pytest.raises(FileNotFoundError):
+        cache.get(CODES[1])
+    with pytest.raises(FileNotFoundError):
+        cache.get(CODES[0], 'mmcif')
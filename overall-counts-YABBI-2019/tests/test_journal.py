@@ -0,0 +1,92 @@
+"""
+dsw7@sfu.ca
+Tests of the batch journal and of the bulk writer. Neither needs a network
+or a database server.
+
+Run with command:
+    $ python -m pytest -v -s test_journal.py
+
+"""
+
+from sys import path; path.append(r"../utils")
+from datetime import timezone
+from json import loads
+from journal import Journal
+from writer import BulkWriter
+
+
+class Collection:
+    # records the bulk writes a BulkWriter sends to MongoDB
+    def __init__(self):
+        self.requests = []
+
+    def bulk_write(self, requests, ordered=True):
+        assert not ordered
+        self.requests.append(requests)
+
+
+def test_resume(tmp_path):
+    filepath = str(tmp_path / 'codes.txt.journal')
+    journal = Journal(filepath)
+    journal.record('1abc', Journal.DONE)
+    journal.record('2abc', Journal.EMPTY)
+    journal.record('3abc', Journal.FAILED)
+    journal.record('4abc', Journal.FAILED)
+    journal.record('6abc', Journal.SKIPPED)  # may pair at a larger cutoff
+    journal.close()
+    with open(filepath, 'a') as f:
+        f.write('{"code": "5abc", "sta')  # a line cut short by a crash
+
+    journal = Journal(filepath, resume=True)
+    assert journal.finished() == {'1abc', '2abc'}
+    assert journal.failed() == {'3abc', '4abc'}
+
+    # the last line for a code wins and attempts keep counting across runs
+    journal.record('3abc', Journal.DONE)
+    journal.close()
+    journal = Journal(filepath, resume=True)
+    assert journal.finished() == {'1abc', '2abc', '3abc'}
+    assert journal.failed() == {'4abc'}
+    assert journal.attempts['3abc'] == 2
+    journal.close()
+
+    with open(filepath) as f:
+        assert loads(f.readlines()[-1])['attempt'] == 2
+
+
+def test_no_resume_overwrites(tmp_path):
+    filepath = str(tmp_path / 'codes.txt.journal')
+    journal = Journal(filepath)
+    journal.record('1abc', Journal.DONE)
+    journal.close()
+
+    journal = Journal(filepath, resume=False)
+    assert journal.finished() == set()
+    journal.close()
+    with open(filepath) as f:
+        assert f.read() == ''
+
+
+def test_bulk_writer_batches(tmp_path):
+    collection = Collection()
+    writer = BulkWriter(collection, batch_size=3, flush_interval=3600.0)
+    assert writer.add([{'_id': 'a'}, {'_id': 'b'}], '1abc') == []
+    assert writer.add([{'_id': 'c'}, {'_id': 'd'}], '2abc') == ['1abc', '2abc']
+    assert writer.add([], '3abc') == []
+    assert writer.flush() == ['3abc']
+    assert writer.flush() == []
+
+    assert len(collection.requests) == 1
+    requests = collection.requests[0]
+    assert [request._filter for request in requests] == [{'_id': 'a'}, {'_id': 'b'}, {'_id': 'c'}, {'_id': 'd'}]
+    assert all(request._upsert for request in requests)
+    assert len({request._doc['inserted'] for request in requests}) == 1
+    assert requests[0]._doc['inserted'].tzinfo == timezone.utc
+
+
+def test_bulk_writer_interval():
+    collection = Collection()
+    writer = BulkWriter(collection, batch_size=1000, flush_interval=0.0)
+    assert writer.add([{'_id': 'a'}], '1abc') == ['1abc']
+    assert writer.add([{'_id': 'b'}], '2abc') == ['2abc']
+    assert len(collection.requests) == 2
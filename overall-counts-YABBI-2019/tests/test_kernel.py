@@ -0,0 +1,59 @@
+"""
+dsw7@sfu.ca
+Tests of the vectorized Met-aromatic kernel. The CellList spatial index must
+find exactly the pairs found by comparing every SD with every midpoint.
+
+Run with command:
+    $ python -m pytest -v -s test_kernel.py
+
+"""
+
+import pytest
+from sys import path; path.append(r"../utils")
+from numpy import array, array_equal, allclose, linalg, random
+from utils import CellList, met_aromatic_kernel
+
+
+@pytest.fixture
+def structure():
+    # Met SD atoms, lone pair vectors and midpoints scattered through a 40 Angstrom box
+    rng = random.RandomState(7)
+    sd = rng.uniform(0.0, 40.0, (30, 3))
+    vectors_a = rng.normal(size=(30, 3))
+    vectors_g = rng.normal(size=(30, 3))
+    midpoints = rng.uniform(0.0, 40.0, (600, 3))
+    return sd, vectors_a, vectors_g, midpoints
+
+
+@pytest.mark.parametrize('cutoff', [3.0, 4.9, 6.0, 12.0])
+@pytest.mark.parametrize('angle', [60.0, 109.5, 360.0])
+def test_cell_list_matches_brute_force(structure, cutoff, angle):
+    expected = met_aromatic_kernel(*structure, cutoff=cutoff, angle=angle)
+    assert len(expected[0])
+    for cell_size in (2.0, cutoff, 10.0):
+        counts = {}
+        found = met_aromatic_kernel(*structure, cutoff=cutoff, angle=angle,
+                                    index=CellList(structure[3], cell_size), counts=counts)
+        assert array_equal(found[0], expected[0])
+        assert array_equal(found[1], expected[1])
+        for values, expected_values in zip(found[2:], expected[2:]):
+            assert allclose(values, expected_values)
+        assert len(expected[0]) <= counts['candidate_pairs'] < 30 * 600
+
+
+def test_conditions(structure):
+    sd, vectors_a, vectors_g, midpoints = structure
+    idx_met, idx_midpoint, norms, theta, phi = met_aromatic_kernel(sd, vectors_a, vectors_g, midpoints, 6.0, 109.5)
+    assert (norms <= 6.0).all()
+    assert ((theta <= 109.5) | (phi <= 109.5)).all()
+    assert allclose(norms, linalg.norm(midpoints[idx_midpoint] - sd[idx_met], axis=1))
+    assert (idx_met[1:] >= idx_met[:-1]).all()  # ordered by Met
+
+
+def test_query_is_superset(structure):
+    midpoints = structure[3]
+    index = CellList(midpoints, 6.0)
+    for point in structure[0]:
+        near = set(index.query(point, 6.0).tolist())
+        assert set((linalg.norm(midpoints - point, axis=1) <= 6.0).nonzero()[0].tolist()) <= near
+    assert len(index.query(array([500.0, 500.0, 500.0]), 6.0)) == 0
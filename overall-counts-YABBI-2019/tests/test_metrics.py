@@ -0,0 +1,77 @@
+"""
+dsw7@sfu.ca
+Tests of the timing instrumentation. Nested stages must not be counted twice so
+the stages of a code add up to its total.
+
+Run with command:
+    $ python -m pytest -v -s test_metrics.py
+
+"""
+
+import gzip
+from json import loads
+from sys import path; path.append(r"../utils")
+from metrics import StageTimer, Metrics
+from filegetter import PDBCache, PDBFile
+
+PDB = """\
+ATOM      1  N   MET A   1      27.340  24.430   2.614  1.00  9.67           N  
+ATOM      2  SD  MET A   1      26.266  25.413   2.842  1.00 10.38           S  
+"""
+
+
+class Clock:
+    # a clock that only moves when told to
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_nested_stages_are_exclusive():
+    clock = Clock()
+    timer = StageTimer('1abc', clock=clock)
+    with timer.stage('parse'):
+        clock.now += 2.0
+        with timer.stage('download'):
+            clock.now += 5.0
+            with timer.stage('decompress'):
+                clock.now += 1.0
+        clock.now += 0.5
+    with timer.stage('download'):
+        clock.now += 3.0
+    assert timer.seconds == {'parse': 2.5, 'download': 8.0, 'decompress': 1.0}
+    assert timer.total() == clock.now - 100.0
+
+
+def test_pdbfile_stages(tmp_path):
+    filepath = tmp_path / 'divided' / 'pdb' / 'ab' / 'pdb1abc.ent.gz'
+    filepath.parent.mkdir(parents=True)
+    with gzip.open(str(filepath), 'wt') as f:
+        f.write(PDB)
+
+    timer = StageTimer('1abc')
+    atoms, _ = PDBFile('1abc', cache=PDBCache(str(tmp_path), offline=True), timer=timer).parse('pdb')
+    assert len(atoms) == 2
+    assert set(timer.seconds) == {'download', 'decompress', 'parse'}
+
+
+def test_metrics_outputs(tmp_path):
+    metrics = Metrics(jsonl=str(tmp_path / 'timings.jsonl'), prometheus=str(tmp_path / 'metrics.prom'))
+    for code, status in (('1abc', 'done'), ('2abc', 'failed')):
+        timer = StageTimer(code)
+        with timer.stage('geometry'):
+            timer.count('candidate_pairs', 10)
+        metrics.add(timer, status)
+    metrics.close()
+
+    records = [loads(line) for line in open(str(tmp_path / 'timings.jsonl'))]
+    assert [record['code'] for record in records] == ['1abc', '2abc']
+    assert records[1]['status'] == 'failed'
+    assert records[0]['counts'] == {'candidate_pairs': 10}
+
+    exposition = open(str(tmp_path / 'metrics.prom')).read()
+    assert 'met_aromatic_codes_total{status="done"} 1' in exposition
+    assert 'met_aromatic_candidate_pairs_total 20' in exposition
+    assert 'met_aromatic_stage_seconds_total{stage="geometry"}' in exposition
@@ -0,0 +1,94 @@
+"""
+dsw7@sfu.ca
+Tests of the single pass PDB parser on small inline PDB snippets.
+
+Run with command:
+    $ python -m pytest -v -s test_pdbparser.py
+
+"""
+
+from sys import path; path.append(r"../utils")
+from pdbparser import parse_pdb, coordinates, residue_labels, group_residues, text
+
+
+def atom(serial, name, resname, resseq, xyz, altloc=' ', icode=' ', chain='A', record='ATOM'):
+    # an ATOM / HETATM record laid out in the fixed columns of the PDB format
+    element, name = name[0], name if len(name) == 4 else ' ' + name
+    return '{:<6}{:>5} {:<4}{}{:>3} {}{:>4}{}   {:8.3f}{:8.3f}{:8.3f}  1.00 20.00           {}\n'.format(
+        record, serial, name, altloc, resname, chain, resseq, icode, *xyz, element
+    )
+
+
+def test_string_crashed_coordinates():
+    line = 'HETATM 5000  O   HOH A 900     -27.595-106.521-108.313  1.00 20.00           O\n'
+    assert line == atom(5000, 'O', 'HOH', 900, (-27.595, -106.521, -108.313), record='HETATM')
+    assert len(line.split()) < 12  # splitting on whitespace would merge the coordinates
+
+    atoms, ec = parse_pdb([line])
+    assert ec is None
+    assert text(atoms['record']) == ['HETATM']
+    assert atoms['serial'].tolist() == [5000]
+    assert (atoms['resname'][0], atoms['chain'][0], atoms['resseq'][0]) == (b'HOH', b'A', 900)
+    assert coordinates(atoms).tolist() == [[-27.595, -106.521, -108.313]]
+
+
+def test_coordinates_round_trip():
+    # float32 cannot hold 1234.567 exactly. coordinates() recovers the value written in the file
+    lines = [atom(1, 'SD', 'MET', 1, (1234.567, -0.001, 9999.999))]
+    atoms, _ = parse_pdb(lines)
+    assert float(atoms['xyz'][0, 0]) != 1234.567
+    assert coordinates(atoms).tolist() == [[1234.567, -0.001, 9999.999]]
+
+
+def test_only_first_model():
+    lines = [
+        'COMPND   3 EC: 3.2.1.17;\n',
+        'MODEL        1\n',
+        atom(1, 'CE', 'MET', 5, (1.0, 2.0, 3.0)),
+        atom(2, 'SD', 'MET', 5, (1.5, 2.5, 3.5)),
+        'ENDMDL\n',
+        'MODEL        2\n',
+        atom(1, 'CE', 'MET', 5, (9.0, 9.0, 9.0)),
+        atom(2, 'SD', 'MET', 5, (9.5, 9.5, 9.5)),
+        'ENDMDL\n',
+        'END\n'
+    ]
+    atoms, ec = parse_pdb(lines)
+    assert ec == '3.2.1.17'
+    assert text(atoms['name']) == ['CE', 'SD']
+    assert coordinates(atoms).tolist() == [[1.0, 2.0, 3.0], [1.5, 2.5, 3.5]]
+
+
+def test_altloc_and_icode():
+    lines = [
+        atom(1, 'CG', 'TYR', 52, (0.0, 0.0, 0.0), altloc='A'),
+        atom(2, 'CG', 'TYR', 52, (0.1, 0.0, 0.0), altloc='B'),
+        atom(3, 'CG', 'PHE', 52, (5.0, 0.0, 0.0), icode='A'),
+        atom(4, 'CD1', 'PHE', 52, (6.0, 0.0, 0.0), icode='A'),
+        atom(5, 'SD', 'MET', 53, (9.0, 0.0, 0.0), chain='B')
+    ]
+    atoms, _ = parse_pdb(lines)
+    assert text(atoms['altloc']) == ['A', 'B', '', '', '']
+    assert text(atoms['icode']) == ['', '', 'A', 'A', '']
+    assert text(atoms['name']) == ['CG', 'CG', 'CG', 'CD1', 'SD']
+    assert text(atoms['chain']) == ['A', 'A', 'A', 'A', 'B']
+    assert residue_labels(atoms) == ['52', '52', '52A', '52A', '53']
+    assert group_residues(atoms).tolist() == [0, 0, 1, 1, 2]
+
+
+def test_overflowed_and_hybrid36_numbers():
+    # serials past 99999 are written as ***** or in hybrid-36 and must not fail the entry
+    lines = [
+        atom('*****', 'SD', 'MET', 1, (0.0, 0.0, 0.0)),
+        atom('A0000', 'CE', 'MET', 1, (1.0, 0.0, 0.0)),
+        atom('a0000', 'CG', 'MET', 'A000', (2.0, 0.0, 0.0))
+    ]
+    atoms, _ = parse_pdb(lines)
+    assert atoms['serial'].tolist() == [0, 100000, 43770016]
+    assert atoms['resseq'].tolist() == [1, 1, 10000]
+
+
+def test_compact_records():
+    # the string fields are held as bytes rather than 4 byte unicode characters
+    atoms, _ = parse_pdb([atom(1, 'SD', 'MET', 1, (0.0, 0.0, 0.0))])
+    assert atoms.dtype.itemsize < 48
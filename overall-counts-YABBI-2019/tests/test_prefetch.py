@@ -0,0 +1,66 @@
+"""
+dsw7@sfu.ca
+Tests of the prefetcher against a local HTTP server. See conftest.py.
+
+Run with command:
+    $ python -m pytest -v -s test_prefetch.py
+
+"""
+
+import gzip
+from sys import path; path.append(r"../utils")
+from filegetter import PDBCache
+from prefetch import Prefetcher
+from conftest import ArchiveHandler, CODES
+from time import sleep
+
+
+def test_prefetch_in_order(archive, tmp_path):
+    cache = PDBCache(str(tmp_path / 'mirror'), url=archive, timeout=5.0)
+    prefetcher, taken = Prefetcher(cache, CODES, depth=4, per_host=2), []
+    for code in prefetcher:
+        with gzip.open(cache.path_to(code), 'rt') as f:
+            assert f.readline().split()[1] == code.upper()
+        taken.append(code)
+    assert taken == CODES
+    assert not prefetcher.failed
+
+
+def test_prefetch_depth(archive, tmp_path):
+    cache = PDBCache(str(tmp_path / 'mirror'), url=archive, timeout=5.0)
+    for taken, code in enumerate(Prefetcher(cache, CODES, depth=3, per_host=2), 1):
+        sleep(0.05)  # slow consumer
+        assert len(list(cache._entries())) <= taken + 3
+
+
+def test_prefetch_missing_and_timeout(archive, tmp_path):
+    cache = PDBCache(str(tmp_path / 'mirror'), url=archive, timeout=5.0)
+    codes = ['9zzz'] + CODES[:2]
+    prefetcher = Prefetcher(cache, codes, depth=2, per_host=1)
+    assert list(prefetcher) == codes
+    assert list(prefetcher.failed) == ['9zzz']
+
+    ArchiveHandler.delay = 1.0
+    cache = PDBCache(str(tmp_path / 'slow_mirror'), url=archive, timeout=5.0)
+    prefetcher = Prefetcher(cache, CODES[:2], depth=2, per_host=2, timeout=0.2)
+    assert list(prefetcher) == CODES[:2]
+    assert sorted(prefetcher.failed) == CODES[:2]
+
+
+def test_timed_out_downloads_hold_host_slot(archive, tmp_path):
+    # downloads that timed out keep their host slot and are never started twice
+    ArchiveHandler.delay = 0.3
+    cache = PDBCache(str(tmp_path / 'mirror'), url=archive, timeout=5.0)
+    prefetcher = Prefetcher(cache, CODES[:4], depth=4, per_host=1, timeout=0.05)
+    for code in prefetcher:
+        with gzip.open(cache.get(code), 'rt') as f:  # the consumer reads the entry as MetAromatic would
+            assert f.readline().split()[1] == code.upper()
+    assert sorted(prefetcher.failed) == CODES[:4]
+    assert sorted(ArchiveHandler.requests) == sorted(set(ArchiveHandler.requests))
+    assert len(ArchiveHandler.requests) == 4
+
+    ArchiveHandler.peak, ArchiveHandler.requests = 0, []
+    cache = PDBCache(str(tmp_path / 'other_mirror'), url=archive, timeout=5.0)
+    assert list(Prefetcher(cache, CODES[4:8], depth=4, per_host=1, timeout=0.05)) == CODES[4:8]
+    assert ArchiveHandler.peak == 1
+    assert len(list(cache._entries())) == 4
@@ -0,0 +1,65 @@
+"""
+dsw7@sfu.ca
+Tests of the summary index. An entry must only be skipped if the Met-aromatic
+algorithm cannot produce a result for it.
+
+Run with command:
+    $ python -m pytest -v -s test_summary.py
+
+"""
+
+from sys import path; path.append(r"../utils")
+from numpy import array, cos, sin, pi
+from pdbparser import ATOM_TABLE
+from summary import Summary
+from ma import MetAromatic
+
+RING = ('CG', 'CD2', 'CE2', 'CZ', 'CE1', 'CD1')
+
+
+def structure(offset, chain_met='A', chain_tyr='A', metal=False):
+    # a Met with its SD at the origin and a Tyr ring centred offset Angstroms away along x
+    rows = [
+        ('ATOM', 1, 'CE', '', 'MET', chain_met, 1, '', (-1.0, 1.0, 0.0)),
+        ('ATOM', 2, 'CG', '', 'MET', chain_met, 1, '', (-1.0, -1.0, 0.0)),
+        ('ATOM', 3, 'SD', '', 'MET', chain_met, 1, '', (0.0, 0.0, 0.0))
+    ]
+    for i, name in enumerate(RING):
+        xyz = (offset + 1.4 * cos(i * pi / 3), 1.4 * sin(i * pi / 3), 0.0)
+        rows.append(('ATOM', 4 + i, name, '', 'TYR', chain_tyr, 2, '', xyz))
+    if metal:
+        rows.append(('HETATM', 10, 'ZN', '', 'ZN', chain_met, 900, '', (0.0, 0.0, 5.0)))
+    return array(rows, dtype=ATOM_TABLE), None
+
+
+def results(parsed, chain, cutoff, inter_chain=False):
+    ma = MetAromatic('1abc', chain=chain, cutoff=cutoff, angle=360.0, inter_chain=inter_chain, parsed=parsed)
+    return ma.met_aromatic()
+
+
+def test_can_pair_matches_results(tmp_path):
+    summary = Summary(str(tmp_path / 'summary.npy'))
+    entries = {'1abc': structure(4.0), '2abc': structure(8.0), '3abc': structure(5.0, chain_tyr='B')}
+    for code, parsed in entries.items():
+        summary.add(code, *parsed)
+    summary.save()
+    summary = Summary(str(tmp_path / 'summary.npy'))
+
+    for code, parsed in entries.items():
+        for chain, inter_chain in (('A', False), ('B', False), ('all', False), ('all', True)):
+            for cutoff in (3.0, 4.0, 6.0, 9.0, 12.0):
+                found = len(results(parsed, chain, cutoff, inter_chain)) > 0
+                assert summary.can_pair(code, chain, cutoff, inter_chain) == found or \
+                    (cutoff > 10.0 and summary.can_pair(code, chain, cutoff, inter_chain))
+
+
+def test_filters(tmp_path):
+    summary = Summary(str(tmp_path / 'summary.npy'))
+    summary.add('1abc', *structure(4.0, metal=True))
+    summary.add('2abc', *structure(4.0))
+    summary.save()
+
+    assert summary.can_pair('1abc', metals=True)
+    assert not summary.can_pair('2abc', metals=True)
+    assert not summary.can_pair('1abc', min_aromatics=2)
+    assert summary.can_pair('9zzz')  # entries missing from the index are never skipped
@@ -9,6 +9,7 @@ This was a JJW request. Generates the new collection:
 
 # -------------------------------------------------------------------------------------------
 from pymongo import MongoClient
+from indexes import ensure_indexes
 
 mongoport = 27017
 mongohost = "localhost"
@@ -27,6 +28,9 @@ def apply_angular_condition(query_database, name_collection_out="non_redundant_1
     :return: A new collection where "result" field is a boolean indicating whether condition is true or false
     """
 
+    # $match on met-theta / met-phi reads from the met_theta and met_phi indexes
+    ensure_indexes(client[query_database]['non_redundant_no_ang_limit'])
+
     query = [
         {
             "$match": {
@@ -0,0 +1,245 @@
+# Written by David Weber
+# dsw7@sfu.ca
+
+"""
+In this namespace I house a binary store of pre-parsed atom tables. Each atom
+is a fixed width record of float32 coordinates and small integer codes for the
+record type, atom name, residue name, chain, alternate location and insertion
+code. The store is a directory of three files:
+
+    atoms.bin   -- the records of all structures back to back
+    index.npy   -- code, offset and number of records and EC classifier per structure, sorted by code
+    vocab.json  -- the strings behind the integer codes of each field
+
+The records file is memory mapped so reading a structure is a slice of the map
+followed by a vectorized lookup of its strings. Nothing is decompressed or
+parsed. The store is built once with convert.py.
+"""
+
+# ------------------------------------------------------------------------------
+
+from json import load, dump
+from os import path, makedirs, replace
+from numpy import array
+from numpy import dtype
+from numpy import empty
+from numpy import iinfo
+from numpy import load as load_npy
+from numpy import memmap
+from numpy import save
+from numpy import searchsorted
+from pdbparser import ATOM_TABLE
+from pdbparser import text
+
+# string fields of the atom table and the integer type of their codes
+CODED_FIELDS = {
+    'record': 'u1',
+    'name': 'u2',
+    'altloc': 'u1',
+    'resname': 'u2',
+    'chain': 'u2',  # mmCIF structures bring many distinct chain identifiers
+    'icode': 'u1'
+}
+
+STORE_RECORD = dtype([
+    (field, CODED_FIELDS.get(field, ATOM_TABLE.fields[field][0])) for field in ATOM_TABLE.names
+])
+
+STORE_INDEX = dtype([
+    ('code', 'U4'),
+    ('offset', 'i8'),
+    ('count', 'i8'),
+    ('ec', 'U32')
+])
+
+ATOMS_FILE = 'atoms.bin'
+INDEX_FILE = 'index.npy'
+VOCAB_FILE = 'vocab.json'
+
+
+def check_layout(root, index):
+    # a records file too short for its index was written with another record layout. An interrupted
+    # writer may leave records past the end of the index behind, which are never read
+    size = path.getsize(path.join(root, ATOMS_FILE))
+    end = (index['offset'] + index['count']).max() if len(index) else 0
+    if (size % STORE_RECORD.itemsize) or (size < end * STORE_RECORD.itemsize):
+        raise ValueError('Store {} does not match the current record layout. Rebuild it with convert.py'.format(root))
+
+
+class AtomStore:
+    def __init__(self, root):
+        """Initialize a read only AtomStore object over a store directory
+
+        Parameters
+        ----------
+        root : path to a store written by an AtomStoreWriter
+
+        Examples
+        --------
+        >>> store = AtomStore('/data/atomstore')
+        >>> if '1rcy' in store:
+        ...     atoms, ec = store.get('1rcy')
+
+        """
+        self.root = root
+        with open(path.join(root, VOCAB_FILE)) as f:
+            self.vocab = {field: array(strings, dtype=ATOM_TABLE.fields[field][0]) for field, strings in load(f).items()}
+        self.index = load_npy(path.join(root, INDEX_FILE))
+        self.atoms = None
+        check_layout(root, self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, code):
+        return self._find(code) is not None
+
+    def _find(self, code):
+        code = code.lower()
+        i = searchsorted(self.index['code'], code)
+        if (i < len(self.index)) and (self.index['code'][i] == code):
+            return self.index[i]
+        return None
+
+    def _map(self):
+        # mapped on first use such that forked workers do not share a map opened by the parent
+        if self.atoms is None:
+            if path.getsize(path.join(self.root, ATOMS_FILE)):
+                self.atoms = memmap(path.join(self.root, ATOMS_FILE), dtype=STORE_RECORD, mode='r')
+            else:
+                self.atoms = empty(0, dtype=STORE_RECORD)
+        return self.atoms
+
+    def records(self, code):
+        """
+        Returns the raw records of a structure as a view of the memory map.
+        String fields hold integer codes into self.vocab.
+
+        Parameters
+        ----------
+        code : the pdb code of interest
+
+        """
+        entry = self._find(code)
+        if entry is None:
+            raise KeyError('{} is not in store {}'.format(code, self.root))
+        return self._map()[entry['offset']:entry['offset'] + entry['count']]
+
+    def get(self, code):
+        """
+        Returns the atom table and EC classifier of a structure in the same
+        form as parse_pdb().
+
+        Parameters
+        ----------
+        code : the pdb code of interest
+
+        Examples
+        --------
+        >>> atoms, ec = AtomStore('/data/atomstore').get('1rcy')
+
+        """
+        records = self.records(code)
+        atoms = empty(len(records), dtype=ATOM_TABLE)
+        for field in ATOM_TABLE.names:
+            if field in CODED_FIELDS:
+                atoms[field] = self.vocab[field][records[field]]
+            else:
+                atoms[field] = records[field]
+        return atoms, str(self._find(code)['ec']) or None
+
+
+class AtomStoreWriter:
+    def __init__(self, root):
+        """Initialize an AtomStoreWriter object over a store directory
+
+        Parameters
+        ----------
+        root : path to the store
+            The directory is created if missing. Structures are appended to
+            an existing store and codes already in the store are skipped.
+
+        Examples
+        --------
+        >>> writer = AtomStoreWriter('/data/atomstore')
+        >>> writer.add('1rcy', *parse_pdb(PDBFile('1rcy').stream()))
+        >>> writer.close()
+
+        """
+        self.root = root
+        makedirs(root, exist_ok=True)
+
+        self.vocab = {field: {} for field in CODED_FIELDS}
+        self.entries = []
+        if path.exists(path.join(root, INDEX_FILE)):
+            with open(path.join(root, VOCAB_FILE)) as f:
+                for field, strings in load(f).items():
+                    self.vocab[field] = {string: i for i, string in enumerate(strings)}
+            index = load_npy(path.join(root, INDEX_FILE))
+            check_layout(root, index)
+            self.entries = [tuple(entry) for entry in index]
+
+        self.codes = {entry[0] for entry in self.entries}
+        self.file = open(path.join(root, ATOMS_FILE), 'ab')
+        self.offset = self.file.tell() // STORE_RECORD.itemsize
+
+    def __contains__(self, code):
+        return code.lower() in self.codes
+
+    def encode(self, field, strings):
+        # map strings onto integer codes, adding unseen strings to the vocabulary
+        vocab = self.vocab[field]
+        codes = empty(len(strings), dtype=CODED_FIELDS[field])
+        for i, string in enumerate(text(strings)):
+            code = vocab.get(string)
+            if code is None:
+                code = vocab[string] = len(vocab)
+                if code > iinfo(CODED_FIELDS[field]).max:
+                    raise ValueError('Too many distinct values of {} for the store'.format(field))
+            codes[i] = code
+        return codes
+
+    def add(self, code, atoms, ec=None):
+        """
+        Appends the atom table of a structure to the store
+
+        Parameters
+        ----------
+        code : the pdb code of the structure
+        atoms : structured array of dtype ATOM_TABLE, i.e. from parse_pdb()
+        ec : the EC classifier of the structure, or None
+
+        """
+        code = code.lower()
+        if code in self.codes:
+            return
+
+        records = empty(len(atoms), dtype=STORE_RECORD)
+        for field in ATOM_TABLE.names:
+            if field in CODED_FIELDS:
+                records[field] = self.encode(field, atoms[field])
+            else:
+                records[field] = atoms[field]
+
+        self.file.write(records.tobytes())
+        self.entries.append((code, self.offset, len(records), ec or ''))
+        self.codes.add(code)
+        self.offset += len(records)
+
+    def close(self):
+        # the index and vocabulary are replaced atomically after the records hit the disk
+        self.file.close()
+
+        index = array(self.entries, dtype=STORE_INDEX)
+        index.sort(order='code')
+        with open(path.join(self.root, INDEX_FILE + '.part'), 'wb') as f:
+            save(f, index)
+
+        vocab = {}
+        for field, strings in self.vocab.items():
+            vocab[field] = sorted(strings, key=strings.get)
+        with open(path.join(self.root, VOCAB_FILE + '.part'), 'w') as f:
+            dump(vocab, f)
+
+        replace(path.join(self.root, VOCAB_FILE + '.part'), path.join(self.root, VOCAB_FILE))
+        replace(path.join(self.root, INDEX_FILE + '.part'), path.join(self.root, INDEX_FILE))
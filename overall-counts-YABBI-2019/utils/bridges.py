@@ -0,0 +1,120 @@
+# Written by David Weber
+# dsw7@sfu.ca
+
+"""
+A lightweight union-find (disjoint set) engine for finding bridging interactions.
+Met-aromatic pairs of a structure are edges of a graph and n-bridges are the
+connected components with n aromatic residues bridged by a single methionine.
+This replaces building a NetworkX graph for every structure.
+"""
+
+# ------------------------------------------------------------------------------
+
+AROMATICS = ('PHE', 'TYR', 'TRP')
+BRIDGE_TYPES = ('PHE-PHE', 'TYR-TYR', 'TRP-TRP', 'TYR-TRP', 'PHE-TYR', 'PHE-TRP')
+
+# both orderings of a pair of aromatics map onto one unordered bridge type
+ORDERED_TYPES = {}
+for bridge_type in BRIDGE_TYPES:
+    first, second = bridge_type.split('-')
+    ORDERED_TYPES['{}-{}'.format(first, second)] = bridge_type
+    ORDERED_TYPES['{}-{}'.format(second, first)] = bridge_type
+
+DIGITS = str.maketrans('', '', '0123456789')
+
+
+class UnionFind:
+    """
+    A disjoint set over string labels backed by flat lists of integers. Each
+    label is mapped to an integer node the first time it is seen. Unions are by
+    size and finds use path halving. The lists are cleared rather than
+    reallocated between structures.
+    """
+    def __init__(self):
+        self.ids = {}
+        self.labels = []
+        self.parent = []
+        self.size = []
+
+    def clear(self):
+        self.ids.clear()
+        del self.labels[:], self.parent[:], self.size[:]
+
+    def node(self, label):
+        # get the integer node for a label, adding the label if unseen
+        i = self.ids.get(label)
+        if i is None:
+            i = self.ids[label] = len(self.labels)
+            self.labels.append(label)
+            self.parent.append(i)
+            self.size.append(1)
+        return i
+
+    def find(self, i):
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, i, j):
+        root_i, root_j = self.find(i), self.find(j)
+        if root_i == root_j:
+            return
+        if self.size[root_i] < self.size[root_j]:
+            root_i, root_j = root_j, root_i
+        self.parent[root_j] = root_i
+        self.size[root_i] += self.size[root_j]
+
+    def components(self):
+        # group labels by the root of their set
+        groups = {}
+        for i, label in enumerate(self.labels):
+            groups.setdefault(self.find(i), []).append(label)
+        return list(groups.values())
+
+
+def iter_bridges(entries, n=2, remove_inverse=True):
+    """
+    Function for finding n-bridges in a single streaming pass over the documents
+    of a pairs collection
+    Parameters:
+        entries        -> iterable of documents of form {'code': ..., 'EC': ..., 'pairs': ['TYR123|MET123', ...]}
+        n              -> 2-bridge, 3-bridge, 4-bridge, ..., n-bridge
+        remove_inverse -> drop inverse bridges, i.e. MET-ARO-MET
+    Returns:
+        A generator of documents of form {'code': ..., 'EC': ..., 'bridge': ['TYR123', 'MET123', 'PHE456']}
+    """
+    forest = UnionFind()
+    for entry in entries:
+        forest.clear()
+        for pair in entry.get('pairs'):
+            aromatic, methionine = pair.split('|')  # 'TYR123|MET123' -> ('TYR123', 'MET123')
+            forest.union(forest.node(aromatic), forest.node(methionine))
+
+        for component in forest.components():
+            if len(component) != n + 1:
+                continue
+            if remove_inverse and ''.join(component).count('MET') != 1:
+                continue
+            yield {
+                'code': entry.get('code'),
+                'EC': entry.get('EC'),
+                'bridge': component
+            }
+
+
+def classify_bridge(bridge):
+    """
+    Function for classifying a bridge by the aromatic residues it contains
+    Parameters:
+        bridge -> a list of residues of form ['TYR123', 'MET123', 'PHE456']
+    Returns:
+        One of BRIDGE_TYPES, i.e. 'PHE-TYR', or None if the bridge is of no type
+    """
+    aromatics = list(bridge)
+    for residue in aromatics:
+        if 'MET' in residue:
+            aromatics.remove(residue)
+            break
+    return ORDERED_TYPES.get('-'.join(aromatics).translate(DIGITS))
@@ -0,0 +1,293 @@
+# Written by David Weber
+# dsw7@sfu.ca
+
+"""
+In this namespace I house readers for the mmCIF and BinaryCIF formats. The
+largest structures in the PDB (ribosomes, capsids and so on) are not
+distributed as legacy PDB files at all. Both readers produce the same atom
+table as parse_pdb() such that MetAromatic consumes them unchanged. Author
+(auth_*) identifiers are used where present since these are the identifiers
+written to legacy PDB files. BinaryCIF columns are decoded straight into NumPy
+arrays without ever producing a string per value. BinaryCIF requires msgpack.
+"""
+
+# ------------------------------------------------------------------------------
+
+try:
+    import msgpack
+except ImportError:  # msgpack is only needed for BinaryCIF
+    msgpack = None
+
+from re import compile
+from numpy import array
+from numpy import asarray
+from numpy import concatenate
+from numpy import cumsum
+from numpy import empty
+from numpy import flatnonzero
+from numpy import frombuffer
+from numpy import int32
+from numpy import ones
+from numpy import repeat
+from numpy import stack
+from numpy import where
+from pdbparser import ATOM_TABLE
+
+# (atom table field, mmCIF items in order of preference)
+ATOM_SITE_ITEMS = (
+    ('record', ('group_PDB',)),
+    ('serial', ('id',)),
+    ('name', ('auth_atom_id', 'label_atom_id')),
+    ('altloc', ('label_alt_id',)),
+    ('resname', ('auth_comp_id', 'label_comp_id')),
+    ('chain', ('auth_asym_id', 'label_asym_id')),
+    ('resseq', ('auth_seq_id', 'label_seq_id')),
+    ('icode', ('pdbx_PDB_ins_code',)),
+    ('x', ('Cartn_x',)),
+    ('y', ('Cartn_y',)),
+    ('z', ('Cartn_z',)),
+    ('model', ('pdbx_PDB_model_num',))
+)
+
+MISSING = ('.', '?', '')  # '' is a masked BinaryCIF value
+
+# a value is either quoted ('...' or "...", closed by a quote followed by whitespace) or a bare token
+TOKEN = compile(r"""'(.*?)'(?=\s|$)|"(.*?)"(?=\s|$)|(\S+)""")
+
+# BinaryCIF ByteArray type codes
+BYTE_TYPES = {1: '<i1', 2: '<i2', 3: '<i4', 4: '<u1', 5: '<u2', 6: '<u4', 32: '<f4', 33: '<f8'}
+
+
+def tokenize(line):
+    # most lines hold no quotes and split on whitespace
+    if ('"' not in line) and ("'" not in line):
+        return line.split()
+    return [single or double or bare for single, double, bare in TOKEN.findall(line)]
+
+
+def read_categories(lines, categories):
+    """
+    Function for reading the items of some categories of the first data block of an mmCIF file
+    Parameters:
+        lines      -> any iterable of mmCIF file lines, i.e. an open file
+        categories -> a dict of category names, i.e. '_atom_site', to the items of interest,
+                      or to None for all items
+    Returns:
+        A dict of category name to a dict of item name to a list of string values.
+        Categories missing from the file are missing from the dict.
+    """
+    tables = {}
+    in_loop, columns, count = False, [], 0  # the columns of the current loop and the index of the next value
+    kept = []  # (index, column) of the columns of interest of the current loop
+    expecting, target = False, None  # a key-value item waiting for its value and the list it goes to
+    text = None  # lines of a multi-line text field
+    in_block = False
+
+    def wanted(tag):
+        category, _, item = tag.partition('.')
+        if (category not in categories) or ((categories[category] is not None) and (item not in categories[category])):
+            return None
+        return tables.setdefault(category, {}).setdefault(item, [])
+
+    def emit(value):
+        nonlocal expecting, count
+        if expecting:
+            if target is not None:
+                target.append(value)
+            expecting = False
+        elif in_loop and columns:
+            column = columns[count % len(columns)]
+            if column is not None:
+                column.append(value)
+            count += 1
+
+    for line in lines:
+        if text is not None:
+            if line.startswith(';'):
+                emit('\n'.join(text).strip())
+                text = None
+            else:
+                text.append(line.rstrip('\r\n'))
+            continue
+
+        if line.startswith(';'):
+            text = [line[1:].rstrip('\r\n')]
+            continue
+
+        tokens = tokenize(line)
+        if (not tokens) or tokens[0].startswith('#'):
+            continue
+
+        head = tokens[0]
+        if head.startswith('data_'):
+            if in_block:  # only the first data block is read
+                break
+            in_block = True
+        elif head == 'loop_':
+            in_loop, columns, kept, count = True, [], [], 0
+        elif head.startswith('_'):
+            if in_loop and (count == 0):
+                columns.append(wanted(head))  # still reading the header of the loop
+                if columns[-1] is not None:
+                    kept.append((len(columns) - 1, columns[-1]))
+                continue
+            in_loop, columns, kept, count = False, [], [], 0
+            expecting, target = True, wanted(head)
+            if len(tokens) > 1:
+                emit(tokens[1])
+        elif in_loop and (not expecting) and (len(tokens) == len(columns)) and (count % len(columns) == 0):
+            # fast path: one whole row of a loop per line, as in _atom_site
+            for i, column in kept:
+                column.append(tokens[i])
+            count += len(tokens)
+        else:
+            for token in tokens:
+                emit(token)
+
+    return tables
+
+
+def first_ec(values):
+    # i.e. ['?', '3.2.1.17, 3.2.1.18'] -> '3.2.1.17'
+    for value in values:
+        if value not in MISSING:
+            return value.split(',')[0].strip()
+    return None
+
+
+def build_atom_table(columns):
+    """
+    Function for assembling an atom table from the columns of _atom_site
+    Parameters:
+        columns -> dict of atom table field (and 'x', 'y', 'z' and 'model') to an array of values.
+                   Missing values are empty strings or zeros.
+    Returns:
+        A structured array of dtype ATOM_TABLE holding the atoms of the first model
+    """
+    keep = ones(len(columns['x']), dtype=bool)
+    if (columns.get('model') is not None) and len(keep):
+        keep = asarray(columns['model']) == columns['model'][0]
+
+    atoms = empty(int(keep.sum()), dtype=ATOM_TABLE)
+    for field in ATOM_TABLE.names:
+        if field == 'xyz':
+            atoms['xyz'] = stack([asarray(columns[axis], dtype='f8')[keep] for axis in 'xyz'], axis=1)
+        elif columns.get(field) is None:
+            atoms[field] = 0 if atoms.dtype[field].kind == 'i' else ''
+        else:
+            atoms[field] = asarray(columns[field])[keep]
+    return atoms
+
+
+def parse_mmcif(lines):
+    """
+    Function for reading the atom records of the first model in an mmCIF file
+    Parameters:
+        lines -> any iterable of mmCIF file lines, i.e. an open file
+    Returns:
+        atoms -> structured array of dtype ATOM_TABLE
+        ec    -> the first EC classifier listed under _entity.pdbx_ec, or None
+    """
+    items = {item for _, preferred in ATOM_SITE_ITEMS for item in preferred}
+    tables = read_categories(lines, {'_atom_site': items, '_entity': {'pdbx_ec'}})
+    atom_site = tables.get('_atom_site', {})
+
+    columns = {}
+    for field, preferred in ATOM_SITE_ITEMS:
+        values = next((atom_site[item] for item in preferred if item in atom_site), None)
+        if values is None:
+            columns[field] = [] if field in ('x', 'y', 'z') else None
+            continue
+        values = array(values)
+        values[(values == '.') | (values == '?')] = '0' if field in ('serial', 'resseq', 'model') else ''
+        columns[field] = values
+    for field in ('serial', 'resseq'):
+        if columns[field] is not None:
+            columns[field] = columns[field].astype(int32)
+
+    return build_atom_table(columns), first_ec(tables.get('_entity', {}).get('pdbx_ec', []))
+
+
+def decode(encoded):
+    """
+    Function for decoding a BinaryCIF encoded data object into a NumPy array
+    Parameters:
+        encoded -> a dict holding 'data' and the list of 'encoding' steps applied to it
+    Returns:
+        An array of numbers, or of strings for StringArray encoded data
+    """
+    data = encoded['data']
+    for encoding in reversed(encoded['encoding']):
+        kind = encoding['kind']
+        if kind == 'ByteArray':
+            data = frombuffer(data, dtype=BYTE_TYPES[encoding['type']])
+        elif kind == 'FixedPoint':
+            data = data / encoding['factor']
+        elif kind == 'IntervalQuantization':
+            step = (encoding['max'] - encoding['min']) / max(encoding['numSteps'] - 1, 1)
+            data = encoding['min'] + step * data
+        elif kind == 'RunLength':
+            data = repeat(data[0::2], data[1::2])
+        elif kind == 'Delta':
+            data = cumsum(data.astype(BYTE_TYPES[encoding['srcType']])) + encoding['origin']
+        elif kind == 'IntegerPacking':
+            # values beyond the packed range are split into a run of limit values plus a remainder
+            data = data.astype(int32)
+            upper = (1 << (8 * encoding['byteCount'] - (0 if encoding['isUnsigned'] else 1))) - 1
+            at_limit = (data == upper) if encoding['isUnsigned'] else (data == upper) | (data == -upper - 1)
+            ends = flatnonzero(~at_limit)
+            total = cumsum(data)[ends]
+            data = concatenate([total[:1], total[1:] - total[:-1]])
+        elif kind == 'StringArray':
+            strings = encoding['stringData']
+            offsets = decode({'data': encoding['offsets'], 'encoding': encoding['offsetEncoding']})
+            words = array([strings[start:end] for start, end in zip(offsets[:-1], offsets[1:])] + [''])
+            data = words[decode({'data': data, 'encoding': encoding['dataEncoding']})]  # -1 -> ''
+        else:
+            raise ValueError('Unknown BinaryCIF encoding: {}'.format(kind))
+    return data
+
+
+def decode_column(column):
+    # masked values (1 = '.', 2 = '?') become empty strings or zeros
+    values = decode(column['data'])
+    if column.get('mask') is not None:
+        masked = decode(column['mask']) != 0
+        if masked.any():
+            values = where(masked, '' if values.dtype.kind == 'U' else 0, values)
+    return values
+
+
+def parse_bcif(data):
+    """
+    Function for reading the atom records of the first model in a BinaryCIF file
+    Parameters:
+        data -> the contents of a BinaryCIF file (bytes)
+    Returns:
+        atoms -> structured array of dtype ATOM_TABLE
+        ec    -> the first EC classifier listed under _entity.pdbx_ec, or None
+    """
+    if msgpack is None:
+        raise ImportError('Reading BinaryCIF requires msgpack: $ pip install msgpack')
+
+    block = msgpack.unpackb(data, raw=False)['dataBlocks'][0]
+    categories = {category['name'].lstrip('_'): category for category in block['categories']}
+
+    atom_site = {column['name']: column for column in categories.get('atom_site', {'columns': []})['columns']}
+    columns = {}
+    for field, preferred in ATOM_SITE_ITEMS:
+        column = next((atom_site[item] for item in preferred if item in atom_site), None)
+        if column is None:
+            columns[field] = [] if field in ('x', 'y', 'z') else None
+            continue
+        values = decode_column(column)
+        if (field in ('serial', 'resseq')) and (values.dtype.kind == 'U'):
+            values = where(values == '', '0', values).astype(int32)
+        columns[field] = values
+
+    ec = None
+    if 'entity' in categories:
+        for column in categories['entity']['columns']:
+            if column['name'] == 'pdbx_ec':
+                ec = first_ec(decode_column(column).tolist())
+    return build_atom_table(columns), ec
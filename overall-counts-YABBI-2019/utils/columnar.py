@@ -0,0 +1,415 @@
+# Written by David Weber
+# dsw7@sfu.ca
+
+"""
+In this namespace I house a local columnar store for Met-aromatic results that
+can stand in for MongoDB on machines without a database server. Documents are
+kept in Parquet files laid out as:
+
+    {root}/{database}/{collection}/cutoff=6/angle=109.5/model=cp/ec_class=1/part-*.parquet
+
+The classes mimic the small part of the pymongo API used by runner.py and
+analyze.py such that both scripts work against either backend. Filters are
+translated into pyarrow expressions so partitions and row groups that cannot
+match a query are never read. Requires pyarrow.
+"""
+
+# ------------------------------------------------------------------------------
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is only needed for the columnar store
+    pa = None
+
+from functools import reduce
+from operator import and_, or_
+from os import path, walk, remove
+from shutil import rmtree
+from uuid import uuid4
+from writer import BulkWriter
+
+if pa is not None:
+    # typed columns of Met-aromatic documents. The types of any other columns are inferred
+    COLUMN_TYPES = {
+        '_id': pa.string(),
+        'code': pa.string(),
+        'aro': pa.string(),
+        'arores': pa.string(),
+        'met': pa.string(),
+        'norm': pa.float64(),
+        'met-theta': pa.float64(),
+        'met-phi': pa.float64(),
+        'ec': pa.string(),
+        'aro-chain': pa.string(),
+        'met-chain': pa.string(),
+        'inserted': pa.timestamp('us')
+    }
+
+    # run parameters and the EC class, i.e. 1.2.3.56 -> 1, are stored in directory names
+    PARTITION_SCHEMA = pa.schema([
+        ('cutoff', pa.float64()),
+        ('angle', pa.float64()),
+        ('model', pa.string()),
+        ('ec_class', pa.string())
+    ])
+
+    OPERATORS = {
+        '$eq': lambda field, value: field == value,
+        '$ne': lambda field, value: field != value,
+        '$lt': lambda field, value: field < value,
+        '$lte': lambda field, value: field <= value,
+        '$gt': lambda field, value: field > value,
+        '$gte': lambda field, value: field >= value,
+        '$in': lambda field, value: field.isin(value),
+        '$nin': lambda field, value: ~field.isin(value),
+        '$exists': lambda field, value: field.is_valid() if value else ~field.is_valid()
+    }
+
+
+def to_expression(query):
+    """
+    Function for translating a MongoDB filter into a pyarrow expression. Supports
+    equality, $eq, $ne, $lt, $lte, $gt, $gte, $in, $nin, $exists, $and and $or.
+    Parameters:
+        query -> a MongoDB filter, i.e. {'$or': [{'met-theta': {'$lte': 109.5}}, {'met-phi': {'$lte': 109.5}}]}
+    Returns:
+        A pyarrow expression or None if the filter is empty
+    """
+    expressions = []
+    for key, value in (query or {}).items():
+        if key in ('$and', '$or'):
+            expressions.append(reduce(and_ if key == '$and' else or_, [to_expression(q) for q in value]))
+        elif isinstance(value, dict):
+            expressions.extend(OPERATORS[op](pc.field(key), arg) for op, arg in value.items())
+        else:
+            expressions.append(pc.field(key) == value)
+    return reduce(and_, expressions) if expressions else None
+
+
+def to_table(documents):
+    # build a table from documents and cast known columns to their types
+    table = pa.Table.from_pylist(documents)
+    for i, name in enumerate(table.column_names):
+        if name in COLUMN_TYPES:
+            table = table.set_column(i, name, table.column(name).cast(COLUMN_TYPES[name]))
+        elif name in PARTITION_SCHEMA.names:
+            table = table.set_column(i, name, table.column(name).cast(PARTITION_SCHEMA.field(name).type))
+    return table
+
+
+def partition_values(table):
+    # the partition values of every row of a table, one tuple over PARTITION_SCHEMA per row
+    columns = [
+        table.column(name).to_pylist() if name in table.column_names else [None] * table.num_rows
+        for name in PARTITION_SCHEMA.names
+    ]
+    shared = {}  # one tuple object per partition
+    return [shared.setdefault(values, values) for values in zip(*columns)]
+
+
+def latest(table):
+    # keep the last row of each _id, i.e. a code added twice to one batch
+    if pc.count_distinct(table.column('_id')).as_py() == table.num_rows:
+        return table
+    rows = table.append_column('__row', pa.array(range(table.num_rows), pa.int64()))
+    return table.take(rows.group_by('_id').aggregate([('__row', 'max')]).column('__row_max'))
+
+
+class ParquetCollection:
+    def __init__(self, root, name):
+        """Initialize a collection of documents stored in Parquet files
+
+        Parameters
+        ----------
+        root : path to the database directory
+        name : name of the collection
+            The files of the collection are kept under {root}/{name}.
+
+        Examples
+        --------
+        >>> col = ParquetCollection('/data/parquet/ma', 'non_redundant_1095_ang_limit')
+        >>> codes = col.distinct('code', {'met-theta': {'$lte': 109.5}})
+
+        """
+        if pa is None:
+            raise ImportError('The columnar store requires pyarrow. Install with: $ pip install pyarrow')
+        self.name = name
+        self.path = path.join(root, name)
+        self.ids = None  # _id -> partition values of the stored documents, read on the first write
+
+    def _files(self):
+        files = []
+        for dirpath, _, filenames in walk(self.path):
+            files.extend(path.join(dirpath, f) for f in filenames if f.endswith('.parquet'))
+        return sorted(files)
+
+    def _dataset(self, files=None):
+        files = self._files() if files is None else files
+        if not files:
+            return None
+
+        # a collection is only partitioned on the keys present in its directory names
+        keys = {part.split('=')[0] for part in path.relpath(files[0], self.path).split(path.sep)[:-1]}
+        if keys:
+            schema = pa.schema([field for field in PARTITION_SCHEMA if field.name in keys])
+            partitioning = ds.partitioning(schema, flavor='hive')
+        else:
+            partitioning = None
+        return ds.dataset(files, format='parquet', partitioning=partitioning, partition_base_dir=self.path)
+
+    def _columns(self, dataset, projection):
+        # map a MongoDB projection onto a list of columns
+        if not projection:
+            return None
+        included = [name for name, value in projection.items() if value and name in dataset.schema.names]
+        if not included:
+            return [name for name in dataset.schema.names if projection.get(name, 1)]
+        if projection.get('_id', 1) and '_id' in dataset.schema.names and '_id' not in included:
+            included.append('_id')
+        return included
+
+    def _stored(self):
+        # read the _id and partition values of the stored documents once. Writes keep them up to date
+        if self.ids is None:
+            self.ids = {}
+            table = self.scan(['_id'] + PARTITION_SCHEMA.names)
+            if (table is not None) and ('_id' in table.column_names):
+                self.ids.update(zip(table.column('_id').to_pylist(), partition_values(table)))
+        return self.ids
+
+    def scan(self, columns=None, query=None):
+        """
+        Reads the rows matching a filter into a pyarrow Table. Only the
+        partitions and row groups that can match the filter are read.
+
+        Parameters
+        ----------
+        columns : a list of columns to read. All columns are read if None.
+        query : a MongoDB filter. See to_expression().
+
+        Returns
+        -------
+        A pyarrow Table or None if the collection is empty.
+
+        """
+        dataset = self._dataset()
+        if dataset is None:
+            return None
+        if columns is not None:
+            columns = [name for name in columns if name in dataset.schema.names]
+        return dataset.to_table(columns=columns, filter=to_expression(query))
+
+    def find(self, query=None, projection=None):
+        dataset = self._dataset()
+        if dataset is None:
+            return
+        columns = self._columns(dataset, projection)
+        for batch in dataset.to_batches(columns=columns, filter=to_expression(query)):
+            for document in batch.to_pylist():
+                yield document
+
+    def find_one(self, query=None, projection=None, sort=None):
+        if sort is None:
+            return next(self.find(query, projection), None)
+
+        dataset = self._dataset()
+        if dataset is None:
+            return None
+        table = dataset.to_table(columns=self._columns(dataset, projection), filter=to_expression(query))
+        if not table.num_rows:
+            return None
+        table = table.sort_by([(key, 'ascending' if direction > 0 else 'descending') for key, direction in sort])
+        return table.slice(0, 1).to_pylist()[0]
+
+    def distinct(self, key, query=None):
+        table = self.scan([key], query)
+        if (table is None) or (key not in table.column_names):
+            return []
+        return pc.unique(table.column(key)).drop_null().to_pylist()
+
+    def count_documents(self, query):
+        dataset = self._dataset()
+        return 0 if dataset is None else dataset.count_rows(filter=to_expression(query))
+
+    def insert_many(self, documents):
+        """
+        Writes documents to a new part file in each partition. The documents
+        are partitioned on whichever of cutoff, angle, model and ec_class
+        they contain.
+
+        Parameters
+        ----------
+        documents : a list of dicts
+
+        Notes
+        -----
+        Writes are idempotent on _id like the upserts of BulkWriter. The _id
+        is an md5 of the contents of a document, so new documents already
+        stored in the same partition are skipped. A stored document moved
+        to another partition (i.e. rerun at another cutoff) is deleted
+        first. Only the last of several new documents with one _id is kept.
+        The stored _ids are read once per collection object such that a
+        write never walks the existing part files.
+
+        """
+        table = to_table(documents)
+        if '_id' in table.column_names:
+            table = latest(table)
+            stored = self._stored()
+            ids, values = table.column('_id').to_pylist(), partition_values(table)
+            keep = [stored.get(_id) != value for _id, value in zip(ids, values)]
+            moved = [_id for _id, new in zip(ids, keep) if new and (_id in stored)]
+            if moved:
+                self.delete_many({'_id': {'$in': moved}})
+            if not all(keep):
+                table = table.filter(pa.array(keep))
+            stored.update((_id, value) for _id, value, new in zip(ids, values, keep) if new)
+            if not table.num_rows:
+                return
+        keys = [name for name in PARTITION_SCHEMA.names if name in table.column_names]
+        if keys:
+            partitioning = ds.partitioning(pa.schema([PARTITION_SCHEMA.field(name) for name in keys]), flavor='hive')
+        else:
+            partitioning = None
+
+        ds.write_dataset(
+            table, self.path, format='parquet', partitioning=partitioning,
+            basename_template='part-{}-{{i}}.parquet'.format(uuid4().hex),
+            existing_data_behavior='overwrite_or_ignore'
+        )
+
+    def delete_many(self, query):
+        # rewrite each part file without the rows matching the filter
+        expression = to_expression(query)
+        for filepath in self._files():
+            dataset = self._dataset([filepath])
+            if not dataset.count_rows(filter=expression):  # only reads the filtered columns
+                continue
+            table = dataset.to_table()
+            matched = table.filter(expression)
+            if (self.ids is not None) and ('_id' in table.column_names):
+                for _id in matched.column('_id').to_pylist():
+                    self.ids.pop(_id, None)
+            if matched.num_rows == table.num_rows:
+                remove(filepath)
+            else:
+                kept = table.filter(~expression)
+                pq.write_table(kept.select(pq.read_schema(filepath).names), filepath)
+
+    def replace_one(self, query, document, upsert=False):
+        if (not upsert) and (self.find_one(query) is None):
+            return
+        self.delete_many(query)
+        document = dict(document)
+        if ('_id' in query) and ('_id' not in document):
+            document['_id'] = query['_id']
+        self.insert_many([document])
+
+    def drop(self):
+        rmtree(self.path, ignore_errors=True)
+        self.ids = None
+
+
+class ParquetDatabase:
+    def __init__(self, root):
+        self.root = root
+
+    def __getitem__(self, name):
+        return ParquetCollection(self.root, name)
+
+
+class ParquetClient:
+    def __init__(self, root):
+        """Initialize a client over a directory of columnar databases
+
+        Parameters
+        ----------
+        root : path to the store
+            The collection client[database][collection] is kept under
+            {root}/{database}/{collection}.
+
+        Examples
+        --------
+        >>> client = ParquetClient('/data/parquet')
+        >>> col = client['ma']['non_redundant_1095_ang_limit']
+
+        """
+        self.root = root
+
+    def __getitem__(self, database):
+        return ParquetDatabase(path.join(self.root, database))
+
+    def close(self):
+        pass
+
+
+class ParquetWriter(BulkWriter):
+    def __init__(self, collection, batch_size=1000, flush_interval=5.0, partitions=None):
+        """Initialize a ParquetWriter object over a ParquetCollection
+
+        Parameters
+        ----------
+        collection : a ParquetCollection
+        batch_size : flush once this many documents are buffered
+            Every flush writes one file per partition so large batches
+            give fewer and larger files.
+        flush_interval : flush once this many seconds passed since the last flush
+        partitions : default partition values, i.e. {'cutoff': 6.0, 'angle': 109.5, 'model': 'cp'}
+            Documents tagged with their own run parameters override the defaults.
+
+        """
+        BulkWriter.__init__(self, collection, batch_size=batch_size, flush_interval=flush_interval)
+        self.partitions = partitions or {}
+
+    def write(self, documents):
+        rows = []
+        for doc in documents:
+            row = dict(self.partitions)
+            row.update(doc)
+            row['ec_class'] = (doc.get('ec') or '0')[:1]  # 1.2.3.56 -> 1
+            rows.append(row)
+        self.collection.insert_many(rows)
+
+
+def count_orders(collection):
+    """
+    Function for counting the number of aromatics paired with each methionine
+    Parameters:
+        collection -> a ParquetCollection of Met-aromatic documents
+    Returns:
+        A list of documents of form {'_id': order, 'count': count} sorted by order
+    """
+    table = collection.scan(['code', 'arores', 'met'])
+    if table is None:
+        return []
+    orders = table.group_by(['code', 'arores', 'met']).aggregate([([], 'count_all')])
+    counts = orders.group_by('count_all').aggregate([('code', 'count')]).sort_by('count_all')
+    return [{'_id': row['count_all'], 'count': row['code_count']} for row in counts.to_pylist()]
+
+
+def group_pairs(collection, codes=None):
+    """
+    Function for grouping Met-aromatic documents into a list of pairs per code
+    Parameters:
+        collection -> a ParquetCollection of Met-aromatic documents
+        codes      -> only group the documents of these codes. All documents are grouped if None.
+    Returns:
+        A list of documents of form {'code': ..., 'EC': ..., 'pairs': ['TYR123|MET123', ...]}
+    """
+    query = None if codes is None else {'code': {'$in': codes}}
+    table = collection.scan(['code', 'aro', 'arores', 'met', 'ec'], query)
+    if (table is None) or (not table.num_rows):
+        return []
+
+    ec_class = pc.utf8_slice_codeunits(pc.fill_null(table.column('ec'), ''), 0, 1)  # 1.2.3.56 -> 1
+    pair = pc.binary_join_element_wise(
+        table.column('aro'), table.column('arores'), pa.scalar('|'), pa.scalar('MET'), table.column('met'), ''
+    )
+    table = pa.table({'code': table.column('code'), 'EC': ec_class, 'pair': pair})
+    grouped = table.group_by(['code', 'EC']).aggregate([('pair', 'distinct')])
+    return [
+        {'pairs': row['pair_distinct'], 'EC': row['EC'], 'code': row['code']} for row in grouped.to_pylist()
+    ]
@@ -0,0 +1,214 @@
+# Written by David Weber
+# dsw7@sfu.ca
+
+"""
+In this short namespace I house a pooled download client for the wwPDB archive.
+FTP control connections (and HTTP keep-alive connections) are kept open and
+reused across many entries instead of connecting and logging in again for every
+file. Failed downloads are retried with jittered exponential backoff. The base
+URL can point at any FTP or HTTP(S) mirror of the archive, i.e. a local one.
+Entries are fetched as legacy PDB files by default, or as mmCIF or BinaryCIF.
+"""
+
+# ------------------------------------------------------------------------------
+
+import ftplib
+from http.client import HTTPConnection, HTTPSConnection, HTTPException
+from os import getpid
+from random import uniform
+from shutil import copyfileobj
+from threading import Lock
+from time import sleep
+from urllib.parse import urlparse
+from urllib.error import URLError
+from urllib.request import urlopen
+
+ROOT = 'ftp://ftp.wwpdb.org/pub/pdb/data/structures/divided/pdb/{}/{}'
+MMCIF_ROOT = 'ftp://ftp.wwpdb.org/pub/pdb/data/structures/divided/mmCIF/{}/{}'
+BCIF_ROOT = 'https://models.rcsb.org/{1}'  # not divided by the middle characters of the code
+
+# file name of an entry in each format
+FILENAMES = {
+    'pdb': 'pdb{}.ent.gz',
+    'mmcif': '{}.cif.gz',
+    'bcif': '{}.bcif'
+}
+
+# errors after which a session is discarded and the download retried
+RETRYABLE = (OSError, EOFError, HTTPException) + ftplib.all_errors
+
+
+class FTPSession:
+    def __init__(self, host, port, timeout):
+        self.ftp = ftplib.FTP(timeout=timeout)
+        self.ftp.connect(host, port or 21)
+        self.ftp.login()
+
+    def retrieve(self, filepath, fileobj):
+        try:
+            self.ftp.retrbinary('RETR {}'.format(filepath), fileobj.write)
+        except ftplib.error_perm as exception:
+            if str(exception).startswith('550'):
+                raise FileNotFoundError('{} is not on the server'.format(filepath))
+            raise
+
+    def close(self):
+        try:
+            self.ftp.quit()
+        except ftplib.all_errors:
+            self.ftp.close()
+
+
+class HTTPSession:
+    def __init__(self, scheme, host, port, timeout):
+        connection = HTTPSConnection if scheme == 'https' else HTTPConnection
+        self.connection = connection(host, port, timeout=timeout)
+
+    def retrieve(self, filepath, fileobj):
+        # the connection is reopened transparently if the server closed it after the last response
+        self.connection.request('GET', filepath, headers={'Connection': 'keep-alive'})
+        response = self.connection.getresponse()
+        if response.status != 200:
+            response.read()
+            if response.status == 404:
+                raise FileNotFoundError('{} is not on the server'.format(filepath))
+            raise HTTPException('{} {}'.format(response.status, response.reason))
+        copyfileobj(response, fileobj)
+
+    def close(self):
+        self.connection.close()
+
+
+class URLSession:
+    # any other scheme, i.e. file://, is opened with urllib and never pooled
+    def __init__(self, scheme, netloc, timeout):
+        self.base = '{}://{}'.format(scheme, netloc)
+        self.timeout = timeout
+
+    def retrieve(self, filepath, fileobj):
+        try:
+            response = urlopen(self.base + filepath, timeout=self.timeout)
+        except URLError as exception:
+            if isinstance(exception.reason, FileNotFoundError):
+                raise FileNotFoundError('{} is not on the server'.format(filepath))
+            raise
+        with response:
+            copyfileobj(response, fileobj)
+
+    def close(self):
+        pass
+
+
+class Downloader:
+    def __init__(self, url=ROOT, connections=4, timeout=None, retries=3, backoff=1.0, mmcif_url=MMCIF_ROOT,
+                 bcif_url=BCIF_ROOT):
+        """Initialize a Downloader object over a PDB archive
+
+        Parameters
+        ----------
+        url : template of the download URL
+            Formatted with the two middle characters of the code and the
+            file name, i.e. http://localhost:8000/divided/pdb/{}/{}
+        connections : maximum number of idle sessions kept open per host
+        timeout : timeout of socket operations in seconds
+            Socket operations never time out if None.
+        retries : number of times a failed download is retried
+            Missing entries are never retried.
+        backoff : base delay before a retry in seconds
+            The delay before retry n is drawn uniformly from [0, backoff * 2 ** n].
+        mmcif_url : template of the download URL of mmCIF files
+        bcif_url : template of the download URL of BinaryCIF files
+
+        Examples
+        --------
+        >>> downloader = Downloader()
+        >>> with open('pdb1rcy.ent.gz', 'wb') as f:
+        ...     downloader.fetch('1rcy', f)
+
+        """
+        self.url = url
+        self.mmcif_url = mmcif_url
+        self.bcif_url = bcif_url
+        self.connections = connections
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.idle = {}
+        self.lock = Lock()
+        self.pid = getpid()
+
+    def template(self, file_format='pdb'):
+        # the download URL template of a file format
+        return {'pdb': self.url, 'mmcif': self.mmcif_url, 'bcif': self.bcif_url}[file_format]
+
+    def open_session(self, url):
+        if url.scheme == 'ftp':
+            return FTPSession(url.hostname, url.port, self.timeout)
+        elif url.scheme in ('http', 'https'):
+            return HTTPSession(url.scheme, url.hostname, url.port, self.timeout)
+        else:
+            return URLSession(url.scheme, url.netloc, self.timeout)
+
+    def acquire(self, url):
+        # returns an idle session to the host of a url if any, and whether it was reused
+        with self.lock:
+            if self.pid != getpid():  # forked - idle sessions belong to the parent
+                self.idle, self.pid = {}, getpid()
+            sessions = self.idle.get((url.scheme, url.netloc))
+            if sessions:
+                return sessions.pop(), True
+        return self.open_session(url), False
+
+    def release(self, key, session):
+        with self.lock:
+            sessions = self.idle.setdefault(key, [])
+            if (self.pid == getpid()) and (len(sessions) < self.connections):
+                sessions.append(session)
+                return
+        session.close()
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for sessions in idle.values():
+            for session in sessions:
+                session.close()
+
+    def fetch(self, code, fileobj, file_format='pdb'):
+        """
+        Writes the pdb{code}.ent.gz file of interest (or the {code}.cif.gz or
+        {code}.bcif file) to a file object. The file object is truncated
+        before every attempt.
+
+        Parameters
+        ----------
+        code : the pdb code of interest
+        fileobj : a writable, seekable binary file object
+        file_format : one of 'pdb', 'mmcif' or 'bcif'
+
+        """
+        code = code.lower()
+        url = urlparse(self.template(file_format).format(code[1:3], FILENAMES[file_format].format(code)))
+        key = (url.scheme, url.netloc)
+
+        attempt = 0
+        while True:
+            fileobj.seek(0)
+            fileobj.truncate()
+            session, reused = self.acquire(url)
+            try:
+                session.retrieve(url.path, fileobj)
+            except FileNotFoundError:
+                self.release(key, session)
+                raise
+            except RETRYABLE:
+                session.close()
+                if reused:
+                    continue  # the server dropped an idle session - not counted as a retry
+                if attempt >= self.retries:
+                    raise
+                sleep(uniform(0, self.backoff * 2 ** attempt))
+                attempt += 1
+            else:
+                self.release(key, session)
+                return
@@ -3,26 +3,199 @@
 
 """
 In this short namespace I house a class that connects to PDB and downloads
-file over PDB file transfer protocol.
+file over PDB file transfer protocol. Downloads can optionally be kept in a
+persistent local cache laid out like the wwPDB divided/pdb/xx/ tree. All
+downloads go through a pooled Downloader such that connections are reused.
+Entries without a legacy PDB file are read from mmCIF (or BinaryCIF) instead.
 """
 
 # ------------------------------------------------------------------------------
 
 import gzip
-from urllib.request import urlretrieve, urlcleanup
-from os import remove, getcwd, path
+from io import BytesIO, TextIOWrapper
+from threading import get_ident, Event, Lock
+from downloader import Downloader, ROOT, FILENAMES
+from pdbparser import parse_pdb
+from cifparser import parse_mmcif, parse_bcif
+from metrics import NullTimer
+from os import remove, getcwd, path, makedirs, walk, replace, utime, stat, getpid
 
-ROOT = 'ftp://ftp.wwpdb.org/pub/pdb/data/structures/divided/pdb/{}/{}'
+CACHE_ROOT = path.join(path.expanduser('~'), '.pdb_mirror')
+DOWNLOADER = Downloader(ROOT)  # shared by all PDBFile objects not given a downloader
+FORMATS = ('auto', 'pdb', 'mmcif', 'bcif')
+LOW_WATER = 0.9  # eviction frees space down to this fraction of max_size
+
+# directories of each format under the cache root, as in the wwPDB archive
+CACHE_DIRS = {
+    'pdb': ('divided', 'pdb'),
+    'mmcif': ('divided', 'mmCIF'),
+    'bcif': ('bcif',)
+}
+
+
+class PDBCache:
+    def __init__(self, root=CACHE_ROOT, max_size=None, offline=False, url=ROOT, timeout=None, downloader=None):
+        """Initialize a persistent cache of compressed PDB entries
+
+        Parameters
+        ----------
+        root : path to the cache
+            Entries are stored under {root}/divided/pdb/{xx}/pdb{code}.ent.gz
+            (and {root}/divided/mmCIF/{xx}/{code}.cif.gz) which mirrors the
+            wwPDB archive. An existing local mirror of the archive can
+            therefore be used as the root directly.
+        max_size : maximum size of the cache in bytes
+            The least recently used entries are evicted once the cache grows
+            past max_size, down to LOW_WATER * max_size such that a full
+            cache is not walked again on the next download. No entries are
+            ever evicted if None.
+        offline : never connect to PDB
+            Only entries already present under root are served.
+        url : template of the download URL
+            Formatted with the two middle characters of the code and the
+            file name. Can point at any FTP or HTTP mirror of the archive.
+        timeout : timeout of a download in seconds
+            Downloads never time out if None.
+        downloader : an optional Downloader object
+            If passed, entries are downloaded through it and url and
+            timeout are ignored.
+
+        Examples
+        --------
+        >>> cache = PDBCache('/data/pdb', max_size=50 * 1024 ** 3)
+        >>> pdb_file = PDBFile('1rcy', cache=cache)
+
+        """
+        self.root = root
+        self.max_size = max_size
+        self.offline = offline
+        self.downloader = downloader if downloader is not None else Downloader(url, timeout=timeout)
+        self.url = self.downloader.url
+        self.size = None
+        self.lock = Lock()
+        self.downloading = {}  # path -> Event set once the thread downloading the entry is done
+
+    def path_to(self, code, file_format='pdb'):
+        code = code.lower()
+        return path.join(self.root, *CACHE_DIRS[file_format], code[1:3], FILENAMES[file_format].format(code))
+
+    def get(self, code, file_format='pdb'):
+        """
+        Returns the path to a cached pdb{code}.ent.gz file. The file is
+        downloaded into the cache first if missing, unless offline.
+
+        Parameters
+        ----------
+        code : the pdb code of interest
+        file_format : one of 'pdb', 'mmcif' or 'bcif'
+
+        Examples
+        --------
+        >>> cache = PDBCache()
+        >>> path_to_gz = cache.get('1rcy')
+
+        """
+        filepath = self.path_to(code, file_format)
+
+        if path.exists(filepath):
+            if self.max_size is not None:
+                utime(filepath)  # mark as recently used
+            return filepath
+
+        if self.offline:
+            raise FileNotFoundError('{} is not in local mirror {}'.format(path.basename(filepath), self.root))
+
+        # wait on a download of the same entry by another thread, i.e. a prefetch that timed out
+        with self.lock:
+            in_flight = self.downloading.get(filepath)
+            if in_flight is None:
+                self.downloading[filepath] = Event()
+        if in_flight is not None:
+            in_flight.wait()
+            return self.get(code, file_format)
+
+        # download to a temporary name then move into place such that readers never see partial files
+        partial = '{}.{}.{}.part'.format(filepath, getpid(), get_ident())
+        try:
+            makedirs(path.dirname(filepath), exist_ok=True)
+            with open(partial, 'wb') as f:
+                self.downloader.fetch(code, f, file_format)
+            replace(partial, filepath)
+        except BaseException:
+            if path.exists(partial):
+                remove(partial)
+            raise
+        finally:
+            with self.lock:
+                self.downloading.pop(filepath).set()
+
+        if self.max_size is not None:
+            if self.size is None:
+                self.size = self._get_size()
+            else:
+                self.size += stat(filepath).st_size
+
+            if self.size > self.max_size:
+                self.evict(keep=filepath)
+
+        return filepath
+
+    def _entries(self):
+        for file_format, directories in CACHE_DIRS.items():
+            prefix, suffix = FILENAMES[file_format].split('{}')  # i.e. ('pdb', '.ent.gz')
+            for dirpath, _, filenames in walk(path.join(self.root, *directories)):
+                for filename in filenames:
+                    if filename.startswith(prefix) and filename.endswith(suffix):
+                        yield path.join(dirpath, filename)
+
+    def _get_size(self):
+        return sum(stat(filepath).st_size for filepath in self._entries())
+
+    def evict(self, keep=None):
+        """
+        Removes least recently used entries until the cache is back under
+        LOW_WATER * max_size. The entry passed as keep is never removed.
+
+        Parameters
+        ----------
+        keep : path to an entry that must not be evicted
+
+        """
+        entries = []
+        for filepath in self._entries():
+            info = stat(filepath)
+            entries.append((info.st_mtime, info.st_size, filepath))
+
+        self.size = sum(entry[1] for entry in entries)
+        target = LOW_WATER * self.max_size
+        for _, size, filepath in sorted(entries):
+            if self.size <= target:
+                break
+            if filepath == keep:
+                continue
+            try:
+                remove(filepath)
+            except FileNotFoundError:  # already evicted by another process
+                pass
+            self.size -= size
 
 
 class PDBFile:
-    def __init__(self, code):
+    def __init__(self, code, cache=None, downloader=None, timer=None):
         """Initialize a PDBFile object with a pdb file of interest
 
         Parameters
         ----------
         code : the pdb code if interest
             Any valid PDB code can be passed into PDBFile.
+        cache : an optional PDBCache object
+            If passed, .gz files are read from and kept in the cache
+            instead of being downloaded on every call.
+        downloader : an optional Downloader object
+            Entries not read from a cache are downloaded through it. A
+            Downloader shared by all PDBFile objects is used if None.
+        timer : an optional StageTimer
+            If passed, the download, decompress and parse stages are timed.
 
         Examples
         --------
@@ -30,6 +203,9 @@ class PDBFile:
         
         """
         self.code = code.lower()
+        self.cache = cache
+        self.downloader = downloader if downloader is not None else DOWNLOADER
+        self.timer = timer if timer is not None else NullTimer()
 
     def fetch_from_pdb(self):
         """
@@ -50,23 +226,109 @@ class PDBFile:
         
         """        
             
-        subdir = self.code[1:3]
         infile = 'pdb{}.ent.gz'.format(self.code)
         decompressed = infile.strip('.gz')
-        fullpath = ROOT.format(subdir, infile)
         
         try:
-            urlcleanup()
-            urlretrieve(fullpath, infile)
+            if self.cache is not None:
+                infile = self.cache.get(self.code)
+            else:
+                with open(infile, 'wb') as f:
+                    self.downloader.fetch(self.code, f)
         except Exception as exception:
             return exception
         else:
             with gzip.open(infile, 'rb') as gz:
                 with open(decompressed, 'wb') as out:
                     out.writelines(gz)
-            remove(infile)
+            if self.cache is None:
+                remove(infile)
             return path.join(getcwd(), decompressed)
         
+    def _open(self, file_format='pdb'):
+        # a decompressed binary file object over the entry, read from the cache or downloaded into memory
+        compressed = FILENAMES[file_format].endswith('.gz')
+        with self.timer.stage('download'):
+            if self.cache is not None:
+                source = self.cache.get(self.code, file_format)
+            else:
+                source = BytesIO()
+                self.downloader.fetch(self.code, source, file_format)
+                source.seek(0)
+
+        if compressed:
+            return self.timer.wrap(gzip.open(source, 'rb'), 'decompress')
+        return open(source, 'rb') if self.cache is not None else source
+
+    def stream(self, file_format='pdb'):
+        """
+        Yields the lines of the pdb{code}.ent.gz file of interest. The .gz
+        file is decompressed in memory so nothing is written to cwd and
+        there is nothing to clear() afterwards. Only the first model is
+        used downstream so reading stops at the first ENDMDL record.
+
+        Parameters
+        ----------
+        file_format : 'pdb' or 'mmcif'
+            With 'mmcif' the lines of the {code}.cif.gz file are yielded.
+
+        Examples
+        --------
+        >>> inst = PDBFile('1rcy')
+        >>> for line in inst.stream():
+        >>>     print(line)
+
+        """
+        with self._open(file_format) as f:
+            for line in TextIOWrapper(f, encoding='utf-8', errors='replace'):
+                yield line
+                if (file_format == 'pdb') and line.startswith('ENDMDL'):
+                    break
+
+    def read(self, file_format='bcif'):
+        """
+        Returns the decompressed contents of the file of interest as bytes,
+        i.e. of the {code}.bcif file.
+
+        Parameters
+        ----------
+        file_format : one of 'pdb', 'mmcif' or 'bcif'
+
+        """
+        with self._open(file_format) as f:
+            return f.read()
+
+    def parse(self, file_format='auto'):
+        """
+        Returns the atom table and EC classifier of the structure of
+        interest in the form of parse_pdb().
+
+        Parameters
+        ----------
+        file_format : one of 'auto', 'pdb', 'mmcif' or 'bcif'
+            With 'auto' the legacy PDB file is read, or the mmCIF file if
+            the entry has no legacy PDB file.
+
+        Examples
+        --------
+        >>> atoms, ec = PDBFile('1rcy').parse()
+
+        """
+        with self.timer.stage('parse'):
+            if file_format == 'auto':
+                try:
+                    return parse_pdb(self.stream('pdb'))
+                except FileNotFoundError:  # the largest structures are only distributed as mmCIF
+                    file_format = 'mmcif'
+
+            if file_format == 'pdb':
+                return parse_pdb(self.stream('pdb'))
+            elif file_format == 'mmcif':
+                return parse_mmcif(self.stream('mmcif'))
+            elif file_format == 'bcif':
+                return parse_bcif(self.read('bcif'))
+            raise ValueError('Unknown file format: {}'.format(file_format))
+
     def clear(self):
         """
         Deletes file from current working directory after the file has
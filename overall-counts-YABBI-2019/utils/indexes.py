@@ -0,0 +1,79 @@
+# Written by David Weber
+# dsw7@sfu.ca
+
+"""
+In this short namespace I house the secondary indexes needed by the queries
+that runner.py and analyze.py run against the ma collections along with some
+helpers for checking which index, if any, a query actually uses.
+"""
+
+# ------------------------------------------------------------------------------
+
+from pymongo import ASCENDING
+
+# indexes on a collection of Met-aromatic documents written by runner.py
+MA_INDEXES = {
+    'code': [('code', ASCENDING)],  # distinct('code')
+    'code_arores_met': [('code', ASCENDING), ('arores', ASCENDING), ('met', ASCENDING)],  # $group on code/arores/met
+    'met_theta': [('met-theta', ASCENDING)],  # $match on met-theta
+    'met_phi': [('met-phi', ASCENDING)],  # $match on met-phi
+    'inserted': [('inserted', ASCENDING)]  # watermark of incremental analysis
+}
+
+# indexes on the pairs and bridges collections written by analyze.py
+CODE_INDEXES = {
+    'code': [('code', ASCENDING)]
+}
+
+
+def ensure_indexes(collection, indexes=MA_INDEXES):
+    """
+    Function for creating indexes on a collection. Indexes that already exist
+    are left untouched so this can be called on every run.
+    Parameters:
+        collection -> a pymongo Collection
+        indexes    -> a dict of index name: list of (field, direction) pairs
+    Returns:
+        A list of the names of the indexes
+    """
+    return [collection.create_index(keys, name=name) for name, keys in indexes.items()]
+
+
+def plan_stages(explanation):
+    """
+    Function for flattening the output of an explain command
+    Parameters:
+        explanation -> the document returned by an explain command
+    Returns:
+        A list of (stage, index name) tuples, i.e. [('FETCH', None), ('IXSCAN', 'code')]
+    """
+    stages = []
+    if isinstance(explanation, dict):
+        if 'stage' in explanation:
+            stages.append((explanation['stage'], explanation.get('indexName')))
+        for key, value in explanation.items():
+            if key != 'rejectedPlans':
+                stages.extend(plan_stages(value))
+    elif isinstance(explanation, list):
+        for value in explanation:
+            stages.extend(plan_stages(value))
+    return stages
+
+
+def explain(database, command):
+    """
+    Function for explaining a database command
+    Parameters:
+        database -> a pymongo Database
+        command  -> a command document, i.e. {'distinct': 'ma', 'key': 'code'}
+                    or {'aggregate': 'ma', 'pipeline': [...], 'cursor': {}}
+    Returns:
+        A list of (stage, index name) tuples for the winning plan
+    """
+    return plan_stages(database.command('explain', command, verbosity='queryPlanner'))
+
+
+def uses_index(stages):
+    # True if a plan from explain() reads from an index rather than scanning the collection
+    return any(stage in ('IXSCAN', 'DISTINCT_SCAN', 'COUNT_SCAN') for stage, _ in stages) and \
+        not any(stage == 'COLLSCAN' for stage, _ in stages)
@@ -0,0 +1,92 @@
+# Written by David Weber
+# dsw7@sfu.ca
+
+"""
+In this short namespace I house a class that keeps a durable record of
+progress through a batch job. A crashed or interrupted batch can then be
+resumed without reprocessing the codes that were already completed.
+"""
+
+# ------------------------------------------------------------------------------
+
+from json import dumps, loads
+from os import fsync, path
+from time import time
+
+
+class Journal:
+    DONE = 'done'
+    EMPTY = 'empty'
+    FAILED = 'failed'
+    SKIPPED = 'skipped'  # skipped by the summary index. Depends on the cutoff so never finished
+
+    def __init__(self, filepath, resume=False):
+        """Initialize a Journal object backed by a file of JSON lines
+
+        Parameters
+        ----------
+        filepath : path to the journal
+            One line of the form {"code": ..., "status": ..., "attempt": ..., "time": ...}
+            is appended for every code processed. The last line for a code wins.
+        resume : load an existing journal
+            If False any existing journal at filepath is overwritten.
+
+        Examples
+        --------
+        >>> journal = Journal('low_redundancy_delimiter_list.txt.journal', resume=True)
+        >>> pending = [code for code in codes if code not in journal.finished()]
+
+        """
+        self.filepath = filepath
+        self.status = {}
+        self.attempts = {}
+
+        if resume and path.exists(filepath):
+            complete = self._load()
+            self.handle = open(filepath, 'a')
+            if not complete:  # end the line cut short by a crash so the next entry starts a line of its own
+                self.handle.write('\n')
+        else:
+            self.handle = open(filepath, 'w')
+
+    def _load(self):
+        # returns False if the last line of the journal is incomplete
+        line = '\n'
+        with open(self.filepath, 'r') as f:
+            for line in f:
+                try:
+                    entry = loads(line)
+                except ValueError:  # a line cut short by a crash
+                    continue
+                self.status[entry['code']] = entry['status']
+                self.attempts[entry['code']] = entry['attempt']
+        return line.endswith('\n')
+
+    def record(self, code, status):
+        """
+        Appends the outcome of processing a code. The line is flushed to
+        disk before returning such that it survives a crash.
+
+        Parameters
+        ----------
+        code : the pdb code that was processed
+        status : one of Journal.DONE, Journal.EMPTY, Journal.FAILED or Journal.SKIPPED
+
+        """
+        self.status[code] = status
+        self.attempts[code] = self.attempts.get(code, 0) + 1
+
+        entry = {'code': code, 'status': status, 'attempt': self.attempts[code], 'time': time()}
+        self.handle.write(dumps(entry) + '\n')
+        self.handle.flush()
+        fsync(self.handle.fileno())
+
+    def finished(self):
+        # codes that need not be processed again
+        return {code for code, status in self.status.items() if status in (self.DONE, self.EMPTY)}
+
+    def failed(self):
+        return {code for code, status in self.status.items() if status == self.FAILED}
+
+    def close(self):
+        self.handle.close()
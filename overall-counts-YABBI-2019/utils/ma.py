@@ -12,180 +12,247 @@ imported into a separate workspace.
 # ------------------------------------------------------------------------------
 
 from filegetter import PDBFile
-from urllib.error import URLError
-from re import search
-from itertools import groupby
-from operator import itemgetter
-from utils import get_hexagon_midpoints
-from utils import LonePairs
-from utils import RodriguesMethod
-from utils import vector_angle
-from numpy import array
-from numpy.linalg import norm
+from metrics import NullTimer
+from pdbparser import coordinates
+from pdbparser import residue_labels
+from pdbparser import text
+from pdbparser import group_residues
+from utils import batch_hexagon_midpoints
+from utils import batch_lone_pairs
+from utils import met_aromatic_kernel
+from utils import CellList
+from numpy import concatenate
+from numpy import isin
+from numpy import lexsort
+from numpy import unique
 
 
 class MetAromaticConstants:
-    ATOMS_MET = r'CE|SD|CG'
-    ATOMS_TYR = r'CD1|CE1|CZ|CG|CD2|CE2'
-    ATOMS_TRP = r'CD2|CE3|CZ2|CH2|CZ3|CE2'
-    ATOMS_PHE = r'CD1|CE1|CZ|CG|CD2|CE2'
-    IDX_ATOM = 0
-    IDX_CHAIN = 4
-    IDX_AA = 3
-    IDX_ATM_LABEL = 2
+    # the string fields of the atom table hold bytes
+    ATOMS_MET = (b'CE', b'SD', b'CG')
+    ATOMS_TYR = (b'CD1', b'CE1', b'CZ', b'CG', b'CD2', b'CE2')
+    ATOMS_TRP = (b'CD2', b'CE3', b'CZ2', b'CH2', b'CZ3', b'CE2')
+    ATOMS_PHE = (b'CD1', b'CE1', b'CZ', b'CG', b'CD2', b'CE2')
+    FIRST_CONFORMER = (b'', b'A')
+    ALL_CHAINS = 'ALL'
+    MIN_CELL_SIZE = 1.0
 
     DICT_ATOMS_PHE = {
-        'CG': 'A', 'CD2': 'B', 'CE2': 'C',
-        'CZ': 'D', 'CE1': 'E', 'CD1': 'F'
+        b'CG': 'A', b'CD2': 'B', b'CE2': 'C',
+        b'CZ': 'D', b'CE1': 'E', b'CD1': 'F'
     }
 
     DICT_ATOMS_TYR = {
-        'CG': 'A', 'CD2': 'B', 'CE2': 'C',
-        'CZ': 'D', 'CE1': 'E', 'CD1': 'F'
+        b'CG': 'A', b'CD2': 'B', b'CE2': 'C',
+        b'CZ': 'D', b'CE1': 'E', b'CD1': 'F'
     }
 
     DICT_ATOMS_TRP = {
-        'CD2': 'A', 'CE3': 'B', 'CZ3': 'C',
-        'CH2': 'D', 'CZ2': 'E', 'CE2': 'F'
+        b'CD2': 'A', b'CE3': 'B', b'CZ3': 'C',
+        b'CH2': 'D', b'CZ2': 'E', b'CE2': 'F'
     }
 
 
 class MetAromatic(MetAromaticConstants):
-    def __init__(self, code, chain="A", cutoff=6.0, angle=109.5, model="cp"):
+    def __init__(self, code, chain="A", cutoff=6.0, angle=109.5, model="cp", cache=None, inter_chain=False,
+                 downloader=None, store=None, parsed=None, file_format='auto', timer=None):
+        # chain="all" processes every chain in one pass, optionally pairing Met / aromatics across chains
+        # structures in an optional AtomStore are read from the store instead of being downloaded and parsed
+        # and an (atoms, ec) pair from parse_pdb() can be passed directly as parsed
+        # file_format is one of 'auto' (PDB, or mmCIF if there is no PDB file), 'pdb', 'mmcif' or 'bcif'
+        # an optional StageTimer times each stage and counts atoms, midpoints and candidate pairs
         self.code = code
         self.chain = chain.upper()
+        self.inter_chain = inter_chain
         self.cutoff = cutoff
         self.angle = angle
         self.model = model
-        self.pdb_file_object = PDBFile(self.code)
-        self.data = self._get_data_from_pdb()
+        self.timer = timer if timer is not None else NullTimer()
+        self.pdb_file_object = PDBFile(self.code, cache=cache, downloader=downloader, timer=self.timer)
+        self.store = store
+        self.parsed = parsed
+        self.file_format = file_format
+        self.midpoint_index = None
+        self.geometry = None
+        self.lone_pairs = {}
+        self.atoms, self.ec = self._get_data_from_pdb()
+        self.timer.count('atoms', len(self.atoms))
 
     def _get_data_from_pdb(self, *args):
-        file = self.pdb_file_object.fetch_from_pdb()
-        data = []
-        for line in open(file, 'r'):
-            data.append(line)
-        self.pdb_file_object.clear()
-        return data
+        if self.parsed is not None:
+            return self.parsed
+        if (self.store is not None) and (self.code in self.store):
+            with self.timer.stage('parse'):
+                return self.store.get(self.code)
+
+        # decompress and parse in memory - no files are written to cwd
+        return self.pdb_file_object.parse(self.file_format)
 
     def get_ec_classifier(self, *args):
-        for line in self.data:
-            if search(r"(?=.*COMPND )(?=.* EC:)", line):
-                return line.split()[-1].strip(';')
-            else:
-                pass
+        return self.ec
 
     def get_first_model(self, *args):
-        # split downstream as get_ec_classifier() requires unsplit strings
-        split, model = [line.split() for line in self.data], []
-        for line in split:
-            if line[self.IDX_ATOM] != 'ENDMDL':
-                model.append(line)
-            else:
-                break
-        return model
+        # parse_pdb() stops reading at the first ENDMDL record
+        return self.atoms
+
+    def _mask_atoms(self):
+        # ATOM records - keep only the first conformer if alternate locations are present
+        return (self.atoms['record'] == b'ATOM') & isin(self.atoms['altloc'], self.FIRST_CONFORMER)
+
+    def _mask_chain(self):
+        if self.chain == self.ALL_CHAINS:
+            return self._mask_atoms()
+        return self._mask_atoms() & (self.atoms['chain'] == self.chain.encode())
 
     def get_atoms(self, *args):
-        model = self.get_first_model(self)
-        return [line for line in model if line[self.IDX_ATOM] == 'ATOM']
+        return self.atoms[self._mask_atoms()]
 
     def get_chain(self, *args):
-        atoms = self.get_atoms(self)
-        return [line for line in atoms if line[self.IDX_CHAIN] == self.chain]
+        return self.atoms[self._mask_chain()]
 
     def extract_aromatics(self, *args):
-        atoms = self.get_chain(self)
-        data_phe = [line for line in atoms if line[self.IDX_AA] == 'PHE']
-        data_tyr = [line for line in atoms if line[self.IDX_AA] == 'TYR']
-        data_trp = [line for line in atoms if line[self.IDX_AA] == 'TRP']
+        mask, resname = self._mask_chain(), self.atoms['resname']
+        data_phe = self.atoms[mask & (resname == b'PHE')]
+        data_tyr = self.atoms[mask & (resname == b'TYR')]
+        data_trp = self.atoms[mask & (resname == b'TRP')]
         return data_phe, data_trp, data_tyr
 
     def extract_methionines(self, *args):
-        atoms = self.get_chain(self)
-        return [line for line in atoms if line[self.IDX_AA] == 'MET']
+        return self.atoms[self._mask_chain() & (self.atoms['resname'] == b'MET')]
 
     def cleanup_aromatics(self, *args):
-        data_phe, data_trp, data_tyr = self.extract_aromatics(self)
-        data_phe = [line for line in data_phe if search(self.ATOMS_PHE, line[self.IDX_ATM_LABEL]) != None]
-        data_tyr = [line for line in data_tyr if search(self.ATOMS_TYR, line[self.IDX_ATM_LABEL]) != None]
-        data_trp = [line for line in data_trp if search(self.ATOMS_TRP, line[self.IDX_ATM_LABEL]) != None]
+        mask, resname, name = self._mask_chain(), self.atoms['resname'], self.atoms['name']
+        data_phe = self.atoms[mask & (resname == b'PHE') & isin(name, self.ATOMS_PHE)]
+        data_tyr = self.atoms[mask & (resname == b'TYR') & isin(name, self.ATOMS_TYR)]
+        data_trp = self.atoms[mask & (resname == b'TRP') & isin(name, self.ATOMS_TRP)]
         return data_phe, data_trp, data_tyr
 
     def cleanup_methionines(self, *args):
-        data_met = self.extract_methionines(self)
-        return [line for line in data_met if search(self.ATOMS_MET, line[self.IDX_ATM_LABEL]) != None]
+        mask, resname, name = self._mask_chain(), self.atoms['resname'], self.atoms['name']
+        return self.atoms[mask & (resname == b'MET') & isin(name, self.ATOMS_MET)]
 
     def get_midpoints_from_aromatic(self, *args):
-        data_phe, data_tyr, data_trp = self.cleanup_aromatics(self)
-        aromatics = data_phe + data_tyr + data_trp
-
-        # need to group prior to getting midpoints
-        aromatics = [list(group) for _, group in groupby(aromatics, lambda entry: entry[5])]
-
-        # get midpoints
-        midpoints = []
-        for grouped in aromatics:
-            # map unique values to atomic label keys
-            for row in grouped:
-                if row[3] == 'PHE':
-                    row[2] = self.DICT_ATOMS_PHE.get(row[2])
-                elif row[3] == 'TYR':
-                    row[2] = self.DICT_ATOMS_TYR.get(row[2])
-                else:
-                    row[2] = self.DICT_ATOMS_TRP.get(row[2])
-
-            # then sort based on these values which are just A, B, C, D, E, F
-            ordered = sorted(grouped, key=itemgetter(2))
-
-            # isolate x, y, z
-            x = [float(i[6]) for i in ordered]
-            y = [float(i[7]) for i in ordered]
-            z = [float(i[8]) for i in ordered]
-
-            # get hexagon midpoints
-            x_mid, y_mid, z_mid = get_hexagon_midpoints(x, y, z)
+        data_phe, data_trp, data_tyr = self.cleanup_aromatics(self)
+        aromatics = concatenate([data_phe, data_trp, data_tyr])
+
+        # map unique values to atomic label keys
+        labels = []
+        for resname, name in zip(aromatics['resname'].tolist(), aromatics['name'].tolist()):
+            if resname == b'PHE':
+                labels.append(self.DICT_ATOMS_PHE.get(name))
+            elif resname == b'TYR':
+                labels.append(self.DICT_ATOMS_TYR.get(name))
+            else:
+                labels.append(self.DICT_ATOMS_TRP.get(name))
 
-            for a, b, c in zip(x_mid, y_mid, z_mid):
-                midpoints.append([ordered[0][5], ordered[0][3], array([a, b, c])])
+        # then sort each residue based on these values which are just A, B, C, D, E, F
+        groups = group_residues(aromatics)
+        order = lexsort((labels, groups))
+        aromatics, groups = aromatics[order], groups[order]
 
-        return midpoints
+        # get hexagon midpoints
+        midpoints = batch_hexagon_midpoints(coordinates(aromatics), groups)
+        return text(aromatics['resname']), residue_labels(aromatics), aromatics['chain'], midpoints
 
-    def met_aromatic(self):
+    def get_methionine_coordinates(self, *args):
         data_met = self.cleanup_methionines(self)
-        midpoints = self.get_midpoints_from_aromatic(self)
-
-        end_result = []
 
-        # apply distance and angular conditions
-        for key, grouped_met in groupby(data_met, lambda entry: entry[5]):
-            # guarantees the order of methionine data
-            ord_met = sorted(list(grouped_met), key=itemgetter(2))
+        # guarantees the order of methionine data -> CE, CG, SD
+        groups = group_residues(data_met)
+        order = lexsort((data_met['name'], groups))
+        data_met, groups = data_met[order], groups[order]
+
+        # keep only methionines where all of CE, CG, SD are present
+        _, starts, counts = unique(groups, return_index=True, return_counts=True)
+        starts = starts[counts == 3]
+        names = data_met['name']
+        starts = starts[(names[starts] == b'CE') & (names[starts + 1] == b'CG') & (names[starts + 2] == b'SD')]
+
+        xyz = coordinates(data_met)
+        return residue_labels(data_met[starts]), data_met['chain'][starts], xyz[starts], xyz[starts + 1], xyz[starts + 2]
+
+    def get_geometry(self, *args):
+        # methionine coordinates and aromatic midpoints are computed once and reused by later sweeps
+        if self.geometry is None:
+            with self.timer.stage('midpoints'):
+                self.geometry = self.get_methionine_coordinates(self), self.get_midpoints_from_aromatic(self)
+            self.timer.count('methionines', len(self.geometry[0][4]))
+            self.timer.count('midpoints', len(self.geometry[1][3]))
+        return self.geometry
+
+    def get_lone_pairs(self, model):
+        # an (n_met, 2, 3) array of lone pair vectors a, g cached per model
+        if model not in self.lone_pairs:
+            _, _, ce, cg, sd = self.get_geometry(self)[0]
+            self.lone_pairs[model] = batch_lone_pairs(cg, sd, ce, model)
+        return self.lone_pairs[model]
 
-            CE = array(ord_met[0][6:9]).astype(float)
-            CG = array(ord_met[1][6:9]).astype(float)
-            SD = array(ord_met[2][6:9]).astype(float)
-
-            if self.model == 'cp':
-                object_lonepairs = LonePairs(CG, SD, CE)
-            elif self.model == 'rm':
-                object_lonepairs = RodriguesMethod(CG, SD, CE)
-            else:
+    def met_aromatic(self):
+        key = (self.cutoff, self.angle, self.model)
+        return self.met_aromatic_sweep([self.cutoff], [self.angle], [self.model])[key]
+
+    def met_aromatic_sweep(self, cutoffs, angles, models):
+        """
+        Runs the Met-aromatic algorithm for every combination of cutoffs, angles and
+        models in one pass. Geometry is computed once per model at the largest cutoff
+        and angle. Each combination then filters these results down.
+        Parameters:
+            cutoffs, angles, models -> lists of parameters
+        Returns:
+            A dict mapping each (cutoff, angle, model) to the usual Met-aromatic results.
+            If processing all chains, the aromatic and Met chain IDs are appended to each row.
+        """
+        for model in models:
+            if model not in ('cp', 'rm'):
                 raise ValueError('Valid models are: cp, rm')
 
-            vector_a = object_lonepairs.vector_a()
-            vector_g = object_lonepairs.vector_g()
-
-            for row in midpoints:
-                vector_v = row[2] - SD  # mapping to origin of SD
-                norm_v = norm(vector_v)
-                if norm_v <= self.cutoff:  # distance condition
-                    met_theta = vector_angle(vector_v, vector_a)
-                    met_phi = vector_angle(vector_v, vector_g)
-                    if met_theta <= self.angle or met_phi <= self.angle:  # angular condition
-                        end_result.append([row[1], row[0], ord_met[0][3], ord_met[0][5], norm_v, met_theta, met_phi])
-                    else:
-                        continue
-                else:
+        methionines, aromatics = self.get_geometry(self)
+        met_positions, met_chains, _, _, sd = methionines
+        aro_resnames, aro_positions, aro_chains, midpoints = aromatics
+        all_chains = self.chain == self.ALL_CHAINS
+
+        sweep = {}
+        with self.timer.stage('geometry'):
+            for model in models:
+                if not sd.size or not midpoints.size:
+                    sweep.update({(c, a, model): [] for c in cutoffs for a in angles})
                     continue
 
-        return end_result
+                # lone pair vectors for all methionines
+                lone_pairs = self.get_lone_pairs(model)
+
+                # bin midpoints into a spatial index once - reused if the cutoff changes
+                if self.midpoint_index is None:
+                    self.midpoint_index = CellList(midpoints, max(max(cutoffs), self.MIN_CELL_SIZE))
+
+                # apply the loosest distance and angular conditions to all nearby pairs at once
+                counts = {}
+                idx_met, idx_midpoint, norms_v, met_theta, met_phi = met_aromatic_kernel(
+                    sd, lone_pairs[:, 0], lone_pairs[:, 1],
+                    midpoints, max(cutoffs), max(angles), index=self.midpoint_index, counts=counts
+                )
+                self.timer.count('candidate_pairs', counts['candidate_pairs'])
+
+                # a single spatial search covers all chains - drop inter-chain pairs unless requested
+                same_chain = met_chains[idx_met] == aro_chains[idx_midpoint]
+                if not self.inter_chain:
+                    idx_met, idx_midpoint = idx_met[same_chain], idx_midpoint[same_chain]
+                    norms_v = norms_v[same_chain]
+                    met_theta, met_phi = met_theta[same_chain], met_phi[same_chain]
+
+                # then tighten the conditions for each combination
+                for cutoff in cutoffs:
+                    for angle in angles:
+                        mask = (norms_v <= cutoff) & ((met_theta <= angle) | (met_phi <= angle))
+
+                        end_result = []
+                        for i, j, norm_v, theta, phi in zip(idx_met[mask], idx_midpoint[mask], norms_v[mask],
+                                                            met_theta[mask], met_phi[mask]):
+                            row = [aro_resnames[j], aro_positions[j], 'MET', met_positions[i], norm_v, theta, phi]
+                            if all_chains:
+                                row.extend([aro_chains[j].decode(), met_chains[i].decode()])
+                            end_result.append(row)
+
+                        sweep[(cutoff, angle, model)] = end_result
+
+        return sweep
@@ -0,0 +1,213 @@
+# Written by David Weber
+# dsw7@sfu.ca
+
+"""
+In this namespace I house the timing instrumentation of the Met-aromatic
+pipeline. A StageTimer follows a single PDB code through download, decompress,
+parse, midpoint construction, geometry, mapping and the database write and
+counts the atoms, midpoints and candidate pairs it meets on the way. Stages
+nest: time spent in a nested stage (i.e. a download triggered by the parser)
+is only counted towards the nested stage, so the stages of a code add up to
+its total. A Metrics object writes the timers of a batch as JSON lines and/or
+as Prometheus style counters in the text exposition format.
+"""
+
+# ------------------------------------------------------------------------------
+
+from contextlib import contextmanager
+from json import dumps
+from os import replace
+from time import perf_counter, time
+
+STAGES = ('download', 'decompress', 'parse', 'midpoints', 'geometry', 'mapping', 'write', 'other')
+PREFIX = 'met_aromatic'
+
+
+class NullTimer:
+    # stands in for a StageTimer when no metrics are collected
+    @contextmanager
+    def stage(self, name):
+        yield
+
+    def count(self, name, value):
+        pass
+
+    def wrap(self, fileobj, name):
+        return fileobj
+
+
+class TimedReader:
+    def __init__(self, fileobj, timer, name):
+        # a binary file object whose reads are timed as a stage, i.e. decompression inside a gzip file
+        self.fileobj = fileobj
+        self.timer = timer
+        self.name = name
+
+    def read(self, *args):
+        with self.timer.stage(self.name):
+            return self.fileobj.read(*args)
+
+    def read1(self, *args):
+        with self.timer.stage(self.name):
+            return self.fileobj.read1(*args)
+
+    def readinto(self, *args):
+        with self.timer.stage(self.name):
+            return self.fileobj.readinto(*args)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.fileobj.close()
+
+    def __getattr__(self, name):
+        return getattr(self.fileobj, name)
+
+
+class StageTimer(NullTimer):
+    def __init__(self, code, clock=perf_counter):
+        """Initialize a StageTimer object for a single PDB code
+
+        Parameters
+        ----------
+        code : the pdb code being timed
+        clock : a function returning the current time in seconds
+
+        Examples
+        --------
+        >>> timer = StageTimer('1rcy')
+        >>> with timer.stage('parse'):
+        ...     atoms, ec = parse_pdb(lines)
+        >>> timer.count('atoms', len(atoms))
+
+        """
+        self.code = code
+        self.clock = clock
+        self.seconds = {}
+        self.counts = {}
+        self.nested = []  # time spent in nested stages, one entry per open stage
+
+    @contextmanager
+    def stage(self, name):
+        self.nested.append(0.0)
+        start = self.clock()
+        try:
+            yield
+        finally:
+            elapsed = self.clock() - start
+            self.seconds[name] = self.seconds.get(name, 0.0) + elapsed - self.nested.pop()
+            if self.nested:
+                self.nested[-1] += elapsed
+
+    def count(self, name, value):
+        self.counts[name] = self.counts.get(name, 0) + int(value)
+
+    def wrap(self, fileobj, name):
+        return TimedReader(fileobj, self, name)
+
+    def total(self):
+        return sum(self.seconds.values())
+
+    def record(self, status):
+        # a JSON serializable summary of the code
+        return {
+            'code': self.code,
+            'status': status,
+            'time': round(time(), 3),
+            'total': round(self.total(), 6),
+            'stages': {name: round(seconds, 6) for name, seconds in self.seconds.items()},
+            'counts': self.counts
+        }
+
+
+class Metrics:
+    def __init__(self, jsonl=None, prometheus=None, interval=10.0):
+        """Initialize a Metrics object collecting the StageTimers of a batch
+
+        Parameters
+        ----------
+        jsonl : path to a file receiving one JSON line per code
+            Lines are appended so the timings of a resumed batch are kept.
+        prometheus : path to a .prom file holding counters summed over the batch
+            The file is rewritten atomically at most once per interval and on
+            close(), i.e. for the textfile collector of the node exporter.
+        interval : minimum time between rewrites of the .prom file in seconds
+
+        Examples
+        --------
+        >>> metrics = Metrics(jsonl='timings.jsonl', prometheus='metrics.prom')
+        >>> metrics.add(timer, 'done')
+        >>> metrics.close()
+
+        """
+        self.jsonl = open(jsonl, 'a', buffering=1) if jsonl is not None else None
+        self.prometheus = prometheus
+        self.interval = interval
+        self.last_dump = 0.0
+        self.seconds = {}
+        self.counts = {}
+        self.codes = {}
+
+    def add(self, timer, status):
+        """
+        Records the StageTimer of a code
+
+        Parameters
+        ----------
+        timer : a StageTimer
+        status : the outcome of the code, i.e. 'done', 'empty' or 'failed'
+
+        """
+        self.codes[status] = self.codes.get(status, 0) + 1
+        self.add_seconds(timer.seconds)
+        for name, value in timer.counts.items():
+            self.counts[name] = self.counts.get(name, 0) + value
+
+        if self.jsonl is not None:
+            self.jsonl.write(dumps(timer.record(status)) + '\n')
+        if (self.prometheus is not None) and (time() - self.last_dump >= self.interval):
+            self.dump()
+
+    def add_seconds(self, seconds):
+        # time not attributed to any code, i.e. the final flush of a bulk writer
+        for name, value in seconds.items():
+            self.seconds[name] = self.seconds.get(name, 0.0) + value
+
+    def exposition(self):
+        lines = [
+            '# HELP {}_stage_seconds_total Time spent in each stage of the pipeline.'.format(PREFIX),
+            '# TYPE {}_stage_seconds_total counter'.format(PREFIX)
+        ]
+        for name in sorted(self.seconds, key=lambda name: STAGES.index(name) if name in STAGES else len(STAGES)):
+            lines.append('{}_stage_seconds_total{{stage="{}"}} {:.6f}'.format(PREFIX, name, self.seconds[name]))
+
+        lines.append('# HELP {}_codes_total PDB codes processed by outcome.'.format(PREFIX))
+        lines.append('# TYPE {}_codes_total counter'.format(PREFIX))
+        for status in sorted(self.codes):
+            lines.append('{}_codes_total{{status="{}"}} {}'.format(PREFIX, status, self.codes[status]))
+
+        for name in sorted(self.counts):
+            lines.append('# TYPE {}_{}_total counter'.format(PREFIX, name))
+            lines.append('{}_{}_total {}'.format(PREFIX, name, self.counts[name]))
+        return '\n'.join(lines) + '\n'
+
+    def dump(self):
+        with open(self.prometheus + '.part', 'w') as f:
+            f.write(self.exposition())
+        replace(self.prometheus + '.part', self.prometheus)
+        self.last_dump = time()
+
+    def summary(self):
+        # human readable totals per stage, printed at the end of a batch
+        total = sum(self.seconds.values()) or 1.0
+        return '\n'.join(
+            '{:<12}{:>12.3f} s {:>6.1f} %'.format(name, seconds, 100 * seconds / total)
+            for name, seconds in sorted(self.seconds.items(), key=lambda item: -item[1])
+        )
+
+    def close(self):
+        if self.jsonl is not None:
+            self.jsonl.close()
+        if self.prometheus is not None:
+            self.dump()
@@ -0,0 +1,123 @@
+# Written by David Weber
+# dsw7@sfu.ca
+
+"""
+A single pass PDB parser. Each ATOM / HETATM record in the first model is read
+once from its fixed columns into a compact structured NumPy array (the atom
+table). String fields hold ASCII bytes such that a record takes 39 bytes.
+Selections on the atom table are then boolean masks against byte strings, i.e.
+atoms['resname'] == b'MET'. Reading the fixed columns instead of splitting on
+whitespace also handles "string crashed" coordinates such as
+-27.595-106.521-108.313.
+"""
+
+# ------------------------------------------------------------------------------
+
+from re import search
+from numpy import array
+from numpy import around
+from numpy import cumsum
+from numpy import concatenate
+from numpy import dtype
+from numpy import float64
+
+ATOM_TABLE = dtype([
+    ('record', 'S6'),
+    ('serial', 'i4'),
+    ('name', 'S4'),
+    ('altloc', 'S1'),
+    ('resname', 'S3'),
+    ('chain', 'S4'),  # mmCIF chain identifiers are up to four characters
+    ('resseq', 'i4'),
+    ('icode', 'S1'),
+    ('xyz', 'f4', (3,))
+])
+
+# PDB coordinates are written to three decimal places
+DECIMALS = 3
+
+
+def hybrid36(field):
+    """
+    Function for reading a serial or residue number written in hybrid-36, i.e.
+    A0000 -> 100000, as used once numbers outgrow their fixed columns
+    Parameters:
+        field -> the columns of the number, i.e. line[6:11]
+    Returns:
+        The number, or 0 if it cannot be read (i.e. an overflowed *****). The
+        Met-aromatic algorithm never uses the serial
+    """
+    try:
+        return int(field)
+    except ValueError:
+        pass
+    field = field.strip()
+    width = len(field)
+    try:
+        value = int(field, 36)
+    except ValueError:
+        return 0
+    if field[0].isupper():
+        return value - 10 * 36 ** (width - 1) + 10 ** width
+    return value + 16 * 36 ** (width - 1) + 10 ** width
+
+
+def parse_pdb(lines):
+    """
+    Function for reading the atom records of the first model in a PDB file
+    Parameters:
+        lines -> any iterable of PDB file lines, i.e. an open file
+    Returns:
+        atoms -> structured array of dtype ATOM_TABLE
+        ec    -> the EC classifier listed under COMPND, or None
+    """
+    rows, ec = [], None
+    for line in lines:
+        record = line[0:6]
+        if record == 'ATOM  ' or record == 'HETATM':
+            rows.append((
+                record.strip(),
+                hybrid36(line[6:11]),
+                line[12:16].strip(),
+                line[16].strip(),
+                line[17:20].strip(),
+                line[21].strip(),
+                hybrid36(line[22:26]),
+                line[26].strip(),
+                (float(line[30:38]), float(line[38:46]), float(line[46:54]))
+            ))
+        elif record == 'ENDMDL':  # only the first model is used
+            break
+        elif ec is None and search(r"(?=.*COMPND )(?=.* EC:)", line):
+            ec = line.split()[-1].strip(';')
+    return array(rows, dtype=ATOM_TABLE), ec
+
+
+def coordinates(atoms):
+    # float32 atom table coordinates -> the float64 values written in the file
+    return around(atoms['xyz'].astype(float64), DECIMALS)
+
+
+def text(values):
+    # an array of byte strings -> a list of str, i.e. for results
+    return values.astype(str).tolist()
+
+
+def residue_labels(atoms):
+    # i.e. resseq 52 with insertion code A -> '52A'
+    return [str(resseq) + icode for resseq, icode in zip(atoms['resseq'].tolist(), text(atoms['icode']))]
+
+
+def group_residues(atoms):
+    """
+    Function for labelling consecutive runs of atoms that belong to the same residue
+    Parameters:
+        atoms -> structured array of dtype ATOM_TABLE
+    Returns:
+        An array of residue group ids, one per atom, counting up from 0
+    """
+    change = (atoms['chain'][1:] != atoms['chain'][:-1]) | \
+             (atoms['resseq'][1:] != atoms['resseq'][:-1]) | \
+             (atoms['icode'][1:] != atoms['icode'][:-1]) | \
+             (atoms['resname'][1:] != atoms['resname'][:-1])
+    return cumsum(concatenate([[0], change]))[:len(atoms)]
@@ -0,0 +1,140 @@
+# Written by David Weber
+# dsw7@sfu.ca
+
+"""
+In this short namespace I house a prefetcher that downloads PDB entries into a
+PDBCache ahead of the Met-aromatic workers. An asyncio loop runs in a
+background thread and keeps a bounded number of entries downloaded (or
+downloading) ahead of the consumer such that network I/O overlaps with the
+geometry instead of alternating with it.
+"""
+
+# ------------------------------------------------------------------------------
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from os import path
+from queue import Queue
+from threading import Thread, Semaphore
+from urllib.parse import urlparse
+
+DONE = None  # marks the end of the prefetch queue
+
+
+class Prefetcher:
+    def __init__(self, cache, codes, depth=8, per_host=4, timeout=60.0, file_format='pdb'):
+        """Initialize a Prefetcher object over a list of PDB codes
+
+        Parameters
+        ----------
+        cache : a PDBCache
+            Entries are downloaded into the cache. Consumers then read the
+            cached files through the same cache.
+        codes : a list of PDB codes
+        depth : maximum number of entries fetched ahead of the consumer
+        per_host : maximum number of concurrent downloads from a single host
+        timeout : time in seconds after which the consumer stops waiting on a download
+            Codes that failed to prefetch are still yielded. The consumer
+            then reads the entry through the cache itself, which waits on
+            a download of the same entry still in flight, and handles any
+            errors as usual.
+        file_format : the format of the entries to fetch, 'pdb', 'mmcif' or 'bcif'
+
+        Examples
+        --------
+        >>> cache = PDBCache('/data/pdb', timeout=60.0)
+        >>> for code in Prefetcher(cache, ['1rcy', '1a5r'], depth=16):
+        ...     ma = MetAromatic(code, cache=cache)
+
+        """
+        self.cache = cache
+        self.codes = list(codes)
+        self.depth = depth
+        self.per_host = per_host
+        self.timeout = timeout
+        self.file_format = file_format
+        self.failed = {}
+        self.error = None
+        self.stopped = False
+        self.ready = Queue()
+        self.slots = Semaphore(depth)
+        self.thread = None
+
+    def host(self, code):
+        # the host serving an entry, i.e. ftp.wwpdb.org
+        filename = path.basename(self.cache.path_to(code, self.file_format))
+        return urlparse(self.cache.downloader.template(self.file_format).format(code[1:3].lower(), filename)).netloc
+
+    async def fetch(self, loop, executor, limits, code):
+        limit = limits.setdefault(self.host(code), asyncio.Semaphore(self.per_host))
+        await limit.acquire()
+
+        # a download that timed out keeps running in its thread. The host slot is held until the thread
+        # finishes such that per_host is enforced, while the code is handed over to the consumer
+        download = loop.run_in_executor(executor, self.cache.get, code, self.file_format)
+        download.add_done_callback(lambda future: (limit.release(), future.cancelled() or future.exception()))
+        try:
+            await asyncio.wait_for(asyncio.shield(download), self.timeout)
+        except Exception as exception:
+            self.failed[code] = exception
+
+    async def produce(self, loop, executor, tasks):
+        limits = {}
+        for code in self.codes:
+            # wait for a free slot without blocking the event loop
+            await loop.run_in_executor(None, self.slots.acquire)
+            if self.stopped:
+                break
+            await tasks.put((code, loop.create_task(self.fetch(loop, executor, limits, code))))
+        await tasks.put((DONE, None))
+
+    async def deliver(self, tasks):
+        # hand codes over in their original order as soon as each download completes
+        while True:
+            code, task = await tasks.get()
+            if code is DONE:
+                break
+            await task
+            self.ready.put(code)
+
+    async def pipeline(self):
+        loop = asyncio.get_running_loop()
+        tasks = asyncio.Queue()
+        with ThreadPoolExecutor(self.depth) as executor:
+            await asyncio.gather(self.produce(loop, executor, tasks), self.deliver(tasks))
+
+    def run(self):
+        try:
+            asyncio.run(self.pipeline())
+        except BaseException as exception:
+            self.error = exception
+        finally:
+            self.ready.put(DONE)
+
+    def start(self):
+        if self.thread is None:
+            self.thread = Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def close(self):
+        # unblock the producer if the consumer stopped early
+        self.stopped = True
+        for _ in range(self.depth):
+            self.slots.release()
+        if self.thread is not None:
+            self.thread.join()
+
+    def __iter__(self):
+        self.start()
+        try:
+            while True:
+                code = self.ready.get()
+                if code is DONE:
+                    break
+                self.slots.release()
+                yield code
+        finally:
+            self.close()
+
+        if self.error is not None:
+            raise self.error
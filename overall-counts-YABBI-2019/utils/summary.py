@@ -0,0 +1,252 @@
+# Written by David Weber
+# dsw7@sfu.ca
+
+"""
+In this namespace I house a sidecar summary index of PDB entries. For each chain
+of each entry the index holds the number of MET, PHE, TYR and TRP residues, the
+number of metal atoms, the EC classifier, the norm of the shortest Met-aromatic
+vector v (within the chain and to any chain) and two bounding boxes: one around
+the Met SD atoms and one around the aromatic ring atoms. An entry whose shortest
+vector v is longer than the cutoff cannot produce a single interaction. Past
+MAX_NORM the boxes are used instead: every vector v runs from an SD atom to a
+ring midpoint, which lies inside the aromatic box, so boxes further apart than
+the cutoff cannot produce an interaction either. Batch drivers use the index to
+skip such entries without downloading or parsing them.
+"""
+
+# ------------------------------------------------------------------------------
+
+from os import path, replace
+from re import search
+from numpy import concatenate
+from numpy import dtype
+from numpy import empty
+from numpy import full
+from numpy import inf
+from numpy import isin
+from numpy import isnan
+from numpy import load
+from numpy import maximum
+from numpy import nan
+from numpy import save
+from numpy import searchsorted
+from numpy import unique
+from numpy.linalg import norm
+from ma import MetAromatic
+from pdbparser import text
+
+AROMATICS = ('PHE', 'TYR', 'TRP')
+RING_ATOMS = ('CD1', 'CE1', 'CZ', 'CG', 'CD2', 'CE2', 'CE3', 'CZ2', 'CH2', 'CZ3')  # PHE / TYR / TRP rings
+METALS = 'SC|TI|V|CR|MN|FE|CO|NI|CU|ZN'  # same metals as scalene-triangle/libs/get_metals.py
+
+# vectors v are searched up to this norm. Longer cutoffs fall back to the bounding boxes
+MAX_NORM = 10.0
+
+# box coordinates are stored as float32 rounded to three decimals
+TOLERANCE = 1e-3
+
+SUMMARY = dtype([
+    ('code', 'U4'),
+    ('chain', 'U4'),
+    ('met', 'i4'),
+    ('phe', 'i4'),
+    ('tyr', 'i4'),
+    ('trp', 'i4'),
+    ('metals', 'i4'),
+    ('ec', 'U32'),
+    ('min_norm', 'f8'),
+    ('min_norm_inter', 'f8'),
+    ('met_min', 'f4', (3,)),
+    ('met_max', 'f4', (3,)),
+    ('aro_min', 'f4', (3,)),
+    ('aro_max', 'f4', (3,))
+])
+
+
+def count_residues(atoms, resname):
+    # number of distinct residues of a type, i.e. the number of MET
+    selected = atoms[atoms['resname'] == resname.encode()]
+    return len(unique(selected[['resseq', 'icode']])) if len(selected) else 0
+
+
+def bounding_box(atoms):
+    # (min corner, max corner) of the atoms or NaN corners if there are none
+    if not len(atoms):
+        return full(3, nan), full(3, nan)
+    return atoms['xyz'].min(axis=0), atoms['xyz'].max(axis=0)
+
+
+def box_distance(min_a, max_a, min_b, max_b):
+    # the shortest distance between any point in box a and any point in box b
+    return norm(maximum(0.0, maximum(min_a - max_b, min_b - max_a)))
+
+
+def boxes_within(rows, cutoff):
+    # True if the Met box of any row is within cutoff of the aromatic box of any row
+    for met in rows:
+        if isnan(met['met_min']).any():
+            continue
+        for ring in rows:
+            if isnan(ring['aro_min']).any():
+                continue
+            if box_distance(met['met_min'], met['met_max'], ring['aro_min'], ring['aro_max']) <= cutoff + TOLERANCE:
+                return True
+    return False
+
+
+def shortest_vectors(code, atoms, ec=None):
+    # (Met chain, aromatic chain) -> norm of the shortest vector v up to MAX_NORM
+    ma = MetAromatic(code, chain='all', cutoff=MAX_NORM, angle=360.0, inter_chain=True, parsed=(atoms, ec))
+    shortest = {}
+    for row in ma.met_aromatic():
+        key = (row[8], row[7])
+        shortest[key] = min(shortest.get(key, inf), row[4])
+    return shortest
+
+
+def summarize(code, atoms, ec=None):
+    """
+    Function for summarizing the chains of a structure
+    Parameters:
+        code  -> the pdb code of the structure
+        atoms -> structured array of dtype ATOM_TABLE, i.e. from parse_pdb() or AtomStore.get()
+        ec    -> the EC classifier of the structure, or None
+    Returns:
+        A structured array of dtype SUMMARY with one row per chain. A structure
+        without any atoms gets a single row with an empty chain and no residues.
+    """
+    chains = sorted(set(text(atoms['chain']))) or ['']
+    shortest = shortest_vectors(code, atoms, ec)
+    rows = empty(len(chains), dtype=SUMMARY)
+    for row, chain in zip(rows, chains):
+        in_chain = atoms[atoms['chain'] == chain.encode()]
+        residues = in_chain[in_chain['record'] == b'ATOM']
+        hetatm = in_chain[in_chain['record'] == b'HETATM']
+
+        row['code'], row['chain'], row['ec'] = code.lower(), chain, ec or ''
+        for resname in ('MET',) + AROMATICS:
+            row[resname.lower()] = count_residues(residues, resname)
+        row['metals'] = sum(1 for name in text(hetatm['name']) if search(METALS, name))
+        row['min_norm'] = shortest.get((chain, chain), inf)
+        row['min_norm_inter'] = min([v for (met, _), v in shortest.items() if met == chain] or [inf])
+
+        sulfurs = residues[(residues['resname'] == b'MET') & (residues['name'] == b'SD')]
+        rings = residues[isin(residues['resname'], [r.encode() for r in AROMATICS]) &
+                         isin(residues['name'], [name.encode() for name in RING_ATOMS])]
+        row['met_min'], row['met_max'] = bounding_box(sulfurs)
+        row['aro_min'], row['aro_max'] = bounding_box(rings)
+    return rows
+
+
+class Summary:
+    def __init__(self, filepath):
+        """Initialize a Summary object over a summary index file
+
+        Parameters
+        ----------
+        filepath : path to the .npy file of the index
+            The index is empty if the file does not exist yet.
+
+        Examples
+        --------
+        >>> summary = Summary('/data/summary.npy')
+        >>> if summary.can_pair('1rcy', chain='A', cutoff=6.0):
+        ...     ma = MetAromatic('1rcy', chain='A', cutoff=6.0)
+
+        """
+        self.filepath = filepath
+        self.rows = load(filepath) if path.exists(filepath) else empty(0, dtype=SUMMARY)
+        self.pending = []
+        self.pending_codes = set()
+
+    def __len__(self):
+        return len(unique(self.rows['code']))
+
+    def __contains__(self, code):
+        return len(self.lookup(code)) > 0
+
+    def lookup(self, code, chain='ALL'):
+        # the rows of a code, optionally of a single chain only
+        code = code.lower()
+        rows = self.rows[searchsorted(self.rows['code'], code, 'left'):searchsorted(self.rows['code'], code, 'right')]
+        if chain.upper() == 'ALL':
+            return rows
+        return rows[rows['chain'] == chain.upper()]
+
+    def add(self, code, atoms, ec=None):
+        if (code not in self) and (code.lower() not in self.pending_codes):
+            self.add_rows(code, summarize(code, atoms, ec))
+
+    def add_rows(self, code, rows):
+        # rows from summarize(), i.e. computed in a worker process, are buffered until save()
+        if (code not in self) and (code.lower() not in self.pending_codes):
+            self.pending.append(rows)
+            self.pending_codes.add(code.lower())
+
+    def save(self):
+        if self.pending:
+            self.rows = concatenate([self.rows] + self.pending)
+            self.rows.sort(order=['code', 'chain'])
+            self.pending, self.pending_codes = [], set()
+        with open(self.filepath + '.part', 'wb') as f:
+            save(f, self.rows)
+        replace(self.filepath + '.part', self.filepath)
+
+    def can_pair(self, code, chain='A', cutoff=6.0, inter_chain=False, aromatics=AROMATICS, min_aromatics=1,
+                 metals=False):
+        """
+        Returns False only if the summary proves that an entry cannot produce
+        a result. Entries missing from the summary are never skipped.
+
+        Parameters
+        ----------
+        code : the pdb code of interest
+        chain : the chain of interest or 'all'
+        cutoff : the Met-aromatic cutoff in Angstroms
+        inter_chain : also pair Met / aromatic residues across chains. Requires chain 'all'.
+        aromatics : the aromatic residues that count towards min_aromatics
+        min_aromatics : the number of aromatic residues needed, i.e. 2 for a bridge
+        metals : also require a metal in the chain
+
+        Examples
+        --------
+        >>> summary = Summary('/data/summary.npy')
+        >>> codes = [c for c in codes if summary.can_pair(c, chain='A', min_aromatics=2, metals=True)]
+
+        """
+        if code not in self:
+            return True
+
+        # inter-chain pairs pool the residues of all chains, otherwise each chain stands on its own
+        rows = self.lookup(code, chain)
+        groups = [rows] if inter_chain else [rows[i:i + 1] for i in range(len(rows))]
+
+        for group in groups:
+            if sum(group[resname.lower()].sum() for resname in aromatics) < min_aromatics:
+                continue
+            if metals and (group['metals'].sum() < 1):
+                continue
+            if cutoff <= MAX_NORM:
+                if (group['min_norm_inter' if inter_chain else 'min_norm'] <= cutoff).any():
+                    return True
+            elif boxes_within(group, cutoff):
+                return True
+        return False
+
+
+def write_codes(summary, codes, filepath, **kwargs):
+    """
+    Function for writing the codes that can produce a result to a text file,
+    i.e. a delim.txt for scalene-triangle/scalene_main.py
+    Parameters:
+        summary  -> a Summary
+        codes    -> an iterable of pdb codes
+        filepath -> path to the text file
+        kwargs   -> passed to Summary.can_pair()
+    Returns:
+        The number of codes written
+    """
+    selected = [code for code in codes if summary.can_pair(code, **kwargs)]
+    with open(filepath, 'w') as f:
+        f.write(''.join('{}\n'.format(code) for code in selected))
+    return len(selected)
@@ -6,17 +6,28 @@
 # ----------------------------------------------------------------------------
 
 from numpy import sin, cos, pi
-from numpy import degrees
+from numpy import degrees, radians
 from numpy import linalg
 from numpy import cross
 from numpy import matmul
-from numpy import matrix
 from numpy import arccos
 from numpy import eye
 from numpy import dot
+from numpy import einsum
+from numpy import newaxis
+from numpy import nonzero
+from numpy import floor, ceil
+from numpy import int64
+from numpy import argsort, lexsort, searchsorted
+from numpy import repeat, cumsum, arange, concatenate
+from numpy import stack
+from numpy import array
+from numpy import zeros
+from itertools import product
 
 SCAL1 = sin(pi / 2)
 SCAL2 = 1 - cos(pi / 2)
+COS_TOLERANCE = 1e-9  # slack on cosine thresholds such that no pair is rejected due to rounding
 
 
 def vector_angle(u, v):
@@ -26,11 +37,58 @@ def vector_angle(u, v):
     return degrees(arccos(num / den))
 
 
+def batch_vector_angle(u, v):
+    # a routine for computing angles between two stacks of vectors row by row
+    num = einsum('ij,ij->i', u, v)
+    den = linalg.norm(v, axis=1) * linalg.norm(u, axis=1)
+    return degrees(arccos(num / den))
+
+
 def unit_vec(v):
     # get the unit vector of a vector
     return v / linalg.norm(v)
 
 
+def batch_unit_vec(v):
+    # get the unit vectors of a stack of vectors row by row
+    return v / linalg.norm(v, axis=1)[:, newaxis]
+
+
+def batch_lone_pairs(terminal_a, midpoint, terminal_b, model='cp'):
+    """
+    Function for computing the vectors parallel to the MET SD lone pairs of all
+    methionines in a structure at once
+    Parameters:
+        terminal_a, midpoint, terminal_b -> (n_met, 3) arrays of CG, SD and CE coordinates
+        model -> cp (Cross Product) or rm (Rodrigues' method)
+    Returns:
+        An (n_met, 2, 3) array. vectors_a are at [:, 0] and vectors_g are at [:, 1]
+    """
+    if model == 'cp':
+        # same as LonePairs - note that cross(v, u) = -cross(u, v)
+        u = terminal_a - midpoint
+        v = terminal_b - midpoint
+        not_vec = batch_unit_vec(-0.5 * (batch_unit_vec(v) + batch_unit_vec(u)))
+        cross_vec = 2**0.5 * batch_unit_vec(cross(u, v))
+        vectors_a = not_vec + cross_vec
+        vectors_g = not_vec - cross_vec
+        return stack((vectors_a, vectors_g), axis=1)
+
+    # same as RodriguesMethod - rotate the flipped vectors -v, -u by 90 degrees about r
+    vectors = stack((midpoint - terminal_b, midpoint - terminal_a), axis=1)
+    r_hat = batch_unit_vec(0.5 * vectors.sum(axis=1))
+
+    # one skew matrix W per methionine
+    W = zeros((len(r_hat), 3, 3))
+    W[:, 0, 1], W[:, 0, 2] = -r_hat[:, 2], r_hat[:, 1]
+    W[:, 1, 0], W[:, 1, 2] = r_hat[:, 2], -r_hat[:, 0]
+    W[:, 2, 0], W[:, 2, 1] = -r_hat[:, 1], r_hat[:, 0]
+
+    # then one Rodrigues rotation matrix per methionine
+    R = eye(3) + (SCAL1 * W) + (SCAL2 * einsum('nij,njk->nik', W, W))
+    return einsum('nij,nkj->nki', R, vectors)
+
+
 def get_hexagon_midpoints(x, y, z):
     """
     Function for computing midpoints between vertices in a hexagon
@@ -53,6 +111,146 @@ def get_hexagon_midpoints(x, y, z):
     return x_mid, y_mid, z_mid
 
 
+def met_aromatic_kernel(sd, vectors_a, vectors_g, midpoints, cutoff, angle, index=None, counts=None):
+    """
+    Function for applying the distance and angular conditions to all Met SD /
+    aromatic midpoint pairs in a structure at once
+    Parameters:
+        sd                   -> (n_met, 3) array of Met SD coordinates
+        vectors_a, vectors_g -> (n_met, 3) arrays of lone pair vectors a and g
+        midpoints            -> (n_midpoint, 3) array of hexagon midpoint coordinates
+        cutoff, angle        -> the distance and angular conditions
+        index                -> optional CellList built over midpoints
+        counts               -> optional dict receiving the number of candidate pairs visited
+    Returns:
+        idx_met, idx_midpoint, norm_v, met_theta, met_phi -> arrays describing the
+        pairs that satisfy both conditions, ordered by Met then by midpoint
+    """
+
+    if index is None:
+        # (n_met, n_midpoint, 3) tensor of vectors v mapped to origin of SD
+        vectors_v = midpoints[newaxis, :, :] - sd[:, newaxis, :]
+        norms_v = linalg.norm(vectors_v, axis=2)
+        idx_met, idx_midpoint = nonzero(norms_v <= cutoff)
+        candidates = norms_v.size
+        vectors_v = vectors_v[idx_met, idx_midpoint]
+        norms_v = norms_v[idx_met, idx_midpoint]
+    else:
+        # only visit midpoints lying in cells near each SD
+        idx_met, idx_midpoint = index.candidate_pairs(sd, cutoff)
+        candidates = len(idx_met)
+        vectors_v = midpoints[idx_midpoint] - sd[idx_met]
+        norms_v = linalg.norm(vectors_v, axis=1)
+        mask = norms_v <= cutoff
+        idx_met, idx_midpoint = idx_met[mask], idx_midpoint[mask]
+        vectors_v, norms_v = vectors_v[mask], norms_v[mask]
+
+    if counts is not None:
+        counts['candidate_pairs'] = counts.get('candidate_pairs', 0) + candidates
+
+    # angular condition in cosine space first - theta <= angle if cos(theta) >= cos(angle)
+    # angles are at most 180 degrees so any angle >= 180 accepts all pairs
+    cos_theta = einsum('ij,ij->i', vectors_v, vectors_a[idx_met]) / (linalg.norm(vectors_a, axis=1)[idx_met] * norms_v)
+    cos_phi = einsum('ij,ij->i', vectors_v, vectors_g[idx_met]) / (linalg.norm(vectors_g, axis=1)[idx_met] * norms_v)
+    threshold = cos(radians(min(angle, 180.0))) - COS_TOLERANCE
+    mask = (cos_theta >= threshold) | (cos_phi >= threshold)
+    idx_met, idx_midpoint, norms_v = idx_met[mask], idx_midpoint[mask], norms_v[mask]
+
+    # then compute degrees only for the pairs that pass and confirm the condition exactly
+    met_theta = degrees(arccos(cos_theta[mask]))
+    met_phi = degrees(arccos(cos_phi[mask]))
+    mask = (met_theta <= angle) | (met_phi <= angle)
+
+    return idx_met[mask], idx_midpoint[mask], norms_v[mask], met_theta[mask], met_phi[mask]
+
+
+def batch_hexagon_midpoints(xyz, groups):
+    """
+    Function for computing midpoints between vertices in many hexagons at once
+    Parameters:
+        xyz    -> (n, 3) array of hexagon coordinates, ordered around each hexagon
+        groups -> (n,) array of hexagon ids, equal ids must be contiguous
+    Returns:
+        midpoints -> (n, 3) array of midpoints between each vertex and the next
+    """
+
+    if not len(groups):
+        return xyz.copy()
+
+    # index of the next vertex, wrapping around to the first vertex in each hexagon
+    first = concatenate([[True], groups[1:] != groups[:-1]])
+    starts = nonzero(first)[0]
+    following = arange(1, len(groups) + 1)
+    following[concatenate([starts[1:], [len(groups)]]) - 1] = starts
+
+    return 0.5 * (xyz + xyz[following])
+
+
+class CellList:
+    """
+    A uniform grid of cubic cells used as a spatial index over a set of points
+    (here the aromatic hexagon midpoints). The points are binned once into cells
+    of length cell_size and sorted by cell. A query then only visits the cells
+    that lie within reach of the cutoff. The reach is computed per query so the
+    same index can be reused if the cutoff changes, although queries are fastest
+    when the cutoff is close to cell_size.
+    """
+    def __init__(self, points, cell_size):
+        self.points = points
+        self.cell_size = float(cell_size)
+
+        cells = floor(points / self.cell_size).astype(int64)
+        self.lower = cells.min(axis=0)
+        self.upper = cells.max(axis=0)
+
+        # sort points by the flat key of the cell they fall into
+        keys = self._keys(cells)
+        self.order = argsort(keys, kind='mergesort')
+        self.keys = keys[self.order]
+
+    def _keys(self, cells):
+        # map cell coordinates to a flat key
+        shape = self.upper - self.lower + 1
+        shifted = cells - self.lower
+        return (shifted[:, 0] * shape[1] + shifted[:, 1]) * shape[2] + shifted[:, 2]
+
+    def candidate_pairs(self, queries, cutoff):
+        """
+        Get all (query, point) pairs where the point lies in a cell within reach
+        of the cutoff. This is a superset of the pairs within the cutoff.
+        Parameters:
+            queries -> (n_query, 3) array of coordinates
+            cutoff  -> the search radius
+        Returns:
+            idx_query, idx_point -> index arrays ordered by query then by point
+        """
+        reach = int(ceil(cutoff / self.cell_size))
+        cells = floor(queries / self.cell_size).astype(int64)
+
+        idx_query, idx_point = [], []
+        for offset in product(range(-reach, reach + 1), repeat=3):
+            neighbours = cells + offset
+            inside = ((neighbours >= self.lower) & (neighbours <= self.upper)).all(axis=1)
+            rows = nonzero(inside)[0]
+
+            # each neighbouring cell is a contiguous run in the sorted keys
+            keys = self._keys(neighbours[rows])
+            start = searchsorted(self.keys, keys, side='left')
+            counts = searchsorted(self.keys, keys, side='right') - start
+
+            idx_query.append(repeat(rows, counts))
+            idx_point.append(self.order[repeat(start - cumsum(counts) + counts, counts) + arange(counts.sum())])
+
+        idx_query = concatenate(idx_query)
+        idx_point = concatenate(idx_point)
+        ordering = lexsort((idx_point, idx_query))
+        return idx_query[ordering], idx_point[ordering]
+
+    def query(self, point, cutoff):
+        # get indices of all candidate points near a single coordinate
+        return self.candidate_pairs(point.reshape(1, 3), cutoff)[1]
+
+
 class RodriguesMethod:
     """
     Here I use Rodrigues' rotation formula for completing the vertices
@@ -87,21 +285,21 @@ class RodriguesMethod:
         r_hat_z = r_hat[2]
         
         # get the W matrix
-        W = matrix([[0, -r_hat_z, r_hat_y],
-                    [r_hat_z, 0, -r_hat_x],
-                    [-r_hat_y, r_hat_x, 0]])
+        W = array([[0, -r_hat_z, r_hat_y],
+                   [r_hat_z, 0, -r_hat_x],
+                   [-r_hat_y, r_hat_x, 0]])
                        
         # then construct Rodrigues rotation matrix
-        self.R = matrix(eye(3)) + (SCAL1 * W) + (SCAL2 * matmul(W, W))
+        self.R = eye(3) + (SCAL1 * W) + (SCAL2 * matmul(W, W))
     
     # note that I flipped these methods to match previous algorithm
     def vector_g(self):
         # get vector g - first vertex
-        return matmul(self.R, self.vec_u).tolist()[0]
+        return matmul(self.R, self.vec_u)
 
     def vector_a(self):
         # get vector v - second vertex
-        return matmul(self.R, self.vec_v).tolist()[0]
+        return matmul(self.R, self.vec_v)
 
 
 class LonePairs:
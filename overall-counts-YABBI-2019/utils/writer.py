@@ -0,0 +1,97 @@
+# Written by David Weber
+# dsw7@sfu.ca
+
+"""
+In this short namespace I house a class that buffers Met-aromatic documents
+and writes them to MongoDB in large unordered bulk operations instead of one
+round trip per PDB code.
+"""
+
+# ------------------------------------------------------------------------------
+
+from pymongo import ReplaceOne
+from time import time
+from datetime import datetime, timezone
+
+
+class BulkWriter:
+    def __init__(self, collection, batch_size=1000, flush_interval=5.0):
+        """Initialize a BulkWriter object over a MongoDB collection
+
+        Parameters
+        ----------
+        collection : a pymongo Collection
+        batch_size : flush once this many documents are buffered
+        flush_interval : flush once this many seconds passed since the last flush
+
+        Notes
+        -----
+        Documents are upserted on their md5 _id so rewriting a code that is
+        already in the collection replaces its documents rather than raising
+        a duplicate key error. The bulk write is unordered so one bad document
+        does not abort the rest of the batch. Every document is stamped with
+        the UTC time of the write in an "inserted" field which analyze.py uses to
+        find codes that changed since its last run.
+
+        Examples
+        --------
+        >>> writer = BulkWriter(MongoClient()['ma']['ma'])
+        >>> writer.add(mapper(results, '1rcy'), '1rcy')
+        >>> writer.flush()
+
+        """
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.tags = []
+        self.last_flush = time()
+
+    def add(self, documents, tag=None):
+        """
+        Buffers documents and flushes if either threshold was reached. The
+        call blocks for the duration of the flush which throttles callers
+        that produce documents faster than the database accepts them.
+
+        Parameters
+        ----------
+        documents : a list of documents from mapper()
+        tag : an optional label for the documents, i.e. the pdb code
+
+        Returns
+        -------
+        The tags of all documents written to the database by this call.
+
+        """
+        self.buffer.extend(documents)
+        if tag is not None:
+            self.tags.append(tag)
+
+        if (len(self.buffer) >= self.batch_size) or (time() - self.last_flush >= self.flush_interval):
+            return self.flush()
+        return []
+
+    def flush(self):
+        """
+        Writes all buffered documents to the database.
+
+        Returns
+        -------
+        The tags of all documents written to the database by this call.
+
+        """
+        if self.buffer:
+            inserted = datetime.now(timezone.utc)
+            for doc in self.buffer:
+                doc['inserted'] = inserted
+            self.write(self.buffer)
+
+        written = self.tags
+        self.buffer, self.tags = [], []
+        self.last_flush = time()
+        return written
+
+    def write(self, documents):
+        # a single unordered bulk upsert of all buffered documents
+        requests = [ReplaceOne({'_id': doc['_id']}, doc, upsert=True) for doc in documents]
+        self.collection.bulk_write(requests, ordered=False)
@@ -9,9 +9,19 @@ pat = 'SC|TI|V|CR|MN|FE|CO|NI|CU|ZN'
                          # jeff didn't want this
 
 
-def get_metals(path_to_pdb_file, chain='A'):
+def get_metals(path_to_pdb_file, chain='A', atoms=None):
     """ Function extracts metal coordinates from PDB file. """
 
+    # a pre-parsed atom table (i.e. from an AtomStore) is read instead of the file if passed
+    # rows keep the column positions of split lines up to the coordinates. Only the first model is read
+    if atoms is not None:
+        hetatm = atoms[(atoms['record'] == 'HETATM') & (atoms['chain'] == chain)]
+        return [
+            ['HETATM', str(a['serial']), str(a['name']), str(a['resname']), str(a['chain']), str(a['resseq']) + a['icode']] +
+            ['{:.3f}'.format(c) for c in a['xyz']]
+            for a in hetatm if search(pat, a['name'])
+        ]
+
     # open the PDB file which should be in pwd
     with open(path_to_pdb_file) as f: data = f.readlines()
 
@@ -124,6 +124,10 @@ def met_aromatic(filepath, CHAIN, CUTOFF=6.0, ANGLE=109.5, MODEL='cp'):
             
     RESULT = []
     
+    # bin midpoints into a spatial index such that each SD only visits nearby midpoints
+    if MIDPOINTS:
+        INDEX = CellList(array([row[2] for row in MIDPOINTS]), max(CUTOFF, 1.0))
+    
     # apply distance then angular conditions 
     for key, grouped_met in groupby(DATA_MET, lambda x: x[5]):
         # guarantees the order of methionine data
@@ -143,7 +147,10 @@ def met_aromatic(filepath, CHAIN, CUTOFF=6.0, ANGLE=109.5, MODEL='cp'):
         VEC_A = object_lonepairs.vector_a()
         VEC_G = object_lonepairs.vector_g()      
         
-        for row in MIDPOINTS:
+        NEAR = INDEX.query(SD, CUTOFF) if MIDPOINTS else []
+        
+        for idx in NEAR:
+            row = MIDPOINTS[idx]
             VEC_V = row[2] - SD  # mapping to origin of SD
             NORM = norm(VEC_V)
             if NORM <= CUTOFF:  # distance condition           
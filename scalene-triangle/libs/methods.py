@@ -14,6 +14,12 @@ from numpy import matrix
 from numpy import arccos
 from numpy import eye
 from numpy import dot
+from numpy import nonzero
+from numpy import floor, ceil
+from numpy import int64
+from numpy import argsort, lexsort, searchsorted
+from numpy import repeat, cumsum, arange, concatenate
+from itertools import product
 
 SCAL1 = sin(pi / 2)
 SCAL2 = 1 - cos(pi / 2)
@@ -49,6 +55,70 @@ def get_hexagon_midpoints(x, y, z):
     
     return x_mid, y_mid, z_mid
 
+class CellList:
+    """
+    A uniform grid of cubic cells used as a spatial index over a set of points
+    (here the aromatic hexagon midpoints). The points are binned once into cells
+    of length cell_size and sorted by cell. A query then only visits the cells
+    that lie within reach of the cutoff. The reach is computed per query so the
+    same index can be reused if the cutoff changes, although queries are fastest
+    when the cutoff is close to cell_size.
+    """
+    def __init__(self, points, cell_size):
+        self.points = points
+        self.cell_size = float(cell_size)
+
+        cells = floor(points / self.cell_size).astype(int64)
+        self.lower = cells.min(axis=0)
+        self.upper = cells.max(axis=0)
+
+        # sort points by the flat key of the cell they fall into
+        keys = self._keys(cells)
+        self.order = argsort(keys, kind='mergesort')
+        self.keys = keys[self.order]
+
+    def _keys(self, cells):
+        # map cell coordinates to a flat key
+        shape = self.upper - self.lower + 1
+        shifted = cells - self.lower
+        return (shifted[:, 0] * shape[1] + shifted[:, 1]) * shape[2] + shifted[:, 2]
+
+    def candidate_pairs(self, queries, cutoff):
+        """
+        Get all (query, point) pairs where the point lies in a cell within reach
+        of the cutoff. This is a superset of the pairs within the cutoff.
+        Parameters:
+            queries -> (n_query, 3) array of coordinates
+            cutoff  -> the search radius
+        Returns:
+            idx_query, idx_point -> index arrays ordered by query then by point
+        """
+        reach = int(ceil(cutoff / self.cell_size))
+        cells = floor(queries / self.cell_size).astype(int64)
+
+        idx_query, idx_point = [], []
+        for offset in product(range(-reach, reach + 1), repeat=3):
+            neighbours = cells + offset
+            inside = ((neighbours >= self.lower) & (neighbours <= self.upper)).all(axis=1)
+            rows = nonzero(inside)[0]
+
+            # each neighbouring cell is a contiguous run in the sorted keys
+            keys = self._keys(neighbours[rows])
+            start = searchsorted(self.keys, keys, side='left')
+            counts = searchsorted(self.keys, keys, side='right') - start
+
+            idx_query.append(repeat(rows, counts))
+            idx_point.append(self.order[repeat(start - cumsum(counts) + counts, counts) + arange(counts.sum())])
+
+        idx_query = concatenate(idx_query)
+        idx_point = concatenate(idx_point)
+        ordering = lexsort((idx_point, idx_query))
+        return idx_query[ordering], idx_point[ordering]
+
+    def query(self, point, cutoff):
+        # get indices of all candidate points near a single coordinate
+        return self.candidate_pairs(point.reshape(1, 3), cutoff)[1]
+
 class RodriguesMethod:
     """
     Here I use Rodrigues' rotation formula for completing the vertices
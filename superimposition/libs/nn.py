@@ -12,6 +12,7 @@ from itertools    import groupby
 from re           import search
 from numpy.linalg import norm
 from numpy        import array
+from numpy        import around
 
 IDX_ATOM = 0
 IDX_CHAIN = 4
@@ -26,16 +27,55 @@ def groupby_to_midpoint(nested_list):
     v2 = array(nested_list[1][6:9]).astype(float)
     return (nested_list[0][3] + nested_list[0][5], 0.5 * (v1 + v2))
 
-def get_nn(filepath, cutoff, chain='A'):
+def atoms_to_midpoints(atoms, chain):
+    # atom table -> the same tuples of res/pos, midpoint that get_nn() builds from text
+    # altloc atoms are skipped as the whitespace split in get_nn() never matches them
+    selected = atoms[(atoms['record'] == b'ATOM') & (atoms['chain'] == chain.encode()) & (atoms['altloc'] == b'')]
+    midpoints = []
+    for resname, pattern in (('TYR', ATOMS_TYR), ('TRP', ATOMS_TRP)):
+        residues = {}
+        for atom in selected[selected['resname'] == resname.encode()]:
+            if search(pattern, atom['name'].decode()) != None:
+                xyz = around(atom['xyz'].astype(float), 3)  # float32 -> the values written in the file
+                residues.setdefault(str(atom['resseq']) + atom['icode'].decode(), []).append(xyz)
+        midpoints.extend((resname + pos, 0.5 * (xyz[0] + xyz[1])) for pos, xyz in sorted(residues.items()))
+    return midpoints
+
+def get_neighbors(mp_ALL, cutoff):
+    # iteratively get neighbors
+    neighbors = []
+    for i in mp_ALL:
+        for j in mp_ALL:
+            euclidean_dist = norm(i[1] - j[1])
+            if euclidean_dist == 0:
+                continue
+            elif euclidean_dist <= cutoff:
+                neighbors.append((i[0], j[0]))
+            else:
+                continue
+    
+    # sort neighbors
+    neighbors = [tuple(sorted(n)) for n in neighbors]
+    
+    # drop duplicates
+    return list(set(neighbors))
+
+def get_nn(filepath, cutoff, chain='A', atoms=None):
     """
     Function gets a set of Tyr/Trp nearest neighbors from a PDB entry
     Parameters:
         filepath -> path to the PDB file, .ent format
         cutoff   -> the maximum distance deemed neighboring
         chain    -> 'A', 'B', 'C', etc.
+        atoms    -> an optional pre-parsed atom table, i.e. from AtomStore.get()
+                    in overall-counts-YABBI-2019/utils/atomstore.py. If passed,
+                    filepath is not read.
     Returns:
         A list of neighboring Tyr/Trp residues
     """
+    if atoms is not None:
+        return get_neighbors(atoms_to_midpoints(atoms, chain), cutoff)
+
     with open(filepath, 'r') as f:
         data_incoming = f.readlines()
         
@@ -78,23 +118,4 @@ def get_nn(filepath, cutoff, chain='A'):
     
     # find nearest neighbours
     mp_ALL = mp_TYR + mp_TRP
-    
-    # iteratively get neighbors
-    neighbors = []
-    for i in mp_ALL:
-        for j in mp_ALL:
-            euclidean_dist = norm(i[1] - j[1])
-            if euclidean_dist == 0:
-                continue
-            elif euclidean_dist <= cutoff:
-                neighbors.append((i[0], j[0]))
-            else:
-                continue
-    
-    # sort neighbors
-    neighbors = [tuple(sorted(n)) for n in neighbors]
-    
-    # drop duplicates
-    neighbors = list(set(neighbors))
-    
-    return neighbors
+    return get_neighbors(mp_ALL, cutoff)
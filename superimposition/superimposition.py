@@ -49,6 +49,7 @@ Current results.txt:
 # --------------
 START = 0
 END   = -1  # set to -1 to iterate over entire PDB
+DELIM = None  # optional path to a list of codes that can produce a bridge - see below
 
 
 # PDB parameters
@@ -90,6 +91,18 @@ current_PDB_files_JSON       = get(url)
 current_PDB_files_pyDict     = loads(current_PDB_files_JSON.content)
 current_PDB_files_pyList     = current_PDB_files_pyDict.get('idList')
 current_PDB_files_entrycount = current_PDB_files_pyDict.get('resultCount')
+
+# skip entries that cannot produce a bridge according to a summary index built with
+# $ python ../overall-counts-YABBI-2019/convert.py --batch all_codes.txt --summary summary.npy
+#       --select delim.txt --chain A --cutoff 6.0 --min-aromatics 2
+# where all_codes.txt holds the same idList. Codes missing from delim.txt are not analyzed
+# -----------------------------------------------------------------------------------------
+if DELIM is not None:
+    with open(DELIM) as f:
+        selected = set(line.strip().upper() for line in f)
+    current_PDB_files_pyList     = [c for c in current_PDB_files_pyList if c.upper() in selected]
+    current_PDB_files_entrycount = len(current_PDB_files_pyList)
+
 if END == -1: END = current_PDB_files_entrycount
 
 